@@ -1,25 +1,32 @@
 import streamlit as st
 import pandas as pd
 import random
-from groq import Groq
 from datetime import datetime
 from io import BytesIO
 import re
 import os
 import base64
 
-# --- 0. SÉCURITÉ & DÉPENDANCES ---
-try:
-    from docx import Document
-except ImportError:
-    st.error("⚠️ ERREUR CRITIQUE : Le module 'python-docx' manque. Ajoutez-le au fichier requirements.txt")
-    st.stop()
-
-try:
-    from gtts import gTTS
-    HAS_AUDIO = True
-except ImportError:
-    HAS_AUDIO = False
+from functools import partial
+
+import ia_groq
+from audio_tts import HAS_AUDIO, get_lecteur_audio, lire_a_voix_haute
+from contexte_ia import compter_tokens, construire_contexte, nouvel_etat_resume
+from documents_eleves import get_extracteur, suivre_extraction
+from exports import export_session, version_liste
+from ia_groq import get_api_keys_list
+from pgi import (
+    HAS_OPENPYXL, LIGNES_PGI_PROMPT, MIME_XLSX, cle_pgi, export_xlsx_pgi, hash_pgi, nouvelle_graine,
+    numero_dossier, pgi_reproductible, rapport_compression, stats_xlsx, texte_pgi_prompt,
+)
+from requetes_pgi import formulaire_requete, index_pgi
+from sauvegarde import (
+    EXTENSION_SEANCE, ecrire_seance, empreinte, est_seance, lire_csv, lire_seance, messages_depuis_csv
+)
+from stockage_sessions import (
+    autosauvegarder, champ_code_reprise, get_magasin, identifiant_seance, seance_enregistree,
+)
+from suivi_executions import clore_tour, compter_execution, executions_dernier_tour
 
 # --- 1. CONFIGURATION DE LA PAGE ---
 PAGE_ICON = "logo_agora.png" if os.path.exists("logo_agora.png") else "🏢"
@@ -30,6 +37,7 @@ st.set_page_config(
     layout="wide",
     initial_sidebar_state="auto"
 )
+compter_execution("script")
 
 # --- 2. GESTION ÉTAT (SESSION STATE) ---
 if "messages" not in st.session_state:
@@ -40,14 +48,24 @@ if "current_context_doc" not in st.session_state:
     st.session_state.current_context_doc = None
 if "pgi_data" not in st.session_state:
     st.session_state.pgi_data = None
+if "pgi_jeu" not in st.session_state:
+    st.session_state.pgi_jeu = None  # (dossier, graine, taille) du PGI affiché
+if "etape_mission" not in st.session_state:
+    st.session_state.etape_mission = 0  # étapes validées dans la mission en cours
 if "bilan_ready" not in st.session_state:
     st.session_state.bilan_ready = None
+if "resume_contexte" not in st.session_state:
+    st.session_state.resume_contexte = nouvel_etat_resume()
+if "student_name" not in st.session_state:
+    st.session_state.student_name = ""
 
 # GAMIFICATION
 if "xp" not in st.session_state:
     st.session_state.xp = 0
 if "grade" not in st.session_state:
     st.session_state.grade = "👶 Stagiaire"
+if "xp_en_attente" not in st.session_state:
+    st.session_state.xp_en_attente = 0
 
 GRADES = {
     0: "👶 Stagiaire",
@@ -71,6 +89,11 @@ def update_xp(amount: int):
     else:
         st.toast(f"+{amount} XP", icon="⭐")
 
+def crediter_xp(amount: int):
+    # Depuis un rappel de widget : l'affichage (toast, ballons) est fait par
+    # le fragment des réglages à sa prochaine exécution
+    st.session_state.xp_en_attente += amount
+
 # --- 3. VARIABLES DE CONTEXTE ---
 
 VILLES_FRANCE = [
@@ -85,20 +108,6 @@ TYPES_ORGANISATIONS = [
     "Cabinet comptable", "Start-up numérique", "Centre culturel"
 ]
 
-NOMS = [
-    "Martin", "Bernard", "Thomas", "Lopez", "Nguyen",
-    "Diallo", "Moreau", "Khan", "Rodriguez", "Schneider",
-    "Diop", "Rossi", "Dubois", "Garcia", "Haddad",
-    "Kouyaté", "Kim", "Fernandes", "Popov", "Oumar"
-]
-
-PRENOMS = [
-    "Emma", "Gabriel", "Lina", "Yanis", "Aïcha",
-    "Noah", "Sara", "Hugo", "Maya", "Ethan",
-    "Inès", "Amir", "Chloé", "Diego", "Léa",
-    "Naomi", "Omar", "Sofia", "Jules", "Fatou"
-]
-
 # --- 4. OUTILS IMAGE ---
 def img_to_base64(img_path: str) -> str:
     if os.path.exists(img_path):
@@ -163,68 +172,58 @@ st.markdown(
 
 # --- 6. LOGIQUE API GROQ ---
 
-def get_api_keys_list():
-    if "groq_keys" in st.secrets:
-        return st.secrets["groq_keys"]
-    elif "GROQ_API_KEY" in st.secrets:
-        return [st.secrets["GROQ_API_KEY"]]
-    return []
+# On met le modèle léger en premier
+MODELES_IA = ["llama3-8b-8192", "mixtral-8x7b-32768", "llama-3.3-70b-versatile"]
 
-def query_groq_with_rotation(messages):
-    available_keys = get_api_keys_list()
-    if not available_keys:
+# Budgets de temps (s) pour toute la chaîne de repli clés / modèles
+BUDGET_TOUR = 25
+BUDGET_MISSION = 40
+BUDGET_BILAN = 60
+
+# Jetons envoyés à chaque tour de tuteur (historique résumé au-delà)
+BUDGET_CONTEXTE_TOUR = 4000
+
+# Relance parallèle du tour de tuteur (option à activer dans les secrets)
+RELANCE_PARALLELE = bool(st.secrets.get("relance_parallele", False))
+
+# Indicateurs techniques de la barre latérale (secret « debug » ou ?debug=1)
+MODE_DEBUG = bool(st.secrets.get("debug", False)) or st.query_params.get("debug") == "1"
+
+def _noter_rapport_ia(rapport):
+    st.session_state.dernier_appel_ia = rapport
+    # Cumul de séance : jetons de prompt servis depuis le cache ou recalculés
+    cumul = st.session_state.setdefault("tokens_prompt", {"caches": 0, "frais": 0})
+    cumul["caches"] += rapport.get("tokens_caches", 0)
+    cumul["frais"] += rapport.get("tokens_frais", 0)
+
+def query_groq_with_rotation(messages, budget=BUDGET_MISSION, on_position=None):
+    if not get_api_keys_list():
         st.error("Aucune clé Groq trouvée dans st.secrets.")
         return None, "ERREUR CONFIG"
+    rapport = {}
+    resp, model = ia_groq.query_groq_with_rotation(
+        messages, MODELES_IA, temperature=0.3, budget=budget, rapport=rapport,
+        on_position=on_position
+    )
+    _noter_rapport_ia(rapport)
+    return resp, model
 
-    keys = list(available_keys)
-    random.shuffle(keys)
-    
-    # --- MODIFICATION ICI : On met le modèle léger en premier ---
-    models = ["llama3-8b-8192", "mixtral-8x7b-32768", "llama-3.3-70b-versatile"]
-
-    for key in keys:
-        try:
-            client = Groq(api_key=key)
-            for model in models:
-                try:
-                    chat = client.chat.completions.create(
-                        messages=messages,
-                        model=model,
-                        temperature=0.3,
-                        max_tokens=1024,
-                    )
-                    return chat.choices[0].message.content, model
-                except Exception as e:
-                    # On passe au modèle suivant silencieusement
-                    continue
-        except Exception as e:
-            st.error(f"Erreur connexion Groq : {e}")
-            continue
-
-    return None, "SATURATION"
+def stream_groq_with_rotation(messages, budget=BUDGET_TOUR):
+    if not get_api_keys_list():
+        st.error("Aucune clé Groq trouvée dans st.secrets.")
+        return None, "ERREUR CONFIG"
+    rapport = {}
+    resp, model = ia_groq.stream_groq_to_chat(
+        messages, MODELES_IA, temperature=0.3, spinner_text="Analyse de ta réponse…",
+        budget=budget, rapport=rapport, hedging=RELANCE_PARALLELE
+    )
+    _noter_rapport_ia(rapport)
+    return resp, model
 
 # --- 7. OUTILS FICHIERS ---
 
-def extract_text_from_docx(file) -> str:
-    try:
-        doc = Document(file)
-        text = "\n".join([p.text for p in doc.paragraphs if p.text.strip()])
-        return text[:8000]
-    except Exception as e:
-        return f"ERREUR LECTURE DOCX : {e}"
-
-def extract_text_from_table_file(file) -> str:
-    try:
-        filename = getattr(file, "name", "").lower()
-        if filename.endswith(".csv"):
-            df = pd.read_csv(file)
-        else:
-            df = pd.read_excel(file)
-
-        text = df.to_string(index=False)
-        return text[:8000]
-    except Exception as e:
-        return f"ERREUR LECTURE TABLEUR : {e}"
+# Caractères lus dans un fichier élève (Word : paragraphes et tableaux)
+BUDGET_DOCUMENT = 8000
 
 def clean_text_for_audio(text: str) -> str:
     text = re.sub(r"[\*_]{1,3}", "", text)
@@ -373,137 +372,42 @@ AIDES_DOSSIERS = {
 }
 
 # --- 10. PGI PAR DOSSIER ---
+# Génération, empreinte et mise en texte compacte : voir pgi.py
+
+# Taille du PGI au lancement : celle du dossier, ou un jeu « grandeur
+# nature » pour les exercices de filtre et de tableau croisé
+TAILLES_PGI = {
+    "Standard (dossier)": None,
+    "100 lignes": 100,
+    "1 000 lignes": 1_000,
+    "10 000 lignes": 10_000,
+    "50 000 lignes": 50_000,
+}
 
-def generate_fake_pgi_data(dossier_name: str) -> pd.DataFrame:
-    rows = []
-
-    # --- PARTIE 1 ---
-
-    if "Dossier 1" in dossier_name:
-        postes = ["Accueil", "Comptabilité", "Direction", "Open space", "Salle de réunion"]
-        for p in postes:
-            rows.append({
-                "Zone": p,
-                "Nombre de postes": random.randint(1, 6),
-                "État": random.choice(["Adapté", "Saturé", "Sous-utilisé"]),
-                "Problème signalé": random.choice(
-                    ["Bruit", "Manque de rangements", "Éclairage insuffisant", "Aucun"]
-                ),
-                "Priorité": random.choice(["Haute", "Moyenne", "Basse"])
-            })
-
-    elif "Dossier 2" in dossier_name:
-        outils = ["Suite bureautique", "PGI comptable", "Messagerie", "Drive partagé", "Outil de visio"]
-        for o in outils:
-            rows.append({
-                "Outil": o,
-                "Service concerné": random.choice(["Comptabilité", "Accueil", "Direction"]),
-                "Nb utilisateurs": random.randint(2, 15),
-                "Problème": random.choice(["Aucun", "Droits insuffisants", "Connexion lente", "Formation à prévoir"]),
-                "Priorité": random.choice(["Urgent", "À planifier", "Information"])
-            })
-
-    elif "Dossier 3" in dossier_name:
-        ressources = ["Salle réunion A", "Salle réunion B", "Véhicule 1", "Véhicule 2", "Vidéoprojecteur"]
-        for r in ressources:
-            rows.append({
-                "Ressource": r,
-                "Type": random.choice(["Salle", "Véhicule", "Matériel"]),
-                "Taux d'utilisation": f"{random.randint(40, 100)} %",
-                "Conflits réserv.": random.randint(0, 5),
-                "Remarque": random.choice(["Souvent réservé", "Peu utilisé", "Réservation à structurer"])
-            })
-
-    elif "Dossier 4" in dossier_name:
-        infos = ["Consignes sécurité", "Planning mensuel", "Notes de service", "Procédure d’accueil"]
-        for i in infos:
-            rows.append({
-                "Information": i,
-                "Support actuel": random.choice(["Mail", "Affichage", "Intranet", "Oral uniquement"]),
-                "Public cible": random.choice(["Tous les salariés", "Service compta", "Direction"]),
-                "Fréquence": random.choice(["Ponctuelle", "Hebdomadaire", "Mensuelle"]),
-                "Problème": random.choice(["Non à jour", "Non lu", "Trop dispersé", "Aucun"])
-            })
-
-    # --- PARTIE 2 ---
-
-    elif "Dossier 5" in dossier_name:
-        actions = ["Teasing réseaux sociaux", "Animation point de vente", "Newsletter clients fidèles", "Formation vendeurs"]
-        for a in actions:
-            rows.append({
-                "Action": a,
-                "Responsable": random.choice(PRENOMS),
-                "Échéance": f"{random.randint(1, 28)}/09/2025",
-                "Statut": random.choice(["À faire", "En cours", "Terminé"]),
-                "Budget estimé": f"{random.randint(200, 2000)} €"
-            })
-
-    elif "Dossier 6" in dossier_name:
-        for i in range(4):
-            rows.append({
-                "Réunion": f"Réunion {i+1}",
-                "Objet": random.choice(["Préparation lancement", "Point qualité", "Réunion RH", "Sécurité"]),
-                "Date": f"{random.randint(1, 28)}/10/2025",
-                "Participants prévus": random.randint(3, 12),
-                "Compte rendu": random.choice(["Non rédigé", "En cours", "Diffusé"])
-            })
-
-    elif "Dossier 7" in dossier_name:
-        villes = ["Pegalajar", "Séville", "Madrid", "Barcelone"]
-        for _ in range(5):
-            rows.append({
-                "Salarié": f"{random.choice(PRENOMS)} {random.choice(NOMS)}",
-                "Destination": random.choice(villes),
-                "Motif": random.choice(["Visite oliveraie", "Visite usine", "Rencontre fournisseur", "Découverte culturelle"]),
-                "Transport": random.choice(["Voiture entreprise", "Train", "Avion"]),
-                "Hébergement": random.choice(["Hôtel", "Maison d’hôtes", "Appartement loué"]),
-                "Coût estimé": f"{random.randint(180, 650)} €"
-            })
-
-    # --- PARTIE 3 ---
-
-    elif "Dossier 8" in dossier_name:
-        postes = ["Commercial sédentaire", "Assistant commercial", "Chargé de clientèle"]
-        diplomes = ["Bac Pro AGOrA", "Bac STMG", "BTS NDRC", "BTS MCO"]
-        for _ in range(8):
-            rows.append({
-                "Candidat": f"{random.choice(PRENOMS)} {random.choice(NOMS)}",
-                "Poste visé": random.choice(postes),
-                "Diplôme principal": random.choice(diplomes),
-                "Expérience": f"{random.randint(0, 5)} an(s)",
-                "Motivation /5": random.randint(1, 5),
-                "Statut dossier": random.choice(["À étudier", "Retenu entretien", "Refusé"])
-            })
-
-    elif "Dossier 9" in dossier_name:
-        etapes = ["Préparation poste", "Création comptes informatiques", "Remise badge", "Présentation équipe", "Formation sécurité"]
-        for e in etapes:
-            rows.append({
-                "Étape d’intégration": e,
-                "Responsable": random.choice(["RH", "Manager", "Accueil"]),
-                "Moment": random.choice(["Avant arrivée", "Jour J", "Semaine 1"]),
-                "Statut": random.choice(["À faire", "En cours", "Terminé"]),
-                "Commentaire": random.choice(["Prioritaire", "Peut être délégué", "À vérifier"])
-            })
-
-    elif "Dossier 10" in dossier_name:
-        for _ in range(6):
-            rows.append({
-                "Salarié": f"{random.choice(PRENOMS)} {random.choice(NOMS)}",
-                "Type modif.": random.choice(["Adresse", "Contrat", "Fonction"]),
-                "Document reçu": random.choice(["Oui", "Non"]),
-                "Dossier à jour": random.choice(["Oui", "Non"]),
-                "Action à mener": random.choice(["Relancer salarié", "Archiver", "Mettre à jour PGI"])
-            })
+# Un grand PGI est affiché page par page : le navigateur ne reçoit jamais
+# plus de LIGNES_PAR_PAGE lignes, quelle que soit la taille du jeu
+LIGNES_PAR_PAGE = 100
 
-    else:
-        for _ in range(5):
-            rows.append({"Info": "Données fictives à définir pour ce dossier."})
+def charger_pgi(dossier, graine, taille=None):
+    # La table vient du cache partagé : seule la clé est propre à la session
+    st.session_state.pgi_jeu = {"dossier": dossier, "graine": graine, "taille": taille}
+    st.session_state.pgi_data = pgi_reproductible(dossier, graine, taille)
 
-    return pd.DataFrame(rows)
+def cle_pgi_session():
+    # PGI tiré d'une graine : sa clé suffit à l'identifier, pas besoin de le hacher
+    jeu = st.session_state.pgi_jeu
+    if jeu:
+        return cle_pgi(jeu["dossier"], jeu["graine"], jeu["taille"])
+    return hash_pgi(st.session_state.pgi_data)
+
+def lire_graine(texte: str):
+    texte = (texte or "").strip()
+    return int(texte) if texte.isdigit() else None
 
 # --- 11. DIFFÉRENCIATION & PROMPTS IA ---
 
+PROFILS_ELEVE = ["Accompagnement renforcé", "Standard", "Autonome"]
+
 def build_differentiation_instruction(profil: str) -> str:
     if profil == "Accompagnement renforcé":
         return """
@@ -563,19 +467,24 @@ INITIAL_MESSAGE = """
 if not st.session_state.messages:
     st.session_state.messages.append({"role": "assistant", "content": INITIAL_MESSAGE})
 
-def lancer_mission(prenom: str, profil: str):
-    lieu = random.choice(TYPES_ORGANISATIONS)
-    ville = random.choice(VILLES_FRANCE)
-
-    theme = st.session_state.theme
-    dossier = st.session_state.dossier
-    competence = DB_OFFICIELLE[theme][dossier]
-
-    st.session_state.pgi_data = generate_fake_pgi_data(dossier)
-    st.session_state.messages = []
+CONSIGNE_TOUR = """
+À CHAQUE RÉPONSE DE L'ÉLÈVE :
+1. Vérifie si l'élève exploite vraiment les données PGI ou le contexte du dossier.
+2. Si c'est pertinent, valide un point précis, explique pourquoi c'est bien, puis propose la prochaine étape.
+3. Si c'est incomplet ou hors sujet, explique ce qui manque en phrases courtes et donne une consigne guidée.
+4. Si tu proposes un tableau, rappelle clairement qu'il s'agit d'un tableau de synthèse/comparatif différent du PGI.
+5. Réponds avec des blocs courts et/ou listes à puces (pas de gros pavé).
+"""
 
-    pgi_txt = st.session_state.pgi_data.to_string() if st.session_state.pgi_data is not None else "Aucune donnée."
-    diff_instr = build_differentiation_instruction(profil)
+@st.cache_data(max_entries=256, show_spinner=False)
+def construire_prefixe(dossier: str, theme: str, profil: str, pgi_hash: str, _pgi_data, etape=0) -> str:
+    # Partie stable du prompt, placée en tête et identique octet pour octet
+    # d'un tour à l'autre : le cache de préfixes du fournisseur s'applique.
+    # Mémorisée par (dossier, partie, profil, empreinte du PGI, étape) ; un
+    # grand PGI y figure en résumé + échantillon, renouvelé à chaque étape.
+    pgi_txt = "Aucune donnée."
+    if _pgi_data is not None:
+        pgi_txt = texte_pgi_prompt(_pgi_data, pgi_hash, etape)
     aide = AIDES_DOSSIERS.get(dossier, None)
 
     aide_txt = ""
@@ -588,20 +497,39 @@ RÉSUMÉ ENSEIGNANT (contexte dossier):
 - Productions habituelles : {aide['types_production']}
 """
 
-    prompt = f"""
-{diff_instr}
+    return f"""{SYSTEM_PROMPT}
+{build_differentiation_instruction(profil)}
 
 DOSSIER : {dossier}
 PARTIE : {theme}
-
+COMPÉTENCE VISÉE : {DB_OFFICIELLE[theme][dossier]}
 {aide_txt}
+DONNÉES PGI (fictives à utiliser comme base) :
+{pgi_txt}
+{CONSIGNE_TOUR}"""
+
+def prefixe_courant(profil: str) -> str:
+    return construire_prefixe(
+        st.session_state.dossier, st.session_state.theme, profil,
+        cle_pgi_session(), st.session_state.pgi_data, st.session_state.etape_mission
+    )
+
+def lancer_mission(prenom: str, profil: str):
+    lieu = random.choice(TYPES_ORGANISATIONS)
+    ville = random.choice(VILLES_FRANCE)
+
+    dossier = st.session_state.dossier
 
+    graine = lire_graine(st.session_state.graine_pgi) or nouvelle_graine()
+    charger_pgi(dossier, graine, TAILLES_PGI[st.session_state.taille_pgi])
+    st.session_state.etape_mission = 0
+    st.session_state.messages = []
+
+    # Partie variable en dernier, après le préfixe stable
+    prompt = f"""
+LANCEMENT DE LA MISSION
 LIEU FICTIF : {lieu} à {ville}.
 ÉLÈVE : {prenom} (Première Bac Pro AGOrA).
-COMPÉTENCE VISÉE : {competence}
-
-DONNÉES PGI (fictives à utiliser comme base) :
-{pgi_txt}
 
 ACTION ATTENDUE :
 1. Présente le contexte en 3 à 4 puces maximum.
@@ -610,13 +538,17 @@ ACTION ATTENDUE :
 4. Si tu demandes un tableau, précise qu’il doit être différent du PGI (tableau de synthèse ou comparatif).
 """
 
-    msgs = [{"role": "system", "content": SYSTEM_PROMPT},
+    msgs = [{"role": "system", "content": prefixe_courant(profil)},
             {"role": "user", "content": prompt}]
+    file_attente = st.empty()
     with st.spinner("Chargement du dossier..."):
-        resp, _ = query_groq_with_rotation(msgs)
+        resp, _ = query_groq_with_rotation(msgs, on_position=ia_groq.afficher_position(file_attente))
+        file_attente.empty()
         if resp is None:
             resp = "Désolé, le service d'IA n'est pas disponible pour le moment."
         st.session_state.messages.append({"role": "assistant", "content": resp})
+    if HAS_AUDIO:
+        get_lecteur_audio().precalculer(clean_text_for_audio(resp))
     add_notification(f"Dossier lancé : {dossier}")
 
 def generer_bilan_ccf(student_name: str, dossier: str) -> str:
@@ -650,7 +582,7 @@ Phrases courtes, style directement exploitable dans un dossier CCF.
         {"role": "system", "content": "Tu es un Inspecteur IEN neutre et bienveillant."},
         {"role": "user", "content": prompt_bilan},
     ]
-    bilan, _ = query_groq_with_rotation(msgs)
+    bilan, _ = query_groq_with_rotation(msgs, budget=BUDGET_BILAN)
     return bilan or "Impossible de générer le bilan (problème d'IA)."
 
 # --- 12. INTERFACE GRAPHIQUE ---
@@ -659,87 +591,172 @@ LOGO_LYCEE = "logo_lycee.png"
 LOGO_AGORA = "logo_agora.png"
 BOT_AVATAR = LOGO_AGORA if os.path.exists(LOGO_AGORA) else "🤖"
 
-# --- SIDEBAR ---
-with st.sidebar:
-    # DEBUG GROQ
-    try:
-        ks = get_api_keys_list()
-        st.caption(f"🔍 Debug IA : {len(ks)} clé(s) Groq détectée(s).")
-    except Exception as e:
-        st.error(f"Erreur lecture des clés Groq : {e}")
+# --- SAUVEGARDE AUTOMATIQUE ---
+# La séance est enregistrée côté serveur sous le prénom de l'élève et son
+# code de reprise (voir stockage_sessions.py). Envoi seulement si quelque
+# chose a changé.
+
+APP_ID = "1agora"
+
+def etat_seance():
+    # Tout sauf les messages : en-tête du fichier .agora, instantané du magasin
+    return {
+        "xp": st.session_state.xp,
+        "grade": st.session_state.grade,
+        "theme": st.session_state.theme,
+        "dossier": st.session_state.dossier,
+        "profil_eleve": st.session_state.profil_eleve,
+        # Clé du PGI seulement : la table est retirée à l'identique à la reprise
+        "pgi": st.session_state.pgi_jeu,
+        "etape_mission": st.session_state.etape_mission,
+        "bilan_ready": st.session_state.bilan_ready,
+    }
 
-    if os.path.exists(LOGO_LYCEE):
-        st.image(LOGO_LYCEE, width=100)
-    else:
-        st.header("Lycée Pro")
+def autosauvegarde():
+    messages = st.session_state.messages
+    if len(messages) <= 1:
+        # Accueil seul : on n'écrase pas une séance enregistrée avant reprise
+        return
+    autosauvegarder(
+        APP_ID, identifiant_seance(st.session_state.student_name),
+        (id(messages), len(messages), st.session_state.xp,
+         id(st.session_state.pgi_data), st.session_state.bilan_ready),
+        lambda: dict(etat_seance(), messages=list(messages)),
+    )
 
-    st.markdown("---")
+def reprendre_seance(etat):
+    st.session_state.messages = etat["messages"]
+    st.session_state.xp = etat.get("xp", 0)
+    st.session_state.grade = etat.get("grade", "👶 Stagiaire")
+    if etat.get("pgi"):
+        charger_pgi(**etat["pgi"])
+    else:
+        # Anciennes sauvegardes : table enregistrée telle quelle
+        st.session_state.pgi_jeu = None
+        st.session_state.pgi_data = etat.get("pgi_data")
+    st.session_state.etape_mission = etat.get("etape_mission", 0)
+    st.session_state.bilan_ready = etat.get("bilan_ready")
+    # Profil, partie et dossier : repris par les widgets du panneau de
+    # réglages à leur prochaine création (voir appliquer_reglages_repris)
+    st.session_state.reglages_repris = {k: etat[k] for k in ("profil_eleve", "theme", "dossier") if etat.get(k)}
+
+def appliquer_reglages_repris():
+    reglages = st.session_state.pop("reglages_repris", None)
+    if not reglages:
+        return
+    if reglages.get("profil_eleve") in PROFILS_ELEVE:
+        st.session_state.profil_eleve = reglages["profil_eleve"]
+    theme = reglages.get("theme")
+    if theme in DB_OFFICIELLE:
+        st.session_state.theme = theme
+        if reglages.get("dossier") in DB_OFFICIELLE[theme]:
+            st.session_state.dossier = reglages["dossier"]
 
+# --- SIDEBAR ---
+# Les blocs interactifs sont des fragments : un clic n'y relance que le bloc
+# concerné, jamais l'en-tête, le PGI ni l'historique du chat. Quand un bloc
+# modifie une autre zone, son rappel relance les fragments visés par leur clé.
+
+@st.fragment(key="reglages")
+def panneau_reglages():
+    compter_execution("fragment")
+    if st.session_state.xp_en_attente:
+        update_xp(st.session_state.xp_en_attente)
+        st.session_state.xp_en_attente = 0
     st.markdown(f"### 🏆 {st.session_state.grade}")
     st.progress(min(st.session_state.xp / 1000, 1.0))
     st.caption(f"XP : {st.session_state.xp}")
 
-    student_name = st.text_input("Prénom de l'élève", placeholder="Ex : Camille")
-
-    profil_eleve = st.selectbox(
-        "Profil de l'élève (différenciation)",
-        ["Accompagnement renforcé", "Standard", "Autonome"]
+    st.session_state.student_name = st.text_input(
+        "Prénom de l'élève", placeholder="Ex : Camille",
+        on_change=lambda: st.rerun(["reglages", "badge"]),
+    )
+    champ_code_reprise()
+    enregistree = seance_enregistree(
+        APP_ID, identifiant_seance(st.session_state.student_name), vide=len(st.session_state.messages) <= 1
     )
-    st.session_state.profil_eleve = profil_eleve
+    if enregistree:
+        if st.button(f"♻️ Reprendre ma séance ({len(enregistree['messages'])} messages)",
+                     width="stretch"):
+            reprendre_seance(enregistree)
+            st.rerun(scope="app")
+
+    # Avant les widgets : leurs clés ne sont plus modifiables une fois créés
+    appliquer_reglages_repris()
+    st.selectbox("Profil de l'élève (différenciation)", PROFILS_ELEVE, key="profil_eleve")
 
     st.subheader("📂 Sommaire (manuel Foucher)")
-    st.session_state.theme = st.selectbox(
+    st.selectbox(
         "Partie du manuel",
-        list(DB_OFFICIELLE.keys())
+        list(DB_OFFICIELLE.keys()),
+        key="theme",
+        on_change=lambda: st.rerun(["reglages", "fiche"]),
     )
-    st.session_state.dossier = st.selectbox(
+    st.selectbox(
         "Dossier",
-        list(DB_OFFICIELLE[st.session_state.theme].keys())
+        list(DB_OFFICIELLE[st.session_state.theme].keys()),
+        key="dossier",
+        on_change=lambda: st.rerun(["reglages", "fiche"]),
+    )
+    st.session_state.taille_pgi = st.selectbox("Taille du PGI", list(TAILLES_PGI))
+    st.session_state.graine_pgi = st.text_input(
+        "N° de jeu PGI (facultatif)", placeholder="vide = nouveau tirage",
+        help="Même numéro, même dossier, même taille : même tableau pour toute la classe.",
     )
 
-    if st.button("LANCER LA MISSION", type="primary", use_container_width=True):
-        if student_name:
-            lancer_mission(student_name, profil_eleve)
-            st.rerun()
+    if st.button("LANCER LA MISSION", type="primary", width="stretch"):
+        if st.session_state.student_name:
+            lancer_mission(st.session_state.student_name, st.session_state.profil_eleve)
+            # Nouveau PGI, nouvel historique : toute la page change
+            st.rerun(scope="app")
         else:
             st.warning("Merci de saisir le prénom de l'élève.")
 
-    if st.button("✅ Étape validée", use_container_width=True):
-        update_xp(10)
-        st.rerun()
-
-    st.markdown("---")
-    st.markdown("### 📤 Rendre un travail")
-
+    st.button("✅ Étape validée", width="stretch", on_click=valider_etape)
+    autosauvegarde()
+
+def valider_etape():
+    # Étape suivante : un grand PGI est montré à l'IA sous un autre échantillon
+    st.session_state.etape_mission += 1
+    crediter_xp(10)
+
+def envoyer_travail(uploaded_work):
+    # Déjà extrait en fond depuis le dépôt du fichier
+    txt = get_extracteur().lancer(uploaded_work.getvalue(), uploaded_work.name, BUDGET_DOCUMENT).texte()
+
+    st.session_state.messages.append({
+        "role": "user",
+        "content": f"PROPOSITION DE L'ÉLÈVE (extrait du fichier {uploaded_work.name}) :\n\n{txt}"
+    })
+    crediter_xp(20)
+    # Le fragment du chat voit le message en attente et lance le tour d'IA
+    st.rerun(["reglages", "chat"])
+
+@st.fragment(key="rendu")
+def panneau_rendu():
+    compter_execution("fragment")
     uploaded_work = st.file_uploader(
         "Fichier élève (Word / Excel / CSV)",
         type=['docx', 'xlsx', 'xls', 'csv']
     )
+    if uploaded_work:
+        suivre_extraction(get_extracteur().lancer(uploaded_work.getvalue(), uploaded_work.name, BUDGET_DOCUMENT))
 
-    if uploaded_work and student_name:
-        if st.button("Envoyer le travail", use_container_width=True):
-            ext = os.path.splitext(uploaded_work.name)[1].lower()
-            if ext == ".docx":
-                txt = extract_text_from_docx(uploaded_work)
-            else:
-                txt = extract_text_from_table_file(uploaded_work)
-
-            st.session_state.messages.append({
-                "role": "user",
-                "content": f"PROPOSITION DE L'ÉLÈVE (extrait du fichier {uploaded_work.name}) :\n\n{txt}"
-            })
-            update_xp(20)
-            st.rerun()
-    elif uploaded_work and not student_name:
+    if uploaded_work and st.session_state.student_name:
+        st.button("Envoyer le travail", width="stretch",
+                  on_click=envoyer_travail, args=(uploaded_work,))
+    elif uploaded_work and not st.session_state.student_name:
         st.info("Renseigner le prénom avant d'envoyer un travail.")
 
-    st.markdown("---")
-    if st.button("📝 Générer Bilan CCF", use_container_width=True):
+@st.fragment(key="bilan")
+def panneau_bilan():
+    compter_execution("fragment")
+    student_name = st.session_state.student_name
+    if st.button("📝 Générer Bilan CCF", width="stretch"):
         if student_name and len(st.session_state.messages) > 2:
             with st.spinner("Rédaction du bilan officiel..."):
                 bilan = generer_bilan_ccf(student_name, st.session_state.dossier)
                 st.session_state.bilan_ready = bilan
-            st.rerun()
         else:
             st.warning("Il faut d'abord avoir travaillé avec l'élève (échanges dans le chat).")
 
@@ -749,48 +766,178 @@ with st.sidebar:
             data=st.session_state.bilan_ready,
             file_name=f"Bilan_CCF_{student_name}.txt",
             mime="text/plain",
-            use_container_width=True
+            on_click="ignore",
+            width="stretch"
         )
+    autosauvegarde()
+
+with st.sidebar:
+    # DEBUG GROQ : réservé au professeur, les élèves n'en voient rien
+    if MODE_DEBUG:
+        with st.expander("🔍 Debug IA"):
+            try:
+                ks = get_api_keys_list()
+                st.caption(f"🔍 Debug IA : {len(ks)} clé(s) Groq détectée(s).")
+                pool = ia_groq.get_client_pool().stats()
+                st.caption(
+                    f"🔌 Pool : {pool['clients']} client(s), {pool['requetes']} requête(s), "
+                    f"{pool['reutilisations']} connexion(s) réutilisée(s) "
+                    f"({pool['taux_reutilisation']:.0%})."
+                )
+                dernier = st.session_state.get("dernier_appel_ia")
+                if dernier:
+                    st.caption(
+                        f"⏱️ Dernier appel : {dernier['duree']} s, {dernier['tentatives']} tentative(s)"
+                        + (" – budget épuisé" if dernier["budget_epuise"] else "")
+                    )
+                    if "tokens_prompt" in dernier:
+                        cumul = st.session_state.tokens_prompt
+                        st.caption(
+                            f"🧮 Prompt : {dernier['tokens_caches']} jeton(s) en cache, "
+                            f"{dernier['tokens_frais']} frais (séance : {cumul['caches']} / {cumul['frais']})."
+                        )
+                admission = ia_groq.get_admission().stats()
+                st.caption(
+                    f"🚦 File IA : {admission['en_attente']} en attente, {admission['admis']} admis, "
+                    f"pic {admission['attente_max']}."
+                )
+                if RELANCE_PARALLELE:
+                    quota = ia_groq.get_quota_relances()
+                    st.caption(
+                        f"🔀 Relances parallèles : {quota.accordees} accordée(s), "
+                        f"{quota.refusees} refusée(s) (max {quota.max_par_minute}/min)."
+                    )
+                pgi = st.session_state.pgi_data
+                if pgi is not None and len(pgi) <= LIGNES_PGI_PROMPT:
+                    compression = rapport_compression(pgi, cle_pgi_session())
+                    st.caption(
+                        f"🗜️ PGI dans le prompt : {compression['tokens_compact']} jeton(s) au lieu de "
+                        f"{compression['tokens_to_string']} ({compression['gain']:.0%} économisés)."
+                    )
+                elif pgi is not None:
+                    # Pas de to_string() sur des milliers de lignes pour une simple mesure
+                    tokens = compter_tokens(texte_pgi_prompt(pgi, cle_pgi_session(), st.session_state.etape_mission))
+                    st.caption(
+                        f"🗜️ PGI dans le prompt : {tokens} jeton(s) (résumé + échantillon de l'étape "
+                        f"{st.session_state.etape_mission + 1}, {len(pgi)} lignes au total)."
+                    )
+                if stats_xlsx["telechargements"]:
+                    st.caption(
+                        f"📊 PGI Excel : {stats_xlsx['telechargements']} téléchargement(s), "
+                        f"{stats_xlsx['constructions']} fichier(s) construit(s)."
+                    )
+                magasin = get_magasin().stats()
+                st.caption(
+                    f"💽 Séances : {magasin['ecritures']} écriture(s) en {magasin['lots']} lot(s), "
+                    f"{magasin['en_attente']} en attente, {magasin['fusionnees']} fusionnée(s)."
+                )
+                if HAS_AUDIO:
+                    audio = get_lecteur_audio().stats()
+                    st.caption(
+                        f"🔊 Audio ({audio['moteur']}) : {audio['taux_succes']:.0%} de lectures servies depuis le disque, "
+                        f"{audio['fichiers']} fichier(s), {audio['octets'] / 1e6:.1f} Mo."
+                    )
+                executions = executions_dernier_tour()
+                if executions:
+                    st.caption(
+                        f"🔁 Dernier tour : {executions['script']} exécution(s) complète(s) du script, "
+                        f"{executions['fragment']} de fragment(s)."
+                    )
+                etat_routeur = ia_groq.get_router().snapshot()
+                if etat_routeur:
+                    st.caption("🩺 Santé des clés / modèles")
+                    st.dataframe(etat_routeur, hide_index=True, width="stretch")
+            except Exception as e:
+                st.error(f"Erreur lecture des clés Groq : {e}")
+
+    if os.path.exists(LOGO_LYCEE):
+        st.image(LOGO_LYCEE, width=100)
+    else:
+        st.header("Lycée Pro")
 
     st.markdown("---")
-    st.markdown("### 💾 Sauvegarde de la session")
 
-    csv_data = b""
-    btn_state = True
-    if len(st.session_state.messages) > 0:
-        chat_df = pd.DataFrame(st.session_state.messages)
-        csv_data = chat_df.to_csv(index=False).encode("utf-8")
-        btn_state = False
+    panneau_reglages()
+
+    st.markdown("---")
+    st.markdown("### 📤 Rendre un travail")
+    panneau_rendu()
+
+    st.markdown("---")
+    panneau_bilan()
+
+    st.markdown("---")
+    st.markdown("### 💾 Sauvegarde de la session")
 
+    # Fichier produit au clic, à partir de la liste de messages de la
+    # session : il suit les tours joués dans le fragment du chat sans
+    # relancer la page, et n'est refait que si des messages ont été ajoutés.
+    messages_session = st.session_state.messages
     st.download_button(
         "💾 Télécharger la sauvegarde (CSV)",
-        csv_data,
+        export_session("sauvegarde").fournisseur(
+            lambda: version_liste(messages_session),
+            lambda: pd.DataFrame(messages_session).to_csv(index=False).encode("utf-8"),
+        ),
         "agora_session.csv",
         "text/csv",
-        disabled=btn_state,
-        use_container_width=True,
+        disabled=len(messages_session) == 0,
+        on_click="ignore",
+        width="stretch",
+    )
+    # Même séance au format compact (messages, XP, dossier, PGI, bilan)
+    etat_export = etat_seance()
+    st.download_button(
+        "📦 Télécharger la séance (.agora)",
+        export_session("seance").fournisseur(
+            lambda: (version_liste(messages_session), etat_export["xp"],
+                     str(etat_export["pgi"]), etat_export["bilan_ready"]),
+            lambda: ecrire_seance(APP_ID, messages_session, etat_export),
+        ),
+        f"agora_session.{EXTENSION_SEANCE}",
+        "application/octet-stream",
+        disabled=len(messages_session) == 0,
+        on_click="ignore",
+        width="stretch",
     )
 
     restore_file = st.file_uploader(
-        "♻️ Recharger une sauvegarde (CSV)",
-        type=["csv"],
+        "♻️ Recharger une sauvegarde (CSV ou .agora)",
+        type=["csv", EXTENSION_SEANCE],
         help="Permet à un élève de renvoyer son fichier de sauvegarde pour reprendre la séance."
     )
     if restore_file is not None:
-        try:
-            df_restore = pd.read_csv(restore_file)
-            if {"role", "content"}.issubset(df_restore.columns):
-                st.session_state.messages = df_restore[["role", "content"]].to_dict(orient="records")
-                st.success("Conversation rechargée depuis le CSV.")
+        # Appliquée une seule fois par contenu : le fichier peut rester dans
+        # l'uploader sans écraser les échanges suivants à chaque exécution.
+        contenu = restore_file.getvalue()
+        signature = empreinte(contenu)
+        if st.session_state.get("sauvegarde_restauree") == signature:
+            st.success("Conversation rechargée depuis la sauvegarde.")
+        elif est_seance(contenu):
+            try:
+                entete, messages = lire_seance(BytesIO(contenu))
+                reprendre_seance(dict(entete, messages=list(messages)))
+                st.session_state.sauvegarde_restauree = signature
                 st.rerun()
-            else:
-                st.warning("Le CSV doit contenir les colonnes 'role' et 'content'.")
-        except Exception as e:
-            st.error(f"Impossible d'importer le fichier : {e}")
-
-    if st.button("🗑️ Reset complet", use_container_width=True):
+            except Exception as e:
+                st.error(f"Impossible d'importer le fichier : {e}")
+        else:
+            try:
+                df_restore = lire_csv(contenu)
+                if {"role", "content"}.issubset(df_restore.columns):
+                    st.session_state.messages = messages_depuis_csv(df_restore)
+                    st.session_state.sauvegarde_restauree = signature
+                    st.rerun()
+                else:
+                    st.warning("Le CSV doit contenir les colonnes 'role' et 'content'.")
+            except Exception as e:
+                st.error(f"Impossible d'importer le fichier : {e}")
+
+    if st.button("🗑️ Reset complet", width="stretch"):
         st.session_state.messages = [{"role": "assistant", "content": INITIAL_MESSAGE}]
         st.session_state.pgi_data = None
+        st.session_state.pgi_jeu = None
+        st.session_state.etape_mission = 0
         st.session_state.bilan_ready = None
         st.rerun()
 
@@ -826,108 +973,158 @@ with c3:
             "https://cas.ent.auvergnerhonealpes.fr/login?service=https%3A%2F%2Fglieres.ent.auvergnerhonealpes.fr%2Fsg.do%3FPROC%3DPAGE_ACCUEIL",
         )
 
-with c4:
+@st.fragment(key="badge")
+def badge_eleve():
+    compter_execution("fragment")
+    student_name = st.session_state.student_name
     user_label = f"👤 {student_name}" if student_name else "👤 Invité"
-    st.button(user_label, disabled=True, use_container_width=True)
+    st.button(user_label, disabled=True, width="stretch")
+
+with c4:
+    badge_eleve()
 
 st.markdown("<hr style='margin: 0 0 10px 0;'>", unsafe_allow_html=True)
 
 # --- FICHE D'AIDE ---
 
-dossier_courant = st.session_state.dossier
-fiche_aide = AIDES_DOSSIERS.get(dossier_courant)
+@st.fragment(key="fiche")
+def fiche_aide_dossier():
+    compter_execution("fragment")
+    fiche_aide = AIDES_DOSSIERS.get(st.session_state.dossier)
+
+    if fiche_aide:
+        with st.expander("📎 Fiche d'aide (résumé enseignant)", expanded=False):
+            st.markdown(f"**Situation :** {fiche_aide['situation']}")
+            st.markdown(f"**Contexte :** {fiche_aide['contexte']}")
+            st.markdown("**Missions typiques :**")
+            for m in fiche_aide["missions"]:
+                st.markdown(f"- {m}")
+            st.markdown(f"**Productions attendues :** {fiche_aide['types_production']}")
 
-if fiche_aide:
-    with st.expander("📎 Fiche d'aide (résumé enseignant)", expanded=False):
-        st.markdown(f"**Situation :** {fiche_aide['situation']}")
-        st.markdown(f"**Contexte :** {fiche_aide['contexte']}")
-        st.markdown("**Missions typiques :**")
-        for m in fiche_aide["missions"]:
-            st.markdown(f"- {m}")
-        st.markdown(f"**Productions attendues :** {fiche_aide['types_production']}")
+fiche_aide_dossier()
 
 st.markdown("<br>", unsafe_allow_html=True)
 
 # --- AFFICHAGE PGI ---
 
-if st.session_state.pgi_data is not None:
+@st.fragment(key="pgi")
+def panneau_pgi():
+    compter_execution("fragment")
+    if st.session_state.pgi_data is None:
+        return
+    jeu = st.session_state.pgi_jeu
+    numero_jeu = f" – jeu n° {jeu['graine']}" if jeu else ""
     st.markdown(
-        f'<div class="pgi-title">📁 Données métier fictives (PGI) – {st.session_state.dossier}</div>',
+        f'<div class="pgi-title">📁 Données métier fictives (PGI) – {st.session_state.dossier}{numero_jeu}</div>',
         unsafe_allow_html=True,
     )
+    pgi = st.session_state.pgi_data
+    cle = cle_pgi_session()
+    index = index_pgi(cle, pgi)
+    # Les réglages de la requête ne relancent que ce fragment
+    with st.expander("🔎 Filtrer, trier, regrouper"):
+        requete = formulaire_requete(index, cle)
+    resultat, temps = index.executer(**requete)
+    pages = max(1, -(-len(resultat) // LIGNES_PAR_PAGE))
+    debut = 0
+    if pages > 1:
+        # La clé suit le nombre de pages : une nouvelle requête repart de la page 1
+        page = st.number_input(f"Page (sur {pages})", 1, pages, 1, key=f"pgi_page_{cle}_{pages}")
+        debut = (page - 1) * LIGNES_PAR_PAGE
+    affiche = resultat.iloc[debut:debut + LIGNES_PAR_PAGE]
     with st.container():
         st.markdown('<div class="pgi-container">', unsafe_allow_html=True)
-        st.dataframe(st.session_state.pgi_data, use_container_width=True, hide_index=True)
+        st.dataframe(
+            affiche, width="stretch", hide_index=True,
+            column_config={c: st.column_config.DateColumn(format="DD/MM/YYYY")
+                           for c in affiche.select_dtypes("datetime").columns},
+        )
         st.markdown("</div>", unsafe_allow_html=True)
+    legende = f"{len(resultat)} ligne(s) sur {index.n}"
+    if pages > 1:
+        legende += f" – lignes {debut + 1}-{debut + len(affiche)}"
+    if MODE_DEBUG:
+        legende += " – " + " · ".join(f"{etape} {duree:.1f} ms" for etape, duree in temps.items())
+    st.caption(legende)
+    if HAS_OPENPYXL:
+        # Tout le jeu (pas seulement la page), construit au clic et partagé
+        # par clé : la classe entière sur le même numéro = un seul fichier
+        nom_fichier = f"PGI_dossier{numero_dossier(st.session_state.dossier) or ''}"
+        if jeu:
+            nom_fichier += f"_jeu{jeu['graine']}"
+        st.download_button(
+            "📊 Télécharger le PGI (Excel)",
+            lambda: export_xlsx_pgi(cle, pgi),
+            f"{nom_fichier}.xlsx",
+            MIME_XLSX,
+            on_click="ignore",
+        )
 
-# --- CHAT ---
-
-for i, msg in enumerate(st.session_state.messages):
-    avatar = BOT_AVATAR if msg["role"] == "assistant" else "🧑‍🎓"
-    with st.chat_message(msg["role"], avatar=avatar):
-        st.markdown(msg["content"])
-        if msg["role"] == "assistant" and HAS_AUDIO:
-            if st.button("🔊 Lire", key=f"tts_{i}"):
-                try:
-                    tts = gTTS(clean_text_for_audio(msg["content"]), lang="fr")
-                    buf = BytesIO()
-                    tts.write_to_fp(buf)
-                    st.audio(buf, format="audio/mp3", start_time=0)
-                except Exception:
-                    st.warning("Lecture audio impossible pour ce message.")
-
-st.markdown("<br><br>", unsafe_allow_html=True)
+panneau_pgi()
 
 st.markdown(
     '<div class="fixed-footer">Agence Pro\'AGOrA - Données 100 % fictives (structures inspirées du manuel, sans reproduction intégrale)</div>',
     unsafe_allow_html=True,
 )
 
-# --- INPUT & TOUR D'IA ---
+# --- CHAT, INPUT & TOUR D'IA ---
+# Un tour ne relance que ce fragment : la saisie est ajoutée par le rappel
+# du chat_input, puis la réponse est diffusée sous l'historique, dans la
+# même exécution. Le chat_input reste hors du fragment pour être épinglé en
+# bas de page ; son rappel relance donc le fragment explicitement.
 
-if user_input := st.chat_input("Ta réponse (ou le résumé de ton Word / Excel)…"):
-    if not student_name:
-        st.toast("Identifie-toi avant de répondre (prénom).", icon="👤")
+def soumettre_reponse():
+    if not st.session_state.student_name:
+        st.session_state.saisie_refusee = True
     else:
-        st.session_state.messages.append({"role": "user", "content": user_input})
-        st.rerun()
+        st.session_state.messages.append({"role": "user", "content": st.session_state.saisie_eleve})
+    st.rerun(["chat"])
 
-if st.session_state.messages and st.session_state.messages[-1]["role"] == "user":
+def tour_ia():
     with st.chat_message("assistant", avatar=BOT_AVATAR):
-        with st.spinner("Analyse de ta réponse…"):
-            pgi_str = ""
-            if st.session_state.pgi_data is not None:
-                pgi_str = st.session_state.pgi_data.to_string()
-
-            dernier_texte_eleve = st.session_state.messages[-1]["content"]
-            diff_instr = build_differentiation_instruction(st.session_state.profil_eleve)
-
-            prompt_tour = f"""
-{diff_instr}
-
-DOSSIER : {st.session_state.dossier}
-PARTIE : {st.session_state.theme}
-
-DONNÉES PGI :
-{pgi_str}
-
-RÉPONSE DE L'ÉLÈVE :
-\"\"\"{dernier_texte_eleve}\"\"\"
-
-CONSigne :
-1. Vérifie si l'élève exploite vraiment les données PGI ou le contexte du dossier.
-2. Si c'est pertinent, valide un point précis, explique pourquoi c'est bien, puis propose la prochaine étape.
-3. Si c'est incomplet ou hors sujet, explique ce qui manque en phrases courtes et donne une consigne guidée.
-4. Si tu proposes un tableau, rappelle clairement qu'il s'agit d'un tableau de synthèse/comparatif différent du PGI.
-5. Réponds avec des blocs courts et/ou listes à puces (pas de gros pavé).
-"""
-
-            msgs = [
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": prompt_tour},
-            ]
-            resp, _ = query_groq_with_rotation(msgs)
-            if resp is None:
+        # Préfixe stable (consignes, dossier, PGI) puis historique : la
+        # réponse de l'élève arrive en dernier, telle quelle.
+        msgs = construire_contexte(
+            prefixe_courant(st.session_state.profil_eleve),
+            st.session_state.messages,
+            st.session_state.resume_contexte,
+            resumer=partial(ia_groq.resumer_avec_ia, models=MODELES_IA),
+            budget=BUDGET_CONTEXTE_TOUR,
+            n_epingles=1,
+        )
+        resp, statut = stream_groq_with_rotation(msgs)
+        if resp is None:
+            if statut == ia_groq.DELAI_DEPASSE:
+                resp = "L'IA met trop de temps à répondre (service chargé). Renvoie ta réponse dans une minute."
+            else:
                 resp = "Je n'arrive pas à analyser ta réponse pour le moment. Préviens ton professeur."
             st.markdown(resp)
-            st.session_state.messages.append({"role": "assistant", "content": resp})
+        st.session_state.messages.append({"role": "assistant", "content": resp})
+    if HAS_AUDIO:
+        # Audio prêt avant le clic sur « Lire »
+        get_lecteur_audio().precalculer(clean_text_for_audio(resp))
+    clore_tour()
+
+@st.fragment(key="chat")
+def zone_chat():
+    compter_execution("fragment")
+    if st.session_state.pop("saisie_refusee", False):
+        st.toast("Identifie-toi avant de répondre (prénom).", icon="👤")
+    for i, msg in enumerate(st.session_state.messages):
+        avatar = BOT_AVATAR if msg["role"] == "assistant" else "🧑‍🎓"
+        with st.chat_message(msg["role"], avatar=avatar):
+            st.markdown(msg["content"])
+            if msg["role"] == "assistant" and HAS_AUDIO:
+                if st.button("🔊 Lire", key=f"tts_{i}"):
+                    try:
+                        lire_a_voix_haute(clean_text_for_audio(msg["content"]))
+                    except Exception:
+                        st.warning("Lecture audio impossible pour ce message.")
+
+    if st.session_state.messages and st.session_state.messages[-1]["role"] == "user":
+        tour_ia()
+    autosauvegarde()
+
+zone_chat()
+st.chat_input("Ta réponse (ou le résumé de ton Word / Excel)…",
+              key="saisie_eleve", on_submit=soumettre_reponse)
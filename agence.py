@@ -1,8 +1,19 @@
 import streamlit as st
-import pandas as pd
-import os
-from groq import Groq
 from datetime import datetime
+from io import BytesIO
+
+from functools import partial
+
+import ia_groq
+from contexte_ia import construire_contexte, nouvel_etat_resume
+from exports import JournalCSV, export_session
+from sauvegarde import (
+    EXTENSION_SEANCE, ecrire_seance, empreinte, est_seance, historique_agence, journal_depuis_seance,
+    lire_csv, lire_seance, seance_depuis_journal,
+)
+from stockage_sessions import autosauvegarder, champ_code_reprise, identifiant_seance, seance_enregistree
+from ia_groq import get_api_keys_list
+from suivi_executions import clore_tour, compter_execution, executions_dernier_tour
 
 # --- 1. CONFIGURATION DE LA PAGE ---
 # Ajout de initial_sidebar_state="expanded"
@@ -11,6 +22,7 @@ st.set_page_config(
     page_icon="🏢",
     initial_sidebar_state="expanded"
 )
+compter_execution("script")
 
 # --- CORRECTION CSS ---
 # On cache le footer, mais on force l'affichage du header (bouton partage)
@@ -25,10 +37,12 @@ st.markdown(hide_menu_style, unsafe_allow_html=True)
 st.title("🏢 Agence Pro’AGoRA - Espace Opérateur")
 
 # --- 2. CONNEXION GROQ ---
-try:
-    api_key = st.secrets["GROQ_API_KEY"]
-    client = Groq(api_key=api_key)
-except:
+MODELES_IA = ["llama-3.3-70b-versatile"]
+BUDGET_REPONSE = 30  # secondes pour obtenir le premier mot de la réponse
+BUDGET_CONTEXTE = 4000  # jetons envoyés à chaque tour (résumé glissant au-delà)
+MAX_TOKENS_REPONSE = 2048  # le rapport final est la réponse la plus longue
+
+if not get_api_keys_list():
     st.error("ERREUR : Clé API manquante. Configurez GROQ_API_KEY dans les Secrets.")
     st.stop()
 
@@ -106,8 +120,10 @@ Génère ce bilan :
 """
 
 # --- 4. GESTION DES LOGS ET MESSAGES ---
+COLONNES_LOG = ["Heure", "Eleve", "Role", "Message"]
+
 if "conversation_log" not in st.session_state:
-    st.session_state.conversation_log = []
+    st.session_state.conversation_log = JournalCSV(COLONNES_LOG)
 
 # Message d'accueil par défaut
 welcome_text = """Bonjour Opérateur. Bienvenue à l'Agence Pro’AGoRA.
@@ -124,113 +140,180 @@ Indique la lettre de la mission."""
 
 if "messages" not in st.session_state:
     st.session_state.messages = [{"role": "assistant", "content": welcome_text}]
+if "resume_contexte" not in st.session_state:
+    st.session_state.resume_contexte = nouvel_etat_resume()
 
 def save_log(student_id, role, content):
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    st.session_state.conversation_log.append({
+    st.session_state.conversation_log.ajouter({
         "Heure": timestamp,
         "Eleve": student_id,
         "Role": role,
         "Message": content
     })
 
+# Séance enregistrée côté serveur sous l'identifiant opérateur et le code de reprise,
+# reprise automatique de la même manière qu'une sauvegarde CSV
+APP_ID = "agence"
+
+def autosauvegarde():
+    journal = st.session_state.conversation_log
+    if not len(journal):
+        return
+    messages = st.session_state.messages
+    autosauvegarder(
+        APP_ID, identifiant_seance(st.session_state.student_id), (id(journal), len(journal)),
+        lambda: {"messages": list(messages), "journal": journal.contenu},
+    )
+
+def reprendre_seance(etat):
+    st.session_state.messages = etat["messages"]
+    st.session_state.conversation_log = JournalCSV(COLONNES_LOG)
+    st.session_state.conversation_log.ajouter_bloc(lire_csv(etat["journal"].encode("utf-8"), sep=';'))
+
 # --- 5. INTERFACE CÔTÉ GAUCHE (SIDEBAR) ---
 with st.sidebar:
     st.header("Agence Pro’AGoRA")
-    student_id = st.text_input("Identifiant Opérateur :")
+    student_id = st.text_input("Identifiant Opérateur :", key="student_id")
     st.info("⚠️ N'utilise jamais ton vrai nom.")
+    champ_code_reprise()
+    enregistree = seance_enregistree(
+        APP_ID, identifiant_seance(student_id), vide=not len(st.session_state.conversation_log)
+    )
+    if enregistree:
+        if st.button(f"♻️ Reprendre ma séance ({len(enregistree['messages']) - 1} messages)"):
+            reprendre_seance(enregistree)
+            st.rerun()
     st.markdown("---")
 
     # --- ZONE DE SAUVEGARDE (DOWNLOAD) ---
+    # Le CSV est produit au clic à partir du journal de la session (pas
+    # besoin de relancer la page après chaque réponse pour le tenir à jour) ;
+    # chaque ligne y est déjà encodée, il ne reste qu'à les mettre bout à bout.
     st.subheader("💾 Sauvegarder")
-    if st.session_state.conversation_log:
-        df = pd.DataFrame(st.session_state.conversation_log)
-        csv = df.to_csv(index=False, sep=';').encode('utf-8-sig')
-        st.download_button("📥 Télécharger l'avancement (CSV)", csv, "suivi_agence.csv", "text/csv")
-    else:
-        st.write("Commencez à discuter pour sauvegarder.")
+    journal = st.session_state.conversation_log
+    st.download_button(
+        "📥 Télécharger l'avancement (CSV)",
+        export_session("suivi").fournisseur(lambda: (id(journal), len(journal)), journal.contenu),
+        "suivi_agence.csv",
+        "text/csv",
+        on_click="ignore",
+    )
+    st.download_button(
+        "📦 Télécharger la séance (.agora)",
+        export_session("seance").fournisseur(
+            lambda: (id(journal), len(journal)),
+            lambda: ecrire_seance(APP_ID, seance_depuis_journal(lire_csv(journal.contenu(), sep=';'))),
+        ),
+        f"suivi_agence.{EXTENSION_SEANCE}",
+        "application/octet-stream",
+        on_click="ignore",
+    )
+    st.caption("Le fichier reprend tous les échanges au moment du clic.")
 
     st.markdown("---")
 
     # --- ZONE DE REPRISE (UPLOAD) ---
     st.subheader("📂 Reprendre un travail")
-    uploaded_file = st.file_uploader("Charger un ancien CSV pour continuer", type=['csv'])
+    uploaded_file = st.file_uploader("Charger un ancien CSV (ou .agora) pour continuer",
+                                     type=['csv', EXTENSION_SEANCE])
     
     if uploaded_file is not None:
         try:
-            # Lecture du fichier
-            df_history = pd.read_csv(uploaded_file, sep=';')
-            
+            # Lecture du fichier, une seule fois par contenu
+            contenu = uploaded_file.getvalue()
+            signature = empreinte(contenu)
+            lu = st.session_state.get("sauvegarde_lue")
+            if lu is None or lu[0] != signature:
+                if est_seance(contenu):
+                    df_lu = journal_depuis_seance(lire_seance(BytesIO(contenu))[1])
+                else:
+                    df_lu = lire_csv(contenu, sep=';')
+                lu = st.session_state.sauvegarde_lue = (signature, df_lu)
+            df_history = lu[1]
+
             # Vérification que c'est le bon format
             if 'Role' in df_history.columns and 'Message' in df_history.columns:
-                if st.button("🔄 Restaurer la conversation"):
-                    # 1. On vide la mémoire actuelle
-                    st.session_state.messages = []
-                    st.session_state.conversation_log = []
-                    
-                    # 2. On remplit avec l'historique
-                    # On remet le message d'accueil si absent
-                    st.session_state.messages.append({"role": "assistant", "content": welcome_text})
-
-                    for index, row in df_history.iterrows():
-                        role_csv = row['Role'] # "Eleve" ou "Superviseur"
-                        content = row['Message']
-                        
-                        # Conversion pour l'affichage chat
-                        role_chat = "user" if role_csv == "Eleve" else "assistant"
-                        
-                        # On évite de doublonner le message d'accueil s'il est dans le CSV
-                        if content != welcome_text:
-                            st.session_state.messages.append({"role": role_chat, "content": content})
-                            
-                            # On remplit aussi le log pour la future sauvegarde
-                            st.session_state.conversation_log.append({
-                                "Heure": row.get('Heure', datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
-                                "Eleve": row.get('Eleve', student_id),
-                                "Role": role_csv,
-                                "Message": content
-                            })
-                    
+                if st.session_state.get("sauvegarde_restauree") == signature:
                     st.success("Conversation restaurée ! Vous pouvez continuer.")
+                elif st.button("🔄 Restaurer la conversation"):
+                    # Historique reconstruit colonne par colonne, message
+                    # d'accueil remis en tête, journal prêt pour la future sauvegarde
+                    messages, journal = historique_agence(df_history, welcome_text, student_id)
+                    st.session_state.messages = messages
+                    st.session_state.conversation_log = JournalCSV(COLONNES_LOG)
+                    st.session_state.conversation_log.ajouter_bloc(journal)
+                    st.session_state.sauvegarde_restauree = signature
                     st.rerun() # Recharge la page pour afficher les messages
             else:
                 st.error("Format de fichier invalide (colonnes manquantes).")
         except Exception as e:
             st.error(f"Erreur lecture : {e}")
 
-# --- 6. CHAT (AFFICHAGE) ---
-# Affichage historique
-for msg in st.session_state.messages:
-    st.chat_message(msg["role"]).write(msg["content"])
-
-# Interaction
-if prompt := st.chat_input("Votre réponse..."):
-    if not student_id:
-        st.warning("⚠️ Identifiant requis à gauche !")
+    executions = executions_dernier_tour()
+    if executions:
+        st.caption(
+            f"🔁 Dernier tour : {executions['script']} exécution(s) complète(s), "
+            f"{executions['fragment']} de fragment(s)."
+        )
+
+# --- 6. CHAT ---
+# Fragment : l'envoi d'un message ne relance que l'historique et la réponse,
+# pas la barre latérale. La saisie reste hors du fragment pour être épinglée
+# en bas de page ; son rappel relance le fragment.
+def soumettre_message():
+    if not st.session_state.student_id:
+        st.session_state.saisie_refusee = True
     else:
-        # 1. Message Élève
-        st.chat_message("user").write(prompt)
-        st.session_state.messages.append({"role": "user", "content": prompt})
-        save_log(student_id, "Eleve", prompt)
+        # Journalisé avec la réponse : un message resté sans réponse n'y entre pas
+        st.session_state.messages.append({"role": "user", "content": st.session_state.saisie_operateur})
+        st.session_state.reponse_attendue = True
+    st.rerun(["chat"])
+
+@st.fragment(key="chat")
+def zone_chat():
+    compter_execution("fragment")
+    # Affichage historique
+    for msg in st.session_state.messages:
+        st.chat_message(msg["role"]).write(msg["content"])
+
+    if st.session_state.pop("saisie_refusee", False):
+        st.warning("⚠️ Identifiant requis à gauche !")
 
-        # 2. Réponse IA
-        try:
-            messages_for_api = [{"role": "system", "content": SYSTEM_PROMPT}]
-            for m in st.session_state.messages:
-                messages_for_api.append({"role": m["role"], "content": m["content"]})
-
-            chat_completion = client.chat.completions.create(
-                messages=messages_for_api,
-                model="llama-3.3-70b-versatile",
-                temperature=0.7,
+    # Réponse IA (diffusée au fil de l'eau) au message qui vient d'arriver
+    if st.session_state.pop("reponse_attendue", False):
+        # Menu, choix du dossier et brief de mission restent épinglés ;
+        # les anciens échanges sont résumés au-delà du budget
+        messages_for_api = construire_contexte(
+            SYSTEM_PROMPT,
+            st.session_state.messages,
+            st.session_state.resume_contexte,
+            resumer=partial(ia_groq.resumer_avec_ia, models=MODELES_IA),
+            budget=BUDGET_CONTEXTE,
+            n_epingles=3,
+        )
+
+        with st.chat_message("assistant"):
+            bot_reply, _ = ia_groq.stream_groq_to_chat(
+                messages_for_api, MODELES_IA, temperature=0.7, max_tokens=MAX_TOKENS_REPONSE,
+                budget=BUDGET_REPONSE
             )
-            
-            bot_reply = chat_completion.choices[0].message.content
-            
-            st.chat_message("assistant").write(bot_reply)
+
+        if bot_reply:
+            save_log(st.session_state.student_id, "Eleve", st.session_state.messages[-1]["content"])
             st.session_state.messages.append({"role": "assistant", "content": bot_reply})
-            save_log(student_id, "Superviseur", bot_reply)
-            st.rerun() # Force le rafraichissement pour le bouton download
-            
-        except Exception as e:
-            st.error(f"Erreur : {e}")
+            save_log(st.session_state.student_id, "Superviseur", bot_reply)
+            clore_tour()
+        else:
+            # Message retiré : le prochain envoi ne part pas derrière un
+            # message resté sans réponse
+            st.session_state.messages.pop()
+            st.error("Erreur : le service d'IA ne répond pas. Ton message n'a pas été transmis, "
+                     "renvoie-le dans un instant.")
+
+    autosauvegarde()
+
+zone_chat()
+
+# Interaction
+st.chat_input("Votre réponse...", key="saisie_operateur", on_submit=soumettre_message)
@@ -1,12 +1,19 @@
 import streamlit as st
-import pandas as pd
-import random
 import os
 import re
-import base64
 from datetime import datetime
-from io import BytesIO, StringIO
-from groq import Groq
+from io import BytesIO
+
+from functools import partial
+
+import ia_groq
+from audio_tts import HAS_AUDIO, get_lecteur_audio, lire_a_voix_haute
+from contexte_ia import construire_contexte, nouvel_etat_resume
+from documents_eleves import get_extracteur, suivre_extraction
+from exports import export_session, version_liste
+from sauvegarde import EXTENSION_SEANCE, ecrire_seance, empreinte, lire_seance
+from stockage_sessions import autosauvegarder, champ_code_reprise, identifiant_seance, seance_enregistree
+from ia_groq import get_api_keys_list
 
 # --- 0. DÉPENDANCES & SÉCURITÉ ---
 try:
@@ -16,12 +23,6 @@ except ImportError:
     st.error("⚠️ ERREUR CRITIQUE : Le module 'python-docx' manque.")
     st.stop()
 
-try:
-    from gtts import gTTS
-    HAS_AUDIO = True
-except ImportError:
-    HAS_AUDIO = False
-
 # --- 1. CONFIGURATION DE LA PAGE ---
 PAGE_ICON = "logo_agora.png" if os.path.exists("logo_agora.png") else "🎓"
 
@@ -81,6 +82,8 @@ if "grade" not in st.session_state:
     st.session_state.grade = "👶 Stagiaire"
 if "final_feedback" not in st.session_state:
     st.session_state.final_feedback = None
+if "resume_contexte" not in st.session_state:
+    st.session_state.resume_contexte = nouvel_etat_resume()
 
 # SYSTÈME DE GRADES
 GRADES = {
@@ -131,56 +134,37 @@ PROFILES = {
 }
 
 # --- 5. OUTILS IA (GROQ) ---
-def get_api_keys_list():
-    if "groq_keys" in st.secrets:
-        return st.secrets["groq_keys"]
-    elif "GROQ_API_KEY" in st.secrets:
-        return [st.secrets["GROQ_API_KEY"]]
-    return []
-
-def query_groq_with_rotation(messages):
-    available_keys = get_api_keys_list()
-    if not available_keys:
+MODELES_IA = ["llama-3.3-70b-versatile", "mixtral-8x7b-32768", "llama-3.1-8b-instant"]
+
+# Budgets de temps (s) pour toute la chaîne de repli clés / modèles
+BUDGET_TOUR = 25
+BUDGET_BILAN = 60
+BUDGET_CONTEXTE = 5000  # jetons par tour, documents transmis compris
+
+# Relance parallèle des réponses du superviseur (option à activer dans les secrets)
+RELANCE_PARALLELE = bool(st.secrets.get("relance_parallele", False))
+
+def query_groq_with_rotation(messages, budget=BUDGET_BILAN):
+    if not get_api_keys_list():
         return None, "ERREUR CONFIG : Aucune clé API trouvée."
-    
-    keys = list(available_keys)
-    random.shuffle(keys)
-    models = ["llama-3.3-70b-versatile", "mixtral-8x7b-32768", "llama-3.1-8b-instant"]
-
-    for key in keys:
-        try:
-            client = Groq(api_key=key)
-            for model in models:
-                try:
-                    chat = client.chat.completions.create(
-                        messages=messages,
-                        model=model,
-                        temperature=0.5,
-                        max_tokens=1024,
-                    )
-                    return chat.choices[0].message.content, model
-                except: continue
-        except: continue
-    return None, "SATURATION SERVICE."
+    response, model = ia_groq.query_groq_with_rotation(
+        messages, MODELES_IA, temperature=0.5, budget=budget
+    )
+    return response, model if response else "SATURATION SERVICE."
+
+def stream_groq_with_rotation(messages, budget=BUDGET_TOUR):
+    if not get_api_keys_list():
+        return None, "ERREUR CONFIG : Aucune clé API trouvée."
+    response, model = ia_groq.stream_groq_to_chat(
+        messages, MODELES_IA, temperature=0.5, spinner_text="Analyse en cours...",
+        budget=budget, hedging=RELANCE_PARALLELE
+    )
+    return response, model if response else "SATURATION SERVICE."
 
 # --- 6. OUTILS FICHIERS ---
 
-def extract_text_from_file(uploaded_file) -> str:
-    try:
-        filename = uploaded_file.name.lower()
-        if filename.endswith(".docx"):
-            doc = Document(uploaded_file)
-            return "\n".join([p.text for p in doc.paragraphs if p.text.strip()])[:15000]
-        elif filename.endswith(".xlsx") or filename.endswith(".xls"):
-            df = pd.read_excel(uploaded_file)
-            return df.to_string()[:15000]
-        elif filename.endswith(".csv"):
-            df = pd.read_csv(uploaded_file)
-            return df.to_string()[:15000]
-        else:
-            return "Format non supporté."
-    except Exception as e:
-        return f"Erreur de lecture : {str(e)}"
+# Caractères lus dans un document transmis (Word : paragraphes et tableaux)
+BUDGET_DOCUMENT = 15000
 
 def create_docx_history(messages, student_name, final_feedback=None):
     doc = Document()
@@ -214,7 +198,22 @@ def create_docx_history(messages, student_name, final_feedback=None):
 def clean_text_for_audio(text: str) -> str:
     text = re.sub(r"[\*_]{1,3}", "", text)
     text = re.sub(r"\[.*?\]", "", text)
-    return text[:500]
+    return text
+
+@st.fragment
+def analyser_document(student_name):
+    # Fragment : la progression de la lecture ne relance que ce bloc
+    uploaded_file = st.file_uploader("Rapport/Brouillon", type=['docx', 'xlsx', 'xls', 'csv'])
+    if uploaded_file:
+        extraction = get_extracteur().lancer(uploaded_file.getvalue(), uploaded_file.name, BUDGET_DOCUMENT)
+        suivre_extraction(extraction)
+
+    if uploaded_file and student_name:
+        if st.button("🚀 Envoyer à l'analyse"):
+            text = extraction.texte()
+            st.session_state.messages.append({"role": "user", "content": f"Voici mon document ({uploaded_file.name}) :\n\n{text}"})
+            update_xp(50)
+            st.rerun()
 
 # --- 7. PROMPT SYSTÈME DYNAMIQUE ---
 def get_system_prompt(profile_key):
@@ -247,15 +246,54 @@ if not st.session_state.messages:
 
 # --- 8. INTERFACE GRAPHIQUE ---
 
+# Séance enregistrée côté serveur sous prénom + code de reprise (écriture différée)
+APP_ID = "app"
+
+def etat_seance():
+    return {
+        "xp": st.session_state.xp,
+        "grade": st.session_state.grade,
+        "final_feedback": st.session_state.final_feedback,
+    }
+
+def reprendre_seance(etat):
+    st.session_state.messages = etat["messages"]
+    st.session_state.xp = etat.get("xp", 0)
+    st.session_state.grade = etat.get("grade", "👶 Stagiaire")
+    st.session_state.final_feedback = etat.get("final_feedback")
+
+def autosauvegarde(student_name):
+    messages = st.session_state.messages
+    if len(messages) <= 1:
+        return
+    autosauvegarder(
+        APP_ID, identifiant_seance(student_name),
+        (id(messages), len(messages), st.session_state.xp, st.session_state.final_feedback),
+        lambda: dict(etat_seance(), messages=list(messages)),
+    )
+
 st.title("🎓 Restitution PFMP & Analyse de Pratique")
 
+# Fragment : relancé avec le chat quand un message rapporte de l'XP
+@st.fragment(key="badge")
+def badge_xp():
+    st.markdown(f"### 🏆 {st.session_state.grade}")
+    st.progress(min(st.session_state.xp / 1000, 1.0))
+
 with st.sidebar:
     if os.path.exists(PAGE_ICON):
         st.image(PAGE_ICON, width=80)
     
-    st.markdown(f"### 🏆 {st.session_state.grade}")
-    st.progress(min(st.session_state.xp / 1000, 1.0))
+    badge_xp()
     student_name = st.text_input("Ton Prénom :", placeholder="Ex: Thomas")
+    champ_code_reprise()
+    enregistree = seance_enregistree(
+        APP_ID, identifiant_seance(student_name), vide=len(st.session_state.messages) <= 1
+    )
+    if enregistree:
+        if st.button(f"♻️ Reprendre ma séance ({len(enregistree['messages'])} messages)"):
+            reprendre_seance(enregistree)
+            st.rerun()
     
     # --- SÉLECTEUR DE DIFFÉRENCIATION ---
     st.markdown("### ⚙️ Niveau d'aide")
@@ -277,15 +315,7 @@ with st.sidebar:
     st.divider()
 
     st.subheader("📂 Analyser un document")
-    uploaded_file = st.file_uploader("Rapport/Brouillon", type=['docx', 'xlsx', 'xls', 'csv'])
-    
-    if uploaded_file and student_name:
-        if st.button("🚀 Envoyer à l'analyse"):
-            with st.spinner("Lecture..."):
-                text = extract_text_from_file(uploaded_file)
-                st.session_state.messages.append({"role": "user", "content": f"Voici mon document ({uploaded_file.name}) :\n\n{text}"})
-                update_xp(50)
-                st.rerun()
+    analyser_document(student_name)
 
     st.divider()
 
@@ -319,24 +349,97 @@ with st.sidebar:
     # --- EXPORT ---
     if st.session_state.final_feedback:
         st.success("Bilan généré ! (Voir en bas de page)")
-        docx_file = create_docx_history(st.session_state.messages, student_name, st.session_state.final_feedback)
+        # Document Word construit au clic seulement, refait si le chat, le
+        # prénom ou le bilan ont changé depuis le dernier téléchargement
+        messages_export = st.session_state.messages
+        feedback_export = st.session_state.final_feedback
         st.download_button(
             "📄 Télécharger Bilan + Chat (.docx)",
-            data=docx_file,
+            data=export_session("bilan_docx").fournisseur(
+                lambda: (version_liste(messages_export), student_name, feedback_export),
+                lambda: create_docx_history(messages_export, student_name, feedback_export).getvalue(),
+            ),
             file_name=f"Bilan_PFMP_{student_name}.docx",
-            mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+            mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+            on_click="ignore",
         )
-    
+
+    # --- SÉANCE (.agora) : à garder pour reprendre sur un autre poste ---
+    messages_seance = st.session_state.messages
+    etat_export = etat_seance()
+    st.download_button(
+        "📦 Télécharger ma séance (.agora)",
+        data=export_session("seance").fournisseur(
+            lambda: (version_liste(messages_seance), etat_export["xp"], etat_export["final_feedback"]),
+            lambda: ecrire_seance(APP_ID, messages_seance, etat_export),
+        ),
+        file_name=f"Seance_PFMP_{student_name}.{EXTENSION_SEANCE}",
+        mime="application/octet-stream",
+        on_click="ignore",
+    )
+    fichier_seance = st.file_uploader("♻️ Reprendre une séance (.agora)", type=[EXTENSION_SEANCE])
+    if fichier_seance is not None:
+        contenu = fichier_seance.getvalue()
+        signature = empreinte(contenu)
+        if st.session_state.get("sauvegarde_restauree") != signature:
+            try:
+                entete, messages = lire_seance(BytesIO(contenu))
+                reprendre_seance(dict(entete, messages=list(messages)))
+                st.session_state.sauvegarde_restauree = signature
+                st.rerun()
+            except Exception as e:
+                st.error(f"Impossible d'importer le fichier : {e}")
+
     if st.button("🗑️ Reset"):
         st.session_state.messages = [{"role": "assistant", "content": INITIAL_MESSAGE}]
         st.session_state.xp = 0
         st.session_state.final_feedback = None
         st.rerun()
 
+autosauvegarde(student_name)
+
 # CHAT
-chat_container = st.container()
-with chat_container:
-    for msg in st.session_state.messages:
+# Un tour ne relance que ce fragment (et le badge d'XP) : le rappel du
+# chat_input ajoute le message, puis la réponse est diffusée sous
+# l'historique. Le chat_input reste hors du fragment pour être épinglé en
+# bas de page.
+def soumettre_reponse(student_name):
+    if not student_name:
+        st.toast("⚠️ Indique ton prénom !", icon="👉")
+        return
+    st.session_state.messages.append({"role": "user", "content": st.session_state.saisie_eleve})
+    update_xp(10)
+    st.session_state.reponse_attendue = True
+    st.rerun(["chat", "badge"])
+
+def tour_ia(profile_key):
+    with st.chat_message("assistant", avatar="🤖"):
+        # On utilise le prompt dynamique selon le profil choisi
+        current_system_prompt = get_system_prompt(profile_key)
+
+        # Message d'accueil épinglé, anciens échanges résumés, récents intacts
+        messages_payload = construire_contexte(
+            current_system_prompt,
+            st.session_state.messages,
+            st.session_state.resume_contexte,
+            resumer=partial(ia_groq.resumer_avec_ia, models=MODELES_IA),
+            budget=BUDGET_CONTEXTE,
+            n_epingles=1,
+        )
+
+        # Réponse diffusée au fil de l'eau dans la bulle
+        response_content, _ = stream_groq_with_rotation(messages_payload)
+        if not response_content:
+            response_content = "⚠️ Erreur IA."
+            st.markdown(response_content)
+
+    st.session_state.messages.append({"role": "assistant", "content": response_content})
+    if HAS_AUDIO:
+        get_lecteur_audio().precalculer(clean_text_for_audio(response_content))
+
+@st.fragment(key="chat")
+def zone_chat(profile_key, student_name):
+    for i, msg in enumerate(st.session_state.messages):
         role_avatar = "🤖" if msg["role"] == "assistant" else "🧑‍🎓"
         with st.chat_message(msg["role"], avatar=role_avatar):
             if "Voici mon document" in msg["content"]:
@@ -344,14 +447,18 @@ with chat_container:
             else:
                 st.markdown(msg["content"])
                 if msg["role"] == "assistant" and HAS_AUDIO:
-                    if st.button("🔊", key=str(random.randint(0,100000))): # Clé unique simple
+                    if st.button("🔊", key=f"tts_{i}"):
                         try:
-                            tts = gTTS(clean_text_for_audio(msg["content"]), lang="fr")
-                            buf = BytesIO()
-                            tts.write_to_fp(buf)
-                            st.audio(buf, format="audio/mp3", start_time=0)
+                            lire_a_voix_haute(clean_text_for_audio(msg["content"]))
                         except: pass
 
+    # Le document importé attend, lui, le prochain message de l'élève
+    if st.session_state.pop("reponse_attendue", False):
+        tour_ia(profile_key)
+        autosauvegarde(student_name)
+
+zone_chat(selected_profile, student_name)
+
 # AFFICHAGE DU FEEDBACK FINAL
 if st.session_state.final_feedback:
     st.markdown("---")
@@ -368,24 +475,5 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # INPUT
-if user_input := st.chat_input("Réponds au superviseur..."):
-    if not student_name:
-        st.toast("⚠️ Indique ton prénom !", icon="👉")
-    else:
-        st.session_state.messages.append({"role": "user", "content": user_input})
-        update_xp(10)
-        
-        with st.chat_message("assistant", avatar="🤖"):
-            with st.spinner("Analyse en cours..."):
-                # On utilise le prompt dynamique selon le profil choisi
-                current_system_prompt = get_system_prompt(selected_profile)
-                
-                messages_payload = [{"role": "system", "content": current_system_prompt}]
-                messages_payload.extend(st.session_state.messages[-8:])
-                
-                response_content, _ = query_groq_with_rotation(messages_payload)
-                if not response_content: response_content = "⚠️ Erreur IA."
-                st.markdown(response_content)
-        
-        st.session_state.messages.append({"role": "assistant", "content": response_content})
-        st.rerun()
+st.chat_input("Réponds au superviseur...", key="saisie_eleve",
+              on_submit=soumettre_reponse, args=(student_name,))
@@ -0,0 +1,317 @@
+# --- LECTURE AUDIO (TTS) ---
+# Synthèse vocale des réponses de l'IA, mise en cache sur disque.
+#   - Clé : empreinte du moteur et du texte nettoyé (clean_text_for_audio) ;
+#     un même message n'est synthétisé qu'une fois pour toute la classe.
+#   - Cache LRU borné en octets : les fichiers les moins récemment lus sont
+#     supprimés au-delà de la taille maximale.
+#   - Pré-synthèse : chaque nouvelle réponse part dans un thread de fond dès
+#     son affichage ; au clic sur « Lire », l'audio est déjà prêt.
+#   - Moteurs interchangeables : gTTS (réseau) ou espeak-ng (local, hors
+#     ligne), choisi par le secret `moteur_tts` ("auto" par défaut : espeak-ng
+#     s'il est installé, sinon gTTS).
+#   - Textes longs découpés en morceaux de quelques phrases, synthétisés en
+#     parallèle puis recollés : la réponse est lue en entier, et la lecture
+#     démarre dès que le premier morceau est prêt ; le même lecteur passe
+#     ensuite au texte entier, repris là où en est l'écoute.
+
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+import threading
+import time
+import wave
+from concurrent.futures import Future, ThreadPoolExecutor
+from io import BytesIO
+
+import streamlit as st
+
+try:
+    from gtts import gTTS
+    HAS_GTTS = True
+except ImportError:
+    HAS_GTTS = False
+
+ESPEAK = shutil.which("espeak-ng") or shutil.which("espeak")
+HAS_AUDIO = HAS_GTTS or ESPEAK is not None
+
+DOSSIER_CACHE = ".cache_audio"
+TAILLE_MAX_CACHE = 200 * 1024 * 1024  # octets
+WORKERS_PRESYNTHESE = 2
+WORKERS_MORCEAUX = 4
+TAILLE_MORCEAU = 250  # caractères, phrases entières
+DEBIT_GTTS = 32_000  # bits/s des MP3 de gTTS (débit constant)
+
+
+def cle_audio(texte: str, moteur="") -> str:
+    return hashlib.sha1(f"{moteur}\n{texte}".encode("utf-8")).hexdigest()
+
+
+def decouper_phrases(texte: str, taille=TAILLE_MORCEAU) -> list:
+    """Morceaux d'au plus `taille` caractères, coupés entre deux phrases
+    (une phrase plus longue reste entière)."""
+    morceaux, courant = [], ""
+    for phrase in re.split(r"(?<=[.!?…:;])\s+|\n+", texte):
+        phrase = phrase.strip()
+        if not phrase:
+            continue
+        if courant and len(courant) + 1 + len(phrase) > taille:
+            morceaux.append(courant)
+            courant = phrase
+        else:
+            courant = f"{courant} {phrase}" if courant else phrase
+    if courant:
+        morceaux.append(courant)
+    return morceaux
+
+
+# --- MOTEURS DE SYNTHÈSE ---
+
+class MoteurGTTS:
+    nom = "gtts"
+    format = "audio/mp3"
+
+    def synthetiser(self, texte: str) -> bytes:
+        buf = BytesIO()
+        gTTS(texte, lang="fr").write_to_fp(buf)
+        return buf.getvalue()
+
+    def assembler(self, morceaux) -> bytes:
+        # Des trames MP3 mises bout à bout restent un MP3 lisible
+        return b"".join(morceaux)
+
+    def duree(self, donnees: bytes) -> float:
+        return len(donnees) * 8 / DEBIT_GTTS
+
+
+class MoteurEspeak:
+    nom = "espeak"
+    format = "audio/wav"
+
+    def __init__(self, executable=ESPEAK, voix="fr"):
+        self.executable = executable
+        self.voix = voix
+
+    def synthetiser(self, texte: str) -> bytes:
+        return subprocess.run(
+            [self.executable, "-v", self.voix, "--stdin", "--stdout"],
+            input=texte.encode("utf-8"), capture_output=True, check=True, timeout=60,
+        ).stdout
+
+    def assembler(self, morceaux) -> bytes:
+        # Un seul en-tête WAV, les échantillons de chaque morceau à la suite
+        sortie = BytesIO()
+        with wave.open(sortie, "wb") as w:
+            for i, morceau in enumerate(morceaux):
+                with wave.open(BytesIO(morceau), "rb") as r:
+                    if i == 0:
+                        w.setparams(r.getparams())
+                    w.writeframes(r.readframes(r.getnframes()))
+        return sortie.getvalue()
+
+    def duree(self, donnees: bytes) -> float:
+        with wave.open(BytesIO(donnees), "rb") as r:
+            return r.getnframes() / r.getframerate()
+
+
+def choisir_moteur(nom="auto"):
+    """Moteur demandé s'il est installé, sinon l'autre ; None si aucun."""
+    if ESPEAK and (nom in ("auto", "espeak") or not HAS_GTTS):
+        return MoteurEspeak()
+    if HAS_GTTS:
+        return MoteurGTTS()
+    return None
+
+
+class CacheAudio:
+    def __init__(self, dossier=DOSSIER_CACHE, taille_max=TAILLE_MAX_CACHE):
+        self.dossier = dossier
+        self.taille_max = taille_max
+        self._lock = threading.Lock()
+        self._index = {}  # clé -> octets ; ordre d'insertion = ordre LRU
+        self.succes = 0
+        self.echecs = 0
+        os.makedirs(dossier, exist_ok=True)
+        # Reprise du cache existant, du moins au plus récemment lu
+        fichiers = []
+        for nom in os.listdir(dossier):
+            if nom.endswith(".audio"):
+                stat = os.stat(os.path.join(dossier, nom))
+                fichiers.append((stat.st_mtime, nom[:-6], stat.st_size))
+        for _, cle, taille in sorted(fichiers):
+            self._index[cle] = taille
+        self.octets = sum(self._index.values())
+
+    def _chemin(self, cle):
+        return os.path.join(self.dossier, f"{cle}.audio")
+
+    def lire(self, cle):
+        with self._lock:
+            if cle not in self._index:
+                self.echecs += 1
+                return None
+            self._index[cle] = self._index.pop(cle)  # le plus récent en dernier
+            self.succes += 1
+        try:
+            with open(self._chemin(cle), "rb") as f:
+                donnees = f.read()
+            os.utime(self._chemin(cle))  # ordre LRU gardé après redémarrage
+            return donnees
+        except OSError:
+            # Fichier supprimé à la main : compté comme absent
+            with self._lock:
+                self.octets -= self._index.pop(cle, 0)
+                self.succes -= 1
+                self.echecs += 1
+            return None
+
+    def contient(self, cle):
+        with self._lock:
+            return cle in self._index
+
+    def ecrire(self, cle, donnees: bytes):
+        temporaire = self._chemin(cle) + ".tmp"
+        with open(temporaire, "wb") as f:
+            f.write(donnees)
+        os.replace(temporaire, self._chemin(cle))
+        with self._lock:
+            self.octets += len(donnees) - self._index.pop(cle, 0)
+            self._index[cle] = len(donnees)
+            a_supprimer = []
+            while self.octets > self.taille_max and len(self._index) > 1:
+                ancienne = next(iter(self._index))
+                self.octets -= self._index.pop(ancienne)
+                a_supprimer.append(ancienne)
+        for ancienne in a_supprimer:
+            try:
+                os.remove(self._chemin(ancienne))
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            total = self.succes + self.echecs
+            return {
+                "fichiers": len(self._index),
+                "octets": self.octets,
+                "succes": self.succes,
+                "echecs": self.echecs,
+                "taux_succes": self.succes / total if total else 0.0,
+            }
+
+
+class LecteurAudio:
+    def __init__(self, cache, moteur=None, workers=WORKERS_PRESYNTHESE, workers_morceaux=WORKERS_MORCEAUX):
+        self.cache = cache
+        self.moteur = moteur or choisir_moteur()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tts")
+        # Pool à part pour les morceaux : une pré-synthèse qui attend ses
+        # morceaux n'occupe pas la place dont ils ont besoin
+        self._pool_morceaux = ThreadPoolExecutor(max_workers=workers_morceaux, thread_name_prefix="tts-morceau")
+        self._lock = threading.Lock()
+        self._en_cours = {}  # clé -> Future
+        self.presyntheses = 0
+
+    def _cle(self, texte):
+        return cle_audio(texte, self.moteur.nom)
+
+    def _lancer_morceaux(self, texte):
+        return [self._pool_morceaux.submit(self.moteur.synthetiser, m) for m in decouper_phrases(texte)]
+
+    def _terminer(self, cle, morceaux, futur):
+        # Texte entier : assemblé, mis en cache, puis rendu à ceux qui attendent
+        try:
+            donnees = self.moteur.assembler([f.result() for f in morceaux])
+            self.cache.ecrire(cle, donnees)
+            futur.set_result(donnees)
+        except Exception as e:
+            futur.set_exception(e)
+        finally:
+            with self._lock:
+                self._en_cours.pop(cle, None)
+
+    def _reserver(self, cle, texte):
+        """Morceaux lancés et futur du texte entier enregistré, ou None si
+        le texte est déjà en cache ou en cours (à appeler sous le verrou)."""
+        if cle in self._en_cours or self.cache.contient(cle):
+            return None
+        morceaux = self._lancer_morceaux(texte)
+        if not morceaux:
+            return None
+        self._en_cours[cle] = Future()
+        return morceaux
+
+    def precalculer(self, texte: str):
+        """Lance la synthèse en tâche de fond si l'audio n'est pas déjà là."""
+        if not texte.strip():
+            return
+        cle = self._cle(texte)
+        with self._lock:
+            morceaux = self._reserver(cle, texte)
+            if morceaux is None:
+                return
+            self._pool.submit(self._terminer, cle, morceaux, self._en_cours[cle])
+            self.presyntheses += 1
+
+    def lecture(self, texte: str):
+        """Audio du texte : le texte entier s'il est en cache ou en cours de
+        synthèse, sinon le premier morceau dès qu'il est prêt, puis le texte
+        entier (premier morceau compris)."""
+        cle = self._cle(texte)
+        donnees = self.cache.lire(cle)
+        if donnees is not None:
+            yield donnees
+            return
+        with self._lock:
+            # Enregistrée comme une pré-synthèse : le même texte n'est
+            # jamais synthétisé deux fois en même temps
+            morceaux = self._reserver(cle, texte)
+            futur = self._en_cours.get(cle)
+        if futur is None:
+            # Terminée entre-temps (ou texte vide)
+            donnees = self.cache.lire(cle)
+            if donnees is not None:
+                yield donnees
+            return
+        if morceaux is not None:
+            termine = False
+            try:
+                if len(morceaux) > 1:
+                    yield morceaux[0].result()
+                self._terminer(cle, morceaux, futur)
+                termine = True
+            finally:
+                if not termine:
+                    # Lecture abandonnée en route (page relancée) : la
+                    # synthèse est finie en fond pour les autres
+                    self._pool.submit(self._terminer, cle, morceaux, futur)
+        yield futur.result()
+
+    def stats(self):
+        return dict(self.cache.stats(), presyntheses=self.presyntheses, moteur=self.moteur.nom)
+
+
+@st.cache_resource
+def get_lecteur_audio():
+    cache = CacheAudio(
+        st.secrets.get("cache_audio", DOSSIER_CACHE),
+        int(st.secrets.get("cache_audio_mo", TAILLE_MAX_CACHE // (1024 * 1024))) * 1024 * 1024,
+    )
+    return LecteurAudio(cache, choisir_moteur(st.secrets.get("moteur_tts", "auto")))
+
+
+def lire_a_voix_haute(texte: str):
+    """Un seul lecteur audio dans la page. Si l'audio n'est pas prêt, il
+    joue d'abord le premier morceau, puis passe au texte entier là où en
+    est l'écoute (arrondi à la seconde inférieure : rien n'est sauté)."""
+    lecteur = get_lecteur_audio()
+    zone = st.empty()
+    premier = debut = None
+    for donnees in lecteur.lecture(texte):
+        if premier is None:
+            zone.audio(donnees, format=lecteur.moteur.format, autoplay=True)
+            premier, debut = donnees, time.monotonic()
+        else:
+            position = min(time.monotonic() - debut, lecteur.moteur.duree(premier))
+            zone.audio(donnees, format=lecteur.moteur.format, autoplay=True, start_time=position)
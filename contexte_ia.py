@@ -0,0 +1,181 @@
+# --- FENÊTRE DE CONTEXTE ---
+# Construit la liste de messages envoyée au modèle, à taille bornée quelle
+# que soit la durée de la séance :
+#   prompt système + cadrage de mission (épinglés)
+#   + résumé glissant des anciens échanges
+#   + derniers échanges recopiés tels quels (jamais coupés en deux).
+# Le résumé est gardé en session et n'est recalculé que lorsque des
+# échanges sortent de la fenêtre. Le résumé par l'IA tourne en fond, hors
+# du chemin de la réponse : le tour en cours part tout de suite avec le
+# résumé précédent complété d'un résumé extractif des échanges sortis, et
+# le résumé de l'IA le remplace au tour suivant s'il est prêt.
+
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+BUDGET_CONTEXTE = 3000   # jetons pour tout ce qui est envoyé
+MARGE_RESUME = 0.3       # après un résumé, la fenêtre n'occupe que 30 % de la place libre
+SURCOUT_MESSAGE = 4      # jetons de structure par message (rôle, séparateurs)
+LONGUEUR_MAX_RESUME = 2400  # caractères gardés par le résumé de repli
+WORKERS_RESUME = 2
+
+_pool_resume = ThreadPoolExecutor(max_workers=WORKERS_RESUME, thread_name_prefix="resume")
+
+PROMPT_RESUME = """Tu tiens le fil d'une séance de tutorat entre un superviseur et un élève de Bac Pro AGOrA.
+
+RÉSUMÉ ACTUEL :
+{resume}
+
+NOUVEAUX ÉCHANGES À INTÉGRER :
+{echanges}
+
+Réécris le résumé en intégrant les nouveaux échanges. Garde : la mission en cours,
+les données fournies (chiffres, dates, noms fictifs), ce que l'élève a produit,
+les erreurs relevées et la prochaine étape. 12 lignes maximum, style télégraphique."""
+
+
+def compter_tokens(texte) -> int:
+    # Estimation sans tokenizer : environ 4 caractères par jeton
+    return (len(texte or "") + 3) // 4
+
+
+def tokens_message(message) -> int:
+    return compter_tokens(message.get("content")) + SURCOUT_MESSAGE
+
+
+def tokens_messages(messages) -> int:
+    return sum(tokens_message(m) for m in messages)
+
+
+def nouvel_etat_resume():
+    # base : dernier résumé de l'IA, qui couvre les messages avant base_jusqua
+    # texte : base + lignes extractives des messages sortis depuis (envoyé)
+    # travail : résumé de l'IA en cours en fond (futur, jusqua, ancre) ou None
+    return {"texte": "", "jusqua": 0, "ancre": None, "base": "", "base_jusqua": 0, "travail": None}
+
+
+def _ancre(messages):
+    if not messages:
+        return None
+    return hashlib.sha1((messages[0].get("content") or "").encode("utf-8")).hexdigest()
+
+
+def _debut_fenetre(messages, debut_min, budget):
+    """Premier indice à recopier tel quel pour tenir dans `budget` (le dernier
+    message est toujours gardé)."""
+    total = 0
+    debut = len(messages)
+    while debut > debut_min:
+        cout = tokens_message(messages[debut - 1])
+        if total + cout > budget and debut < len(messages):
+            break
+        total += cout
+        debut -= 1
+    return debut
+
+
+def resume_extractif(resume, messages, longueur=200):
+    """Repli sans IA : `resume` gardé en entier, suivi du début de chaque
+    message sorti de la fenêtre. Au-delà de LONGUEUR_MAX_RESUME, ce sont
+    les lignes extractives les plus anciennes qui partent, jamais le
+    résumé."""
+    lignes = []
+    for m in messages:
+        texte = " ".join((m.get("content") or "").split())
+        lignes.append(f"- {m['role']} : {texte[:longueur]}")
+    place = LONGUEUR_MAX_RESUME - (len(resume) + 1 if resume else 0)
+    gardees, taille = [], 0
+    for ligne in reversed(lignes):
+        taille += len(ligne) + 1
+        if taille > place + 1:
+            break
+        gardees.append(ligne)
+    return "\n".join(([resume] if resume else []) + gardees[::-1])
+
+
+def formater_echanges(messages):
+    return "\n".join(f"{m['role'].upper()} : {m.get('content') or ''}" for m in messages)
+
+
+def _lancer_resume(etat_resume, messages, resumer):
+    # Un seul résumé en fond par séance ; il couvre tout ce que la base ne
+    # couvre pas encore
+    if resumer is None or etat_resume["travail"] is not None \
+            or etat_resume["jusqua"] <= etat_resume["base_jusqua"]:
+        return
+    etat_resume["travail"] = {
+        "futur": _pool_resume.submit(
+            resumer, etat_resume["base"], messages[etat_resume["base_jusqua"]:etat_resume["jusqua"]]
+        ),
+        "jusqua": etat_resume["jusqua"],
+        "ancre": etat_resume["ancre"],
+    }
+
+
+def _integrer_resume(etat_resume, messages, resumer):
+    """Résumé de l'IA terminé en fond : il devient la base. Les échanges
+    sortis pendant son calcul restent en extractif derrière lui, et un
+    résumé de suivi est lancé pour eux."""
+    travail = etat_resume["travail"]
+    if travail is None or not travail["futur"].done():
+        return
+    etat_resume["travail"] = None
+    try:
+        texte = travail["futur"].result()
+    except Exception:
+        texte = None
+    if not texte or travail["ancre"] != etat_resume["ancre"]:
+        return
+    etat_resume.update(base=texte, base_jusqua=travail["jusqua"])
+    etat_resume["texte"] = resume_extractif(texte, messages[travail["jusqua"]:etat_resume["jusqua"]])
+    _lancer_resume(etat_resume, messages, resumer)
+
+
+def construire_contexte(system_prompt, messages, etat_resume, resumer=None,
+                        budget=BUDGET_CONTEXTE, n_epingles=1, suffixe=None):
+    """Messages à envoyer au modèle.
+
+    `etat_resume` (dict de nouvel_etat_resume, gardé en session) est mis à
+    jour sur place. `resumer(resume, messages) -> str` produit le nouveau
+    résumé, dans un thread de fond ; en attendant (et à défaut) on utilise
+    resume_extractif. `suffixe` : messages ajoutés à la fin (consigne du
+    tour), comptés dans le budget.
+    """
+    suffixe = list(suffixe or [])
+    systeme = [{"role": "system", "content": system_prompt}] if system_prompt else []
+    n_epingles = min(n_epingles, len(messages))
+    epingles = [{"role": m["role"], "content": m["content"]} for m in messages[:n_epingles]]
+
+    # Nouvelle mission, reset ou restauration : le résumé ne vaut plus
+    ancre = _ancre(messages)
+    if etat_resume.get("ancre") != ancre or etat_resume.get("jusqua", 0) > len(messages) \
+            or "base" not in etat_resume:
+        etat_resume.update(texte="", jusqua=n_epingles, ancre=ancre, base="", base_jusqua=n_epingles, travail=None)
+    etat_resume["jusqua"] = max(etat_resume["jusqua"], n_epingles)
+    etat_resume["base_jusqua"] = max(etat_resume["base_jusqua"], n_epingles)
+    _integrer_resume(etat_resume, messages, resumer)
+
+    fixe = tokens_messages(systeme) + tokens_messages(epingles) + tokens_messages(suffixe)
+    dispo = budget - fixe - compter_tokens(etat_resume["texte"]) - SURCOUT_MESSAGE
+    debut = _debut_fenetre(messages, etat_resume["jusqua"], dispo)
+
+    if debut > etat_resume["jusqua"]:
+        # Des échanges sortent de la fenêtre : on en sort assez d'un coup
+        # (place comptée pour un résumé de taille maximale) pour que les
+        # tours suivants aient de quoi s'ajouter avant le prochain résumé.
+        libre = budget - fixe - compter_tokens("x" * LONGUEUR_MAX_RESUME) - SURCOUT_MESSAGE
+        debut = max(debut, _debut_fenetre(messages, etat_resume["jusqua"], int(libre * MARGE_RESUME)))
+        etat_resume["jusqua"] = debut
+        etat_resume["texte"] = resume_extractif(
+            etat_resume["base"], messages[etat_resume["base_jusqua"]:debut]
+        )
+        _lancer_resume(etat_resume, messages, resumer)
+
+    contexte = systeme + epingles
+    if etat_resume["texte"]:
+        contexte.append({
+            "role": "system",
+            "content": f"RÉSUMÉ DES ÉCHANGES PRÉCÉDENTS :\n{etat_resume['texte']}",
+        })
+    contexte += [{"role": m["role"], "content": m["content"]} for m in messages[etat_resume["jusqua"]:]]
+    return contexte + suffixe
@@ -0,0 +1,403 @@
+# --- DOCUMENTS DES ÉLÈVES ---
+# Lecture des fichiers rendus (Word, Excel, CSV) pour le prompt.
+#   - Word : le XML du document est parcouru au fil de l'eau, paragraphes et
+#     tableaux dans l'ordre où ils apparaissent (les tableaux comparatifs des
+#     élèves sont lus, une ligne par rangée). La lecture s'arrête dès que le
+#     budget de caractères est atteint : un long rapport ne coûte pas plus
+#     qu'un court.
+#   - L'extraction tourne dans un thread de fond dès le dépôt du fichier,
+#     avec une progression affichée dans le fragment de dépôt ; le reste de
+#     l'interface reste utilisable.
+#   - Tableurs (xlsx, xls, csv) : lus en flux (openpyxl en lecture seule,
+#     CSV par paquets de lignes), toutes les feuilles. Le modèle reçoit un
+#     résumé compact : colonnes, type déduit, statistiques par colonne, puis
+#     les premières et dernières lignes dans ce qui reste du budget. Un gros
+#     classeur coûte autant à envoyer qu'un petit.
+#   - Résultat gardé par empreinte du contenu : renvoyer le même fichier ne
+#     le relit jamais.
+
+import os
+import re
+import threading
+import time
+import xml.etree.ElementTree as ET
+import zipfile
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from io import BytesIO
+
+import pandas as pd
+import streamlit as st
+
+from sauvegarde import empreinte
+
+W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+MARQUE_TRONQUE = "\n[… suite du document non lue]"
+WORKERS_EXTRACTION = 2
+TAILLE_CACHE = 64  # documents gardés
+INTERVALLE_SUIVI = 0.3  # secondes entre deux rafraîchissements de la progression
+
+LIGNES_PAQUET = 5000     # lignes de tableur traitées d'un coup
+LIGNES_DEBUT = 5         # lignes montrées en tête de feuille…
+LIGNES_FIN = 3           # …et en fin de feuille, si le budget le permet
+MODALITES_MAX = 50       # au-delà, une colonne texte n'est plus une catégorie
+MODALITES_AFFICHEES = 5
+PART_TYPE = 0.9          # part des valeurs qu'un type doit couvrir pour être retenu
+RE_DATE = re.compile(r"^\d{1,4}[/.-]\d{1,2}[/.-]\d{1,4}")
+
+
+class _FluxCompte:
+    """Flux en lecture qui compte les octets lus (progression)."""
+
+    def __init__(self, flux, total, suivi):
+        self.flux = flux
+        self.total = max(total, 1)
+        self.suivi = suivi
+        self.lu = 0
+
+    def read(self, n=-1):
+        donnees = self.flux.read(n)
+        self.lu += len(donnees)
+        if self.suivi is not None:
+            self.suivi.progression = min(self.lu / self.total, 1.0)
+        return donnees
+
+
+def blocs_docx(contenu: bytes, suivi=None):
+    """Paragraphes et rangées de tableaux du corps du document, dans l'ordre.
+    Les cellules sont séparées par « | » ; un tableau imbriqué est aplati
+    dans la cellule qui le contient."""
+    with zipfile.ZipFile(BytesIO(contenu)) as z:
+        info = z.getinfo("word/document.xml")
+        with z.open(info) as xml:
+            cellules = []  # une liste de cellules par tableau ouvert (rangée en cours)
+            parties = []   # paragraphes de la cellule en cours, par tableau ouvert
+            texte = []
+            for evenement, el in ET.iterparse(_FluxCompte(xml, info.file_size, suivi), events=("start", "end")):
+                balise = el.tag
+                if evenement == "start":
+                    if balise == W + "tbl":
+                        cellules.append([])
+                        parties.append([])
+                    continue
+                if balise == W + "t":
+                    texte.append(el.text or "")
+                elif balise == W + "tab":
+                    texte.append("\t")
+                elif balise in (W + "br", W + "cr"):
+                    texte.append("\n")
+                elif balise == W + "p":
+                    paragraphe = "".join(texte).strip()
+                    texte = []
+                    if parties:
+                        parties[-1].append(paragraphe)
+                    elif paragraphe:
+                        yield paragraphe
+                    el.clear()
+                elif balise == W + "tc":
+                    cellules[-1].append(" ".join(p for p in parties[-1] if p))
+                    parties[-1] = []
+                elif balise == W + "tr":
+                    rangee = cellules[-1]
+                    cellules[-1] = []
+                    if any(rangee):
+                        ligne = " | ".join(rangee)
+                        if len(cellules) == 1:
+                            yield ligne
+                        else:
+                            parties[-2].append(ligne)
+                    el.clear()
+                elif balise == W + "tbl":
+                    cellules.pop()
+                    parties.pop()
+                    el.clear()
+
+
+def _dans_budget(blocs, budget):
+    morceaux, taille = [], 0
+    for bloc in blocs:
+        if taille + len(bloc) > budget:
+            morceaux.append(bloc[:max(budget - taille, 0)])
+            return "\n".join(morceaux) + MARQUE_TRONQUE
+        morceaux.append(bloc)
+        taille += len(bloc) + 1
+    return "\n".join(morceaux)
+
+
+# --- TABLEURS : SCHÉMA ET RÉSUMÉ ---
+
+def _nombre(v):
+    return f"{v:.6g}" if isinstance(v, float) else str(v)
+
+
+def _case(v) -> str:
+    if v is None or (isinstance(v, float) and v != v):
+        return ""
+    if isinstance(v, datetime):
+        return v.strftime("%Y-%m-%d") if v.time() == datetime.min.time() else v.isoformat(sep=" ")
+    return str(v).replace("|", "/").replace("\n", " ").strip()
+
+
+class _StatsColonne:
+    """Statistiques d'une colonne, accumulées paquet par paquet."""
+
+    def __init__(self, nom):
+        self.nom = nom
+        self.lignes = 0
+        self.vides = 0
+        self.nombres = 0
+        self.somme = 0.0
+        self.min = None
+        self.max = None
+        self.dates = 0
+        self.date_min = None
+        self.date_max = None
+        self.modalites = Counter()
+        self.trop_de_modalites = False
+
+    def ajouter(self, serie: pd.Series):
+        n = len(serie)
+        self.lignes += n
+        serie = serie[serie.notna()]
+        types = serie.map(type)
+        nombres = serie[types.isin((int, float))].astype(float)
+        dates = serie[types.isin((datetime, date))]
+        textes = serie[~types.isin((int, float, datetime, date))].astype(str).str.strip()
+        textes = textes[textes != ""]
+        self.vides += n - len(nombres) - len(dates) - len(textes)
+
+        # Texte qui est en fait un nombre (« 12,50 », « 1 250 ») ou une date
+        convertis = pd.to_numeric(
+            textes.str.replace("[\\s\u202f]", "", regex=True).str.replace(",", ".", regex=False),
+            errors="coerce",
+        ).dropna()
+        nombres = pd.concat([nombres, convertis])
+        textes = textes.drop(convertis.index)
+        en_date = textes[textes.str.match(RE_DATE)]
+        if len(en_date):
+            lues = pd.to_datetime(en_date, errors="coerce", dayfirst=True, format="mixed").dropna()
+            dates = pd.concat([pd.to_datetime(dates), lues])
+            textes = textes.drop(lues.index)
+
+        if len(nombres):
+            self.nombres += len(nombres)
+            self.somme += float(nombres.sum())
+            self.min = nombres.min() if self.min is None else min(self.min, nombres.min())
+            self.max = nombres.max() if self.max is None else max(self.max, nombres.max())
+        if len(dates):
+            dates = pd.to_datetime(dates)
+            self.dates += len(dates)
+            self.date_min = dates.min() if self.date_min is None else min(self.date_min, dates.min())
+            self.date_max = dates.max() if self.date_max is None else max(self.date_max, dates.max())
+        if not self.trop_de_modalites and len(textes):
+            self.modalites.update(textes.value_counts().to_dict())
+            if len(self.modalites) > MODALITES_MAX:
+                self.trop_de_modalites = True
+                self.modalites.clear()
+
+    def description(self) -> str:
+        remplies = self.lignes - self.vides
+        vides = f", {self.vides} vide(s)" if self.vides else ""
+        if not remplies:
+            return f"{self.nom} (vide)"
+        if self.nombres >= PART_TYPE * remplies:
+            return (f"{self.nom} (nombre, min {_nombre(self.min)}, max {_nombre(self.max)}, "
+                    f"moyenne {self.somme / self.nombres:.4g}{vides})")
+        if self.dates >= PART_TYPE * remplies:
+            return (f"{self.nom} (date, du {self.date_min:%Y-%m-%d} "
+                    f"au {self.date_max:%Y-%m-%d}{vides})")
+        if self.trop_de_modalites:
+            return f"{self.nom} (texte, valeurs variées{vides})"
+        frequentes = ", ".join(f"{v} ×{n}" for v, n in self.modalites.most_common(MODALITES_AFFICHEES))
+        autres = len(self.modalites) - MODALITES_AFFICHEES
+        suite = f", +{autres} autre(s)" if autres > 0 else ""
+        return f"{self.nom} (catégorie, {len(self.modalites)} valeur(s) : {frequentes}{suite}{vides})"
+
+
+class _ResumeFeuille:
+    def __init__(self, nom, colonnes):
+        self.nom = nom
+        self.colonnes = [str(c) if c is not None and str(c).strip() else f"Colonne {i + 1}"
+                         for i, c in enumerate(colonnes)]
+        self.stats = [_StatsColonne(c) for c in self.colonnes]
+        self.lignes = 0
+        self.debut = []
+        self.fin = deque(maxlen=LIGNES_FIN)
+
+    def ajouter(self, paquet: pd.DataFrame):
+        if paquet.empty:
+            return
+        for i, stats in enumerate(self.stats):
+            stats.ajouter(paquet.iloc[:, i])
+        # Seules les lignes qui peuvent être montrées sont mises en texte
+        manque = max(LIGNES_DEBUT - len(self.debut), 0)
+        self.debut += [self._rangee(r) for r in paquet.iloc[:manque].itertuples(index=False)]
+        self.fin.extend(self._rangee(r) for r in paquet.iloc[manque:].tail(LIGNES_FIN).itertuples(index=False))
+        self.lignes += len(paquet)
+
+    @staticmethod
+    def _rangee(valeurs) -> str:
+        return " | ".join(_case(v) for v in valeurs)
+
+    def texte(self, n_debut, n_fin) -> str:
+        lignes = [f"Feuille « {self.nom} » : {self.lignes} ligne(s) × {len(self.colonnes)} colonne(s)", "Colonnes :"]
+        lignes += [f"- {s.description()}" for s in self.stats]
+        debut = self.debut[:n_debut]
+        fin = list(self.fin)[-n_fin:] if n_fin and self.lignes > len(self.debut) else []
+        if debut:
+            lignes.append("Premières lignes :")
+            lignes.append(" | ".join(self.colonnes))
+            lignes += debut
+        if fin:
+            lignes.append("Dernières lignes :")
+            lignes += fin
+        return "\n".join(lignes)
+
+
+def _feuilles_xlsx(contenu: bytes, suivi=None):
+    from openpyxl import load_workbook
+
+    classeur = load_workbook(BytesIO(contenu), read_only=True, data_only=True)
+    try:
+        for n, ws in enumerate(classeur.worksheets):
+            rangees = ws.iter_rows(values_only=True)
+            entete = next((r for r in rangees if any(v is not None for v in r)), None)
+            if entete is None:
+                continue
+            feuille = _ResumeFeuille(ws.title, entete)
+            largeur = len(entete)
+            total = max(ws.max_row or 1, 1)
+            paquet = []
+            for rangee in rangees:
+                if any(v is not None for v in rangee):
+                    paquet.append((rangee + (None,) * largeur)[:largeur])
+                if len(paquet) == LIGNES_PAQUET:
+                    feuille.ajouter(pd.DataFrame(paquet, dtype=object))
+                    paquet = []
+                    if suivi is not None:
+                        suivi.progression = (n + min(feuille.lignes / total, 1.0)) / len(classeur.worksheets)
+            feuille.ajouter(pd.DataFrame(paquet, dtype=object))
+            yield feuille
+    finally:
+        classeur.close()
+
+
+def _feuilles_csv(contenu: bytes, suivi=None):
+    # Séparateur deviné sur la première ligne (les CSV français sont en « ; »)
+    premiere = contenu[:4096].split(b"\n", 1)[0]
+    sep = max((";", ",", "\t"), key=lambda c: premiere.count(c.encode()))
+    flux = _FluxCompte(BytesIO(contenu), len(contenu), suivi)
+    paquets = pd.read_csv(flux, sep=sep, dtype=str, keep_default_na=False,
+                          chunksize=LIGNES_PAQUET, encoding="utf-8-sig")
+    feuille = None
+    for paquet in paquets:
+        if feuille is None:
+            feuille = _ResumeFeuille("CSV", paquet.columns)
+        feuille.ajouter(paquet)
+    if feuille is not None:
+        yield feuille
+
+
+def _feuilles_xls(contenu: bytes, suivi=None):
+    # Ancien format binaire : pas de lecture en flux, une feuille à la fois
+    for nom, df in pd.read_excel(BytesIO(contenu), sheet_name=None, dtype=object).items():
+        feuille = _ResumeFeuille(nom, df.columns)
+        for debut in range(0, len(df), LIGNES_PAQUET):
+            feuille.ajouter(df.iloc[debut:debut + LIGNES_PAQUET])
+        yield feuille
+
+
+def resume_tableur(contenu: bytes, nom: str, budget: int, suivi=None) -> str:
+    """Schéma et statistiques de chaque feuille, puis un extrait début/fin
+    aussi long que le budget (en caractères) le permet."""
+    ext = os.path.splitext(nom)[1].lower()
+    lecteur = {".csv": _feuilles_csv, ".xls": _feuilles_xls}.get(ext, _feuilles_xlsx)
+    feuilles = list(lecteur(contenu, suivi))
+    if not feuilles:
+        return "Tableur vide."
+    # Extrait le plus long qui tient dans le budget, schéma toujours inclus
+    for n_debut, n_fin in [(LIGNES_DEBUT, LIGNES_FIN), (3, 2), (2, 1), (1, 0), (0, 0)]:
+        texte = "\n\n".join(f.texte(n_debut, n_fin) for f in feuilles)
+        if len(texte) <= budget:
+            return texte
+    return texte[:budget] + MARQUE_TRONQUE
+
+
+def extraire_texte(contenu: bytes, nom: str, budget: int, suivi=None) -> str:
+    ext = os.path.splitext(nom)[1].lower()
+    if ext == ".docx":
+        try:
+            return _dans_budget(blocs_docx(contenu, suivi), budget)
+        except Exception as e:
+            return f"ERREUR LECTURE DOCX : {e}"
+    if ext in (".xlsx", ".xls", ".csv"):
+        try:
+            return resume_tableur(contenu, nom, budget, suivi)
+        except Exception as e:
+            return f"ERREUR LECTURE TABLEUR : {e}"
+    return "Format non supporté."
+
+
+# --- EXTRACTION EN TÂCHE DE FOND ---
+
+class Extraction:
+    def __init__(self):
+        self.progression = 0.0
+        self.futur = None
+
+    def prete(self):
+        return self.futur.done()
+
+    def texte(self) -> str:
+        return self.futur.result()
+
+
+class ExtracteurDocuments:
+    def __init__(self, workers=WORKERS_EXTRACTION, taille_cache=TAILLE_CACHE):
+        self.taille_cache = taille_cache
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="extraction")
+        self._lock = threading.Lock()
+        self._taches = OrderedDict()  # (empreinte, extension, budget) -> Extraction
+        self.lectures = 0
+        self.reutilisees = 0
+
+    def lancer(self, contenu: bytes, nom: str, budget: int) -> Extraction:
+        """Extraction du fichier : celle déjà faite (ou en cours) pour ce
+        contenu, sinon une nouvelle, lancée en fond."""
+        cle = (empreinte(contenu), os.path.splitext(nom)[1].lower(), budget)
+        with self._lock:
+            tache = self._taches.get(cle)
+            if tache is not None:
+                self._taches.move_to_end(cle)
+                self.reutilisees += 1
+                return tache
+            tache = Extraction()
+            tache.futur = self._pool.submit(extraire_texte, contenu, nom, budget, tache)
+            self._taches[cle] = tache
+            self.lectures += 1
+            while len(self._taches) > self.taille_cache:
+                self._taches.popitem(last=False)
+        return tache
+
+    def stats(self):
+        with self._lock:
+            return {"lectures": self.lectures, "reutilisees": self.reutilisees, "en_cache": len(self._taches)}
+
+
+@st.cache_resource
+def get_extracteur():
+    return ExtracteurDocuments()
+
+
+def suivre_extraction(tache: Extraction):
+    """Barre de progression jusqu'à la fin de l'extraction. L'attente se fait
+    par petits pas : un clic ailleurs pendant ce temps interrompt l'exécution
+    en cours au prochain rafraîchissement, l'extraction continue en fond."""
+    if tache.prete():
+        return
+    barre = st.progress(tache.progression, text="Lecture du document…")
+    while not tache.prete():
+        time.sleep(INTERVALLE_SUIVI)
+        barre.progress(tache.progression, text="Lecture du document…")
+    barre.empty()
@@ -0,0 +1,94 @@
+# --- EXPORTS À LA DEMANDE ---
+# Les fichiers à télécharger (CSV de sauvegarde, Word du bilan) ne sont plus
+# produits à chaque exécution du script : st.download_button reçoit une
+# fonction appelée au clic, et le résultat est gardé tant que la version du
+# contenu n'a pas changé. Une session qu'on re-télécharge sans nouveaux
+# échanges n'est jamais re-sérialisée.
+#
+# La fonction tourne dans un thread à part, sans accès à st.session_state :
+# la version et le contenu sont lus sur les objets capturés au rendu (listes
+# de messages ou de logs, qui ne font que grandir).
+
+import csv
+import io
+import threading
+
+import streamlit as st
+
+
+class ExportMemo:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._donnees = None
+        self.constructions = 0
+        self.telechargements = 0
+
+    def fournisseur(self, version, construire):
+        """Callable sans argument pour `data=` de st.download_button.
+        `version()` renvoie une valeur comparable qui change avec le contenu,
+        `construire()` produit les octets du fichier."""
+        def fournir():
+            v = version()
+            with self._lock:
+                self.telechargements += 1
+                if self._donnees is None or self._version != v:
+                    self._donnees = construire()
+                    self._version = v
+                    self.constructions += 1
+                return self._donnees
+        return fournir
+
+
+def version_liste(*listes):
+    # Listes en ajout seul : identité (reset, restauration) et longueur
+    return tuple((id(liste), len(liste)) for liste in listes)
+
+
+def export_session(nom: str) -> ExportMemo:
+    cle = f"export_{nom}"
+    if cle not in st.session_state:
+        st.session_state[cle] = ExportMemo()
+    return st.session_state[cle]
+
+
+class JournalCSV:
+    """Journal de séance en ajout seul. Chaque ligne est encodée une seule
+    fois, au moment où elle est ajoutée : le coût d'un tour ne dépend pas de
+    la longueur de la séance. Format identique à
+    DataFrame.to_csv(index=False, sep=';').encode('utf-8-sig'), donc les
+    sauvegardes restent rechargeables."""
+
+    def __init__(self, colonnes, sep=";"):
+        self.colonnes = list(colonnes)
+        self.sep = sep
+        self._blocs = []  # octets déjà encodés, une ou plusieurs lignes par bloc
+        self._n = 0
+        self._entete = "\ufeff".encode("utf-8") + self._encoder(self.colonnes)
+
+    def _encoder(self, valeurs):
+        tampon = io.StringIO()
+        csv.writer(tampon, delimiter=self.sep, lineterminator="\n").writerow(
+            "" if v is None else v for v in valeurs
+        )
+        return tampon.getvalue().encode("utf-8")
+
+    def ajouter(self, ligne: dict):
+        self._blocs.append(self._encoder(ligne.get(c) for c in self.colonnes))
+        self._n += 1
+
+    def ajouter_bloc(self, df):
+        # Reprise d'une sauvegarde : tout le DataFrame encodé d'un coup
+        if len(df):
+            self._blocs.append(df[self.colonnes].to_csv(
+                index=False, header=False, sep=self.sep, lineterminator="\n"
+            ).encode("utf-8"))
+            self._n += len(df)
+
+    def __len__(self):
+        return self._n
+
+    def contenu(self) -> bytes:
+        # Instantané : un ajout pendant le téléchargement n'est pas coupé
+        n = len(self._blocs)
+        return self._entete + b"".join(self._blocs[:n])
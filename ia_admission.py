@@ -0,0 +1,168 @@
+# --- CONTRÔLE D'ADMISSION DE LA CLASSE ---
+# Tous les appels IA du processus passent par ici avant de partir chez Groq.
+# Seaux à jetons par clé et par (clé, modèle), dimensionnés sur les limites
+# du fournisseur, et file d'attente équitable : le plus ancien ticket est
+# servi en premier dès qu'une paire a de la capacité. On évite ainsi que les
+# reprises de 30 sessions n'entretiennent une tempête de 429.
+
+import itertools
+import threading
+import time
+
+from contexte_ia import tokens_messages
+
+# Limites Groq par modèle (offre gratuite) : requêtes et jetons par minute
+LIMITES_MODELES = {
+    "llama-3.3-70b-versatile": {"rpm": 30, "tpm": 12000},
+    "llama-3.1-8b-instant": {"rpm": 30, "tpm": 6000},
+    "llama3-8b-8192": {"rpm": 30, "tpm": 6000},
+    "mixtral-8x7b-32768": {"rpm": 30, "tpm": 5000},
+}
+LIMITE_MODELE_DEFAUT = {"rpm": 30, "tpm": 6000}
+RPM_PAR_CLE = 60
+
+ATTENTE_MAX_SONDAGE = 0.5  # secondes entre deux vérifications de la file
+
+
+def estimer_tokens(messages, max_tokens=None):
+    # Prompt estimé plus la réponse attendue
+    return tokens_messages(messages) + (max_tokens or 1024)
+
+
+class SeauJetons:
+    def __init__(self, capacite, par_minute):
+        self.capacite = float(capacite)
+        self.debit = par_minute / 60.0
+        self.niveau = float(capacite)
+        self.maj = time.monotonic()
+
+    def _remplir(self, now):
+        self.niveau = min(self.capacite, self.niveau + (now - self.maj) * self.debit)
+        self.maj = now
+
+    def disponible(self, cout, now):
+        self._remplir(now)
+        return self.niveau >= min(cout, self.capacite)
+
+    def prendre(self, cout):
+        self.niveau -= min(cout, self.capacite)
+
+
+class ControleurAdmission:
+    def __init__(self, limites_modeles=None, rpm_par_cle=RPM_PAR_CLE):
+        self.limites_modeles = dict(LIMITES_MODELES, **(limites_modeles or {}))
+        self.rpm_par_cle = rpm_par_cle
+        self._cond = threading.Condition()
+        self._tickets = itertools.count(1)
+        self._attente = {}   # ticket -> (candidats, cout)
+        self._accords = {}   # ticket -> paire attribuée
+        self._seaux_cles = {}
+        self._seaux_paires = {}
+        self.admis = 0
+        self.attente_max = 0
+
+    def nouveau_ticket(self):
+        return next(self._tickets)
+
+    def _seaux(self, key, model):
+        seau_cle = self._seaux_cles.get(key)
+        if seau_cle is None:
+            seau_cle = self._seaux_cles[key] = SeauJetons(self.rpm_par_cle, self.rpm_par_cle)
+        paire = self._seaux_paires.get((key, model))
+        if paire is None:
+            limites = self.limites_modeles.get(model, LIMITE_MODELE_DEFAUT)
+            paire = self._seaux_paires[(key, model)] = (
+                SeauJetons(limites["rpm"], limites["rpm"]),
+                SeauJetons(limites["tpm"], limites["tpm"]),
+            )
+        return seau_cle, paire[0], paire[1]
+
+    def _essayer(self, candidats, cout, now):
+        for key, model in candidats:
+            seau_cle, seau_req, seau_tok = self._seaux(key, model)
+            if (seau_cle.disponible(1, now) and seau_req.disponible(1, now)
+                    and seau_tok.disponible(cout, now)):
+                seau_cle.prendre(1)
+                seau_req.prendre(1)
+                seau_tok.prendre(cout)
+                self.admis += 1
+                return key, model
+        return None
+
+    def _servir(self):
+        # Ordre des tickets = ordre d'arrivée ; un ticket bloqué (paires
+        # saturées) ne retient pas les suivants qui visent d'autres paires.
+        now = time.monotonic()
+        for ticket in sorted(self._attente):
+            candidats, cout = self._attente[ticket]
+            paire = self._essayer(candidats, cout, now)
+            if paire is not None:
+                del self._attente[ticket]
+                self._accords[ticket] = paire
+        if self._accords:
+            self._cond.notify_all()
+
+    def position(self, ticket):
+        with self._cond:
+            if ticket not in self._attente:
+                return 0
+            return sum(1 for t in self._attente if t <= ticket)
+
+    def essayer(self, candidats, cout):
+        """Admission immédiate sans file (relances parallèles), sinon None."""
+        with self._cond:
+            if self._attente:
+                return None
+            return self._essayer(candidats, cout, time.monotonic())
+
+    def admettre(self, ticket, candidats, cout, timeout=None, on_position=None):
+        """Bloque jusqu'à obtenir une paire parmi `candidats` (dans l'ordre de
+        préférence) ou jusqu'à `timeout`. `on_position(n)` est appelé à chaque
+        changement de rang dans la file. Renvoie la paire ou None."""
+        limite = None if timeout is None else time.monotonic() + timeout
+        derniere_position = None
+        with self._cond:
+            self._attente[ticket] = (list(candidats), cout)
+            self.attente_max = max(self.attente_max, len(self._attente))
+            try:
+                while True:
+                    self._servir()
+                    paire = self._accords.pop(ticket, None)
+                    if paire is not None:
+                        return paire
+                    restant = None if limite is None else limite - time.monotonic()
+                    if restant is not None and restant <= 0:
+                        return None
+                    position = sum(1 for t in self._attente if t <= ticket)
+                    if on_position is not None and position != derniere_position:
+                        derniere_position = position
+                        # Rappel hors verrou : il peut écrire dans l'interface
+                        self._cond.release()
+                        try:
+                            on_position(position)
+                        finally:
+                            self._cond.acquire()
+                        continue
+                    attente = ATTENTE_MAX_SONDAGE if restant is None else min(restant, ATTENTE_MAX_SONDAGE)
+                    self._cond.wait(attente)
+            finally:
+                self._attente.pop(ticket, None)
+                paire_orpheline = self._accords.pop(ticket, None)
+                if paire_orpheline is not None:
+                    # Accordée pendant qu'on abandonnait : on la rend aux suivants
+                    self._rendre(*paire_orpheline, cout)
+
+    def _rendre(self, key, model, cout):
+        seau_cle, seau_req, seau_tok = self._seaux(key, model)
+        seau_cle.niveau = min(seau_cle.capacite, seau_cle.niveau + 1)
+        seau_req.niveau = min(seau_req.capacite, seau_req.niveau + 1)
+        seau_tok.niveau = min(seau_tok.capacite, seau_tok.niveau + min(cout, seau_tok.capacite))
+        self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "en_attente": len(self._attente),
+                "admis": self.admis,
+                "attente_max": self.attente_max,
+            }
@@ -0,0 +1,532 @@
+# --- COUCHE IA PARTAGÉE (GROQ) ---
+# Utilisée par 1agora.py, app.py et agence.py : routage clés / modèles,
+# réponse complète ou diffusée jeton par jeton dans la bulle de chat.
+
+import queue
+import threading
+import time
+from collections import deque
+
+import streamlit as st
+
+from contexte_ia import PROMPT_RESUME, formater_echanges
+from ia_admission import ControleurAdmission, estimer_tokens
+from ia_pool import PoolClientsGroq
+from ia_routeur import RouteurGroq
+
+
+def get_api_keys_list():
+    if "groq_keys" in st.secrets:
+        return st.secrets["groq_keys"]
+    elif "GROQ_API_KEY" in st.secrets:
+        return [st.secrets["GROQ_API_KEY"]]
+    return []
+
+
+@st.cache_resource
+def get_router():
+    # Partagé par toutes les sessions du processus Streamlit
+    return RouteurGroq()
+
+
+@st.cache_resource
+def get_client_pool():
+    # Un client (et ses connexions keep-alive) par clé, pour tout le processus
+    return PoolClientsGroq()
+
+
+@st.cache_resource
+def get_admission():
+    # Limites surchargeables dans les secrets : [limites_groq.<modele>] rpm / tpm
+    limites = {m: dict(v) for m, v in st.secrets.get("limites_groq", {}).items()}
+    return ControleurAdmission(limites_modeles=limites)
+
+
+# --- BUDGET DE TEMPS ---
+# Sans budget, chaque tentative garde le délai par défaut du SDK. Avec un
+# budget, chaque tentative reçoit une part de ce qui reste (de quoi laisser
+# au moins une seconde chance) et la chaîne s'arrête dès qu'il est épuisé.
+
+TIMEOUT_PAR_DEFAUT = 60.0
+TIMEOUT_TENTATIVE_MIN = 1.5
+TIMEOUT_TENTATIVE_MAX = 20.0
+PART_PAR_TENTATIVE = 0.5
+
+DELAI_DEPASSE = "DÉLAI DÉPASSÉ"
+
+
+class Echeance:
+    def __init__(self, budget=None):
+        self.budget = budget
+        self.debut = time.monotonic()
+        self.tentatives = 0
+
+    def ecoule(self):
+        return time.monotonic() - self.debut
+
+    def restant(self):
+        if self.budget is None:
+            return float("inf")
+        return max(0.0, self.budget - self.ecoule())
+
+    def timeout_tentative(self):
+        """Délai de la prochaine tentative, ou None si le budget est épuisé."""
+        if self.budget is None:
+            return TIMEOUT_PAR_DEFAUT
+        restant = self.restant()
+        if restant < TIMEOUT_TENTATIVE_MIN:
+            return None
+        return min(restant, TIMEOUT_TENTATIVE_MAX, max(TIMEOUT_TENTATIVE_MIN, restant * PART_PAR_TENTATIVE))
+
+    def rapport(self, rapport, modele, budget_epuise=False, usage=None):
+        if rapport is not None:
+            rapport.update({
+                "duree": round(self.ecoule(), 2),
+                "budget": self.budget,
+                "tentatives": self.tentatives,
+                "modele": modele,
+                "budget_epuise": budget_epuise,
+            })
+            rapport.update(usage or {})
+
+
+# --- JETONS DU PROMPT (CACHE FOURNISSEUR) ---
+# Groq renvoie la part du prompt servie depuis son cache de préfixes dans
+# usage.prompt_tokens_details.cached_tokens (réponse complète) ou dans
+# x_groq.usage (dernier morceau d'un flux).
+
+def _champ(objet, nom):
+    if isinstance(objet, dict):
+        return objet.get(nom)
+    return getattr(objet, nom, None)
+
+
+def usage_prompt(usage):
+    if usage is None:
+        return None
+    prompt = _champ(usage, "prompt_tokens") or 0
+    caches = _champ(_champ(usage, "prompt_tokens_details"), "cached_tokens") or 0
+    return {"tokens_prompt": prompt, "tokens_caches": caches, "tokens_frais": prompt - caches}
+
+
+def _usage_chunk(chunk):
+    usage = getattr(chunk, "usage", None) or _champ(getattr(chunk, "x_groq", None), "usage")
+    return usage_prompt(usage)
+
+
+class FileTentatives:
+    """Paires (clé, modèle) à essayer pour un appel, chacune obtenue en
+    passant par la file d'admission commune à toute la classe."""
+
+    def __init__(self, messages, models, max_tokens, echeance, on_position=None):
+        self.router = get_router()
+        self.admission = get_admission()
+        self.keys = list(get_api_keys_list())
+        self.models = models
+        self.ticket = self.admission.nouveau_ticket()
+        self.cout = estimer_tokens(messages, max_tokens)
+        self.echeance = echeance
+        self.on_position = on_position
+        self.essayees = set()
+
+    def suivante(self, bloquant=True):
+        candidats = [p for p in self.router.ordre(self.keys, self.models) if p not in self.essayees]
+        if not candidats:
+            return None
+        # Disjoncteurs ouverts : seulement en dernier recours
+        fermees = [p for p in candidats if not self.router.ouvert(*p)] or candidats
+        if bloquant:
+            restant = self.echeance.restant()
+            paire = self.admission.admettre(
+                self.ticket, fermees, self.cout,
+                timeout=None if restant == float("inf") else restant,
+                on_position=self.on_position,
+            )
+        else:
+            paire = self.admission.essayer(fermees, self.cout)
+        if paire is not None:
+            self.essayees.add(paire)
+        return paire
+
+    def __iter__(self):
+        while True:
+            paire = self.suivante()
+            if paire is None:
+                return
+            yield paire
+
+
+def query_groq_with_rotation(messages, models, temperature=0.3, max_tokens=1024,
+                             budget=None, rapport=None, on_position=None):
+    """Réponse complète. `budget` (s) borne toute la chaîne de repli ; si
+    `rapport` (dict) est fourni, il reçoit le temps réellement passé."""
+    echeance = Echeance(budget)
+    if not get_api_keys_list():
+        echeance.rapport(rapport, None)
+        return None, "ERREUR CONFIG"
+
+    router = get_router()
+    for key, model in FileTentatives(messages, models, max_tokens, echeance, on_position):
+        timeout = echeance.timeout_tentative()
+        if timeout is None:
+            echeance.rapport(rapport, None, budget_epuise=True)
+            return None, DELAI_DEPASSE
+        echeance.tentatives += 1
+        router.debut(key, model)
+        t0 = time.monotonic()
+        try:
+            client = get_client_pool().client(key)
+            chat = client.chat.completions.create(
+                messages=messages,
+                model=model,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                timeout=timeout,
+            )
+        except Exception as e:
+            # On note l'échec et on passe à la paire suivante
+            router.echec(key, model, e)
+            continue
+        router.succes(key, model, time.monotonic() - t0)
+        echeance.rapport(rapport, model, usage=usage_prompt(chat.usage))
+        return chat.choices[0].message.content, model
+
+    if echeance.timeout_tentative() is None:
+        echeance.rapport(rapport, None, budget_epuise=True)
+        return None, DELAI_DEPASSE
+    echeance.rapport(rapport, None)
+    return None, "SATURATION"
+
+
+# --- RÉSUMÉ GLISSANT ---
+# Appelé par contexte_ia.construire_contexte quand des échanges sortent de
+# la fenêtre ; en cas d'échec, le contexte se rabat sur un résumé extractif.
+
+BUDGET_RESUME = 15
+
+def resumer_avec_ia(resume, messages, models):
+    prompt = PROMPT_RESUME.format(resume=resume or "(vide)", echanges=formater_echanges(messages))
+    texte, _ = query_groq_with_rotation(
+        [{"role": "user", "content": prompt}], models, temperature=0.2, max_tokens=400,
+        budget=BUDGET_RESUME,
+    )
+    return texte
+
+
+# --- STREAMING ---
+# Événements produits par iter_groq_stream :
+#   ("delta", texte)  -> nouveau morceau de réponse
+#   ("reset", None)   -> la paire en cours a lâché en plein flux, on repart de zéro
+#   ("done", modele)  -> réponse complète
+#   ("timeout", None) -> budget épuisé avant le premier jeton
+#   ("usage", dict)   -> jetons du prompt (dont part en cache), avant "done"
+# Le budget ne borne que l'attente du premier jeton : une réponse déjà en
+# cours d'affichage n'est jamais coupée (le délai de lecture du SDK protège
+# des flux bloqués).
+
+def iter_groq_stream(messages, models, temperature=0.3, max_tokens=1024, echeance=None,
+                     on_position=None):
+    echeance = echeance or Echeance()
+    router = get_router()
+    for key, model in FileTentatives(messages, models, max_tokens, echeance, on_position):
+        timeout = echeance.timeout_tentative()
+        if timeout is None:
+            yield "timeout", None
+            return
+        echeance.tentatives += 1
+        started = False
+        router.debut(key, model)
+        t0 = time.monotonic()
+        try:
+            client = get_client_pool().client(key)
+            stream = client.chat.completions.create(
+                messages=messages,
+                model=model,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                stream=True,
+                timeout=timeout,
+            )
+            usage = None
+            for chunk in stream:
+                usage = _usage_chunk(chunk) or usage
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    if not started:
+                        # Latence retenue pour le routage : délai du premier jeton
+                        router.succes(key, model, time.monotonic() - t0)
+                        started = True
+                    yield "delta", delta
+            if started:
+                if usage:
+                    yield "usage", usage
+                yield "done", model
+                return
+            router.abandon(key, model)
+        except GeneratorExit:
+            if not started:
+                router.abandon(key, model)
+            raise
+        except Exception as e:
+            if started:
+                # Le premier jeton a déjà compté comme succès : on repasse en vol
+                router.debut(key, model)
+            router.echec(key, model, e)
+            if started:
+                yield "reset", None
+            continue
+
+    if echeance.timeout_tentative() is None:
+        yield "timeout", None
+
+
+# --- RELANCE PARALLÈLE (HEDGING) ---
+# Si la paire principale n'a pas produit son premier jeton après le p95 de
+# ses latences habituelles, la même requête part vers la paire suivante.
+# La première à répondre gagne, l'autre est annulée. Le nombre de relances
+# est plafonné par minute pour tout le processus (coût supplémentaire).
+
+RELANCES_MAX_PAR_MINUTE = 10
+PERCENTILE_RELANCE = 0.95
+DELAI_RELANCE_DEFAUT = 2.0
+DELAI_RELANCE_MIN = 0.5
+DELAI_RELANCE_MAX = 8.0
+
+
+class QuotaRelances:
+    def __init__(self, max_par_minute=RELANCES_MAX_PAR_MINUTE):
+        self.max_par_minute = max_par_minute
+        self._lock = threading.Lock()
+        self._relances = deque()
+        self.accordees = 0
+        self.refusees = 0
+
+    def accorder(self):
+        now = time.monotonic()
+        with self._lock:
+            while self._relances and now - self._relances[0] > 60:
+                self._relances.popleft()
+            if len(self._relances) >= self.max_par_minute:
+                self.refusees += 1
+                return False
+            self._relances.append(now)
+            self.accordees += 1
+            return True
+
+
+@st.cache_resource
+def get_quota_relances():
+    return QuotaRelances()
+
+
+def _delai_relance(router, key, model):
+    p = router.percentile_latence(key, model, PERCENTILE_RELANCE)
+    if p is None:
+        return DELAI_RELANCE_DEFAUT
+    return min(DELAI_RELANCE_MAX, max(DELAI_RELANCE_MIN, p))
+
+
+def _flux_concurrent(ident, client, router, key, model, params, timeout, annule, sortie):
+    # Exécuté dans un thread : aucun appel st.* ici, tout passe par `sortie`
+    started = False
+    router.debut(key, model)
+    t0 = time.monotonic()
+    try:
+        stream = client.chat.completions.create(model=model, stream=True, timeout=timeout, **params)
+        try:
+            for chunk in stream:
+                if annule.is_set():
+                    break
+                usage = _usage_chunk(chunk)
+                if usage:
+                    sortie.put(("usage", ident, usage))
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    if not started:
+                        router.succes(key, model, time.monotonic() - t0)
+                        started = True
+                    sortie.put(("delta", ident, delta))
+        finally:
+            stream.close()
+    except Exception as e:
+        if annule.is_set():
+            router.abandon(key, model)
+        else:
+            if started:
+                router.debut(key, model)
+            router.echec(key, model, e)
+            sortie.put(("error", ident, None))
+        return
+    if annule.is_set():
+        if not started:
+            router.abandon(key, model)
+    elif started:
+        sortie.put(("done", ident, model))
+    else:
+        router.abandon(key, model)
+        sortie.put(("error", ident, None))
+
+
+def iter_groq_stream_hedged(messages, models, temperature=0.3, max_tokens=1024, echeance=None,
+                            on_position=None):
+    """Même protocole d'événements que iter_groq_stream, avec relance parallèle."""
+    echeance = echeance or Echeance()
+    router = get_router()
+    pool = get_client_pool()
+    quota = get_quota_relances()
+    params = {"messages": messages, "temperature": temperature, "max_tokens": max_tokens}
+
+    tentatives = FileTentatives(messages, models, max_tokens, echeance, on_position)
+    sortie = queue.Queue()
+    actifs = {}            # ident -> événement d'annulation
+    gagnant = None
+    relance_faite = False
+    prochaine_relance = None
+
+    def lancer(relance=False):
+        # Budget épuisé : pas de place prise dans le seau pour rien
+        if echeance.timeout_tentative() is None:
+            return None
+        # Une relance ne fait jamais la queue : capacité immédiate ou rien
+        key_model = tentatives.suivante(bloquant=not relance)
+        timeout = echeance.timeout_tentative()
+        if key_model is None or timeout is None:
+            return None
+        key, model = key_model
+        echeance.tentatives += 1
+        ident = echeance.tentatives
+        annule = threading.Event()
+        actifs[ident] = annule
+        threading.Thread(
+            target=_flux_concurrent,
+            args=(ident, pool.client(key), router, key, model, params, timeout, annule, sortie),
+            daemon=True,
+        ).start()
+        return key, model
+
+    def annuler(sauf=None):
+        for ident, annule in list(actifs.items()):
+            if ident != sauf:
+                annule.set()
+                del actifs[ident]
+
+    try:
+        while True:
+            if not actifs:
+                lancee = lancer()
+                if lancee is None:
+                    if echeance.timeout_tentative() is None:
+                        yield "timeout", None
+                    return
+                if not relance_faite:
+                    prochaine_relance = time.monotonic() + _delai_relance(router, *lancee)
+
+            if gagnant is not None:
+                # Le flux gagnant est borné par son propre timeout : on
+                # l'attend sans relire le budget, même épuisé
+                attente = TIMEOUT_PAR_DEFAUT
+            else:
+                attente = min(echeance.restant(), TIMEOUT_PAR_DEFAUT)
+                if not relance_faite:
+                    attente = min(attente, max(0.0, prochaine_relance - time.monotonic()))
+            try:
+                kind, ident, value = sortie.get(timeout=attente)
+            except queue.Empty:
+                if gagnant is not None:
+                    continue
+                if not relance_faite and time.monotonic() >= prochaine_relance:
+                    relance_faite = True
+                    if echeance.timeout_tentative() is not None and quota.accorder():
+                        lancer(relance=True)
+                    continue
+                if echeance.restant() <= 0:
+                    annuler()
+                    yield "timeout", None
+                    return
+                continue
+
+            if ident not in actifs:
+                continue  # paire déjà annulée
+            if kind == "delta":
+                if gagnant is None:
+                    gagnant = ident
+                    annuler(sauf=ident)
+                if ident == gagnant:
+                    yield "delta", value
+            elif kind == "usage":
+                if ident == gagnant:
+                    yield "usage", value
+            elif kind == "done":
+                del actifs[ident]
+                yield "done", value
+                return
+            elif kind == "error":
+                del actifs[ident]
+                if ident == gagnant:
+                    gagnant = None
+                    yield "reset", None
+    finally:
+        annuler()
+
+
+def stream_groq_to_chat(messages, models, temperature=0.3, max_tokens=1024,
+                        placeholder=None, spinner_text="Connexion à l'IA…",
+                        budget=None, rapport=None, hedging=False):
+    """Affiche la réponse au fil de l'eau dans `placeholder` (à créer dans st.chat_message)
+    et renvoie (texte complet, modèle) comme query_groq_with_rotation."""
+    echeance = Echeance(budget)
+    if not get_api_keys_list():
+        echeance.rapport(rapport, None)
+        return None, "ERREUR CONFIG"
+
+    placeholder = placeholder if placeholder is not None else st.empty()
+    text = ""
+    iter_flux = iter_groq_stream_hedged if hedging else iter_groq_stream
+    with st.spinner(spinner_text):
+        events = iter_flux(messages, models, temperature, max_tokens, echeance,
+                           on_position=afficher_position(placeholder))
+        first = next(events, None)
+
+    if first is None:
+        echeance.rapport(rapport, None)
+        return None, "SATURATION"
+
+    usage = None
+    for kind, value in _chain_first(first, events):
+        if kind == "usage":
+            usage = value
+        elif kind == "delta":
+            text += value
+            placeholder.markdown(text + "▌")
+        elif kind == "reset":
+            text = ""
+            placeholder.markdown("_Nouvelle tentative…_")
+        elif kind == "done":
+            placeholder.markdown(text)
+            echeance.rapport(rapport, value, usage=usage)
+            return text, value
+        elif kind == "timeout":
+            placeholder.empty()
+            echeance.rapport(rapport, None, budget_epuise=True)
+            return None, DELAI_DEPASSE
+
+    placeholder.empty()
+    echeance.rapport(rapport, None)
+    return None, "SATURATION"
+
+
+def afficher_position(placeholder):
+    def on_position(position):
+        placeholder.info(
+            f"⏳ Beaucoup de demandes en même temps : tu es n° {position} dans la file d'attente de la classe…"
+        )
+    return on_position
+
+
+def _chain_first(first, events):
+    yield first
+    yield from events
@@ -0,0 +1,60 @@
+# --- POOL DE CLIENTS GROQ ---
+# Un client Groq par clé, créé une seule fois pour tout le processus.
+# Les connexions HTTP (keep-alive) sont réutilisées d'un tour à l'autre :
+# plus de construction de client ni de poignée de main TLS à chaque réponse.
+
+import threading
+
+import httpx
+from groq import Groq
+
+MAX_CONNEXIONS = 50
+MAX_CONNEXIONS_KEEPALIVE = 20
+KEEPALIVE_EXPIRY = 120  # secondes avant fermeture d'une connexion inactive
+
+
+class PoolClientsGroq:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clients = {}
+        self.requetes = 0
+        self.nouvelles_connexions = 0
+
+    def _trace(self, event_name, info):
+        # httpcore signale chaque ouverture de connexion TCP
+        if event_name == "connection.connect_tcp.complete":
+            with self._lock:
+                self.nouvelles_connexions += 1
+
+    def _avant_requete(self, request):
+        request.extensions["trace"] = self._trace
+        with self._lock:
+            self.requetes += 1
+
+    def client(self, key) -> Groq:
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                http_client = httpx.Client(
+                    limits=httpx.Limits(
+                        max_connections=MAX_CONNEXIONS,
+                        max_keepalive_connections=MAX_CONNEXIONS_KEEPALIVE,
+                        keepalive_expiry=KEEPALIVE_EXPIRY,
+                    ),
+                    event_hooks={"request": [self._avant_requete]},
+                )
+                # Les reprises sont gérées par le routeur, pas par le SDK
+                client = Groq(api_key=key, http_client=http_client, max_retries=0)
+                self._clients[key] = client
+            return client
+
+    def stats(self):
+        with self._lock:
+            reutilisations = max(0, self.requetes - self.nouvelles_connexions)
+            return {
+                "clients": len(self._clients),
+                "requetes": self.requetes,
+                "nouvelles_connexions": self.nouvelles_connexions,
+                "reutilisations": reutilisations,
+                "taux_reutilisation": reutilisations / self.requetes if self.requetes else 0.0,
+            }
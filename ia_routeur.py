@@ -0,0 +1,187 @@
+# --- ROUTEUR CLÉS / MODÈLES AVEC DISJONCTEURS ---
+# Un seul routeur par processus (voir ia_groq.get_router) : les 30 sessions
+# d'une classe partagent donc l'état de santé de chaque paire (clé, modèle).
+
+import random
+import threading
+import time
+from collections import deque
+
+# Durées de refroidissement (secondes)
+COOLDOWN_RATE_LIMIT = 20      # 429 sans en-tête retry-after
+COOLDOWN_SERVEUR = 10         # 5xx, timeout, coupure réseau
+COOLDOWN_MAX = 300
+COOLDOWN_CLE_INVALIDE = 3600  # 401 / 403 : clé révoquée ou erronée
+COOLDOWN_MODELE_ABSENT = 3600 # 400 / 404 : modèle retiré par Groq
+
+SEUIL_ECHECS_SERVEUR = 3      # échecs consécutifs avant ouverture sur 5xx
+FENETRE_ERREURS = 60          # fenêtre glissante pour le score d'erreurs
+LATENCE_PAR_DEFAUT = 2.0      # latence supposée d'une paire jamais utilisée
+ALPHA_LATENCE = 0.3           # lissage exponentiel de la latence
+HISTORIQUE_LATENCES = 50      # échantillons gardés pour les percentiles
+ECHANTILLONS_MIN = 5          # en dessous, percentile non significatif
+
+
+def classer_erreur(exc):
+    """Renvoie (catégorie, retry_after) pour une exception du SDK Groq."""
+    status = getattr(exc, "status_code", None)
+    retry_after = None
+    response = getattr(exc, "response", None)
+    if response is not None:
+        try:
+            retry_after = float(response.headers.get("retry-after"))
+        except (TypeError, ValueError):
+            retry_after = None
+
+    if status == 429:
+        return "rate_limit", retry_after
+    if status in (401, 403):
+        return "cle_invalide", None
+    if status in (400, 404):
+        return "modele_absent", None
+    return "serveur", None
+
+
+def masquer_cle(key: str) -> str:
+    return f"…{key[-4:]}" if key else "?"
+
+
+class EtatPaire:
+    def __init__(self):
+        self.erreurs = deque()          # horodatages des erreurs récentes
+        self.echecs_consecutifs = 0
+        self.ouvert_jusqua = 0.0
+        self.latence = None             # moyenne glissante (s)
+        self.latences = deque(maxlen=HISTORIQUE_LATENCES)
+        self.en_cours = 0
+        self.succes = 0
+        self.derniere_erreur = ""
+
+    def purger(self, now):
+        while self.erreurs and now - self.erreurs[0] > FENETRE_ERREURS:
+            self.erreurs.popleft()
+
+
+class RouteurGroq:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._etats = {}
+        self._cles_invalides = {}       # clé -> horodatage de réouverture
+
+    def _etat(self, key, model):
+        etat = self._etats.get((key, model))
+        if etat is None:
+            etat = self._etats[(key, model)] = EtatPaire()
+        return etat
+
+    def ordre(self, keys, models):
+        """Paires dans l'ordre où les essayer.
+
+        Les paires dont le disjoncteur est ouvert passent en dernier (la plus
+        proche de sa réouverture d'abord) : elles ne servent que si tout le
+        reste a échoué. Parmi les paires disponibles, on garde l'ordre de
+        préférence des modèles puis on répartit sur la clé la plus saine.
+        """
+        now = time.monotonic()
+        disponibles, ouvertes = [], []
+        with self._lock:
+            for rang, model in enumerate(models):
+                for key in keys:
+                    etat = self._etat(key, model)
+                    etat.purger(now)
+                    ouvert_jusqua = max(etat.ouvert_jusqua, self._cles_invalides.get(key, 0.0))
+                    if ouvert_jusqua > now:
+                        ouvertes.append((ouvert_jusqua, (key, model)))
+                        continue
+                    latence = etat.latence if etat.latence is not None else LATENCE_PAR_DEFAUT
+                    score = latence * (1 + etat.en_cours) * (1 + len(etat.erreurs))
+                    # Léger bruit pour ne pas envoyer toute la classe sur la même clé
+                    disponibles.append(((rang, score * random.uniform(0.9, 1.1)), (key, model)))
+        disponibles.sort(key=lambda item: item[0])
+        ouvertes.sort(key=lambda item: item[0])
+        return [pair for _, pair in disponibles] + [pair for _, pair in ouvertes]
+
+    def percentile_latence(self, key, model, q=0.95):
+        """Percentile des latences de la paire, à défaut du modèle, sinon None."""
+        with self._lock:
+            echantillons = list(self._etat(key, model).latences)
+            if len(echantillons) < ECHANTILLONS_MIN:
+                echantillons = [
+                    lat for (_, m), etat in self._etats.items() if m == model for lat in etat.latences
+                ]
+        if len(echantillons) < ECHANTILLONS_MIN:
+            return None
+        echantillons.sort()
+        return echantillons[min(len(echantillons) - 1, int(q * len(echantillons)))]
+
+    def ouvert(self, key, model):
+        now = time.monotonic()
+        with self._lock:
+            etat = self._etats.get((key, model))
+            ouvert_jusqua = max(etat.ouvert_jusqua if etat else 0.0, self._cles_invalides.get(key, 0.0))
+        return ouvert_jusqua > now
+
+    def debut(self, key, model):
+        with self._lock:
+            self._etat(key, model).en_cours += 1
+
+    def succes(self, key, model, latence):
+        with self._lock:
+            etat = self._etat(key, model)
+            etat.en_cours = max(0, etat.en_cours - 1)
+            etat.succes += 1
+            etat.echecs_consecutifs = 0
+            etat.ouvert_jusqua = 0.0
+            etat.latences.append(latence)
+            if etat.latence is None:
+                etat.latence = latence
+            else:
+                etat.latence += ALPHA_LATENCE * (latence - etat.latence)
+
+    def echec(self, key, model, exc):
+        categorie, retry_after = classer_erreur(exc)
+        now = time.monotonic()
+        with self._lock:
+            etat = self._etat(key, model)
+            etat.en_cours = max(0, etat.en_cours - 1)
+            etat.erreurs.append(now)
+            etat.echecs_consecutifs += 1
+            etat.derniere_erreur = categorie
+
+            if categorie == "rate_limit":
+                duree = retry_after or COOLDOWN_RATE_LIMIT * 2 ** (etat.echecs_consecutifs - 1)
+                etat.ouvert_jusqua = now + min(duree, COOLDOWN_MAX)
+            elif categorie == "cle_invalide":
+                # La clé entière est inutilisable, quel que soit le modèle
+                self._cles_invalides[key] = now + COOLDOWN_CLE_INVALIDE
+            elif categorie == "modele_absent":
+                etat.ouvert_jusqua = now + COOLDOWN_MODELE_ABSENT
+            elif etat.echecs_consecutifs >= SEUIL_ECHECS_SERVEUR:
+                duree = COOLDOWN_SERVEUR * 2 ** (etat.echecs_consecutifs - SEUIL_ECHECS_SERVEUR)
+                etat.ouvert_jusqua = now + min(duree, COOLDOWN_MAX)
+
+    def abandon(self, key, model):
+        # Appel interrompu sans verdict (ex. requête concurrente gagnante)
+        with self._lock:
+            etat = self._etat(key, model)
+            etat.en_cours = max(0, etat.en_cours - 1)
+
+    def snapshot(self):
+        now = time.monotonic()
+        rows = []
+        with self._lock:
+            for (key, model), etat in self._etats.items():
+                etat.purger(now)
+                ouvert_jusqua = max(etat.ouvert_jusqua, self._cles_invalides.get(key, 0.0))
+                rows.append({
+                    "Clé": masquer_cle(key),
+                    "Modèle": model,
+                    "État": "ouvert" if ouvert_jusqua > now else "fermé",
+                    "Réouverture (s)": max(0, round(ouvert_jusqua - now)),
+                    "Erreurs 60 s": len(etat.erreurs),
+                    "Latence (s)": round(etat.latence, 2) if etat.latence is not None else None,
+                    "En cours": etat.en_cours,
+                    "Succès": etat.succes,
+                    "Dernière erreur": etat.derniere_erreur,
+                })
+        return rows
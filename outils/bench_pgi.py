@@ -0,0 +1,72 @@
+# --- DÉBIT DU GÉNÉRATEUR DE PGI ---
+# Lignes par seconde : génération par colonnes NumPy (pgi.py) contre
+# l'ancienne méthode, une ligne à la fois avec random.choice dans une liste
+# de dictionnaires, rejouée ici sur les mêmes spécifications de dossiers.
+#
+# Utilisation :
+#   python outils/bench_pgi.py --tailles 1000,10000,100000
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import pandas as pd  # noqa: E402
+
+from pgi import DOSSIERS_PGI, NOMS, PRENOMS, generate_fake_pgi_data  # noqa: E402
+
+
+def valeur_ligne_a_ligne(nature, parametres, i):
+    if nature == "libelles":
+        return parametres[i % len(parametres)]
+    if nature == "choix":
+        return random.choice(parametres)
+    if nature == "entier":
+        return random.randint(*parametres)
+    if nature == "date":
+        annee, mois = parametres
+        return f"{random.randint(1, 28)}/{mois:02d}/{annee}"
+    if nature == "personne":
+        return f"{random.choice(PRENOMS)} {random.choice(NOMS)}"
+    if nature == "numero":
+        return f"{parametres} {i + 1}"
+    return parametres
+
+
+def pgi_ligne_a_ligne(numero, taille):
+    _, colonnes = DOSSIERS_PGI[numero]
+    rows = []
+    for i in range(taille):
+        rows.append({nom: valeur_ligne_a_ligne(nature, parametres, i) for nom, nature, parametres in colonnes})
+    return pd.DataFrame(rows)
+
+
+def debit(fonction, taille, repetitions):
+    debut = time.perf_counter()
+    for _ in range(repetitions):
+        fonction()
+    return taille * repetitions / (time.perf_counter() - debut)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Débit du générateur de PGI (lignes/s)")
+    parser.add_argument("--tailles", default="1000,10000,100000", help="Nombres de lignes, séparés par des virgules")
+    parser.add_argument("--repetitions", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'taille':>8} {'ligne à ligne':>15} {'colonnes':>12} {'facteur':>8}")
+    for taille in (int(t) for t in args.tailles.split(",")):
+        avant, apres = [], []
+        for numero in DOSSIERS_PGI:
+            avant.append(debit(lambda: pgi_ligne_a_ligne(numero, taille), taille, args.repetitions))
+            apres.append(debit(lambda: generate_fake_pgi_data(f"Dossier {numero} –", taille), taille, args.repetitions))
+        moyenne_avant = sum(avant) / len(avant)
+        moyenne_apres = sum(apres) / len(apres)
+        print(f"{taille:>8} {moyenne_avant:>15,.0f} {moyenne_apres:>12,.0f} {moyenne_apres / moyenne_avant:>7.0f}×")
+
+
+if __name__ == "__main__":
+    main()
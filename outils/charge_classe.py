@@ -0,0 +1,303 @@
+# --- TEST DE CHARGE : UNE CLASSE ENTIÈRE EN MÊME TEMPS ---
+# Fait jouer N élèves simulés en parallèle sur 1agora.py, app.py et
+# agence.py avec AppTest de Streamlit, contre le serveur Groq simulé
+# (outils/mock_groq.py) ou une vraie URL. Chaque élève lance une mission,
+# répond à quelques tours, rend un fichier et demande un bilan.
+# Rapport par palier : débit, latence p50 / p95 / p99 par étape, erreurs.
+# Tous les élèves tournent dans le même processus, comme sur le serveur :
+# routeur, pool de clients et file d'admission sont partagés.
+# Pour cela le script remplace des rouages internes d'AppTest (Runtime,
+# ScriptCache, st.secrets) : il ne tourne qu'avec la version de Streamlit
+# pour laquelle ces rouages ont été vérifiés (VERSION_STREAMLIT).
+#
+# Utilisation :
+#   python outils/charge_classe.py --eleves 5,10,20,30 --cles 3 --taux-429 0.05
+#   python outils/charge_classe.py --app 1agora.py --url http://127.0.0.1:8765
+
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+from pathlib import Path
+
+RACINE = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from mock_groq import ajouter_arguments, config_depuis_arguments, demarrer_serveur  # noqa: E402
+
+REPONSES_ELEVE = [
+    "Je commence par relever les lignes du PGI qui posent problème.",
+    "Je propose un tableau de synthèse avec trois colonnes : élément, constat, action.",
+    "Pour la priorité haute, je prévois une relance par mail avant vendredi.",
+]
+DOCUMENT_ELEVE = "Tableau comparatif :\nOption | Coût | Délai\nTrain | 180 € | 5 h\nAvion | 320 € | 2 h"
+FICHIER_ELEVE = ("comparatif.csv", "Option,Coût,Délai\nTrain,180 €,5 h\nAvion,320 €,2 h\n".encode("utf-8"), "text/csv")
+
+# Textes de repli des applications : leur présence signale un tour raté
+MESSAGES_ECHEC = (
+    "Je n'arrive pas à analyser",
+    "L'IA met trop de temps",
+    "Désolé, le service d'IA",
+    "Impossible de générer le bilan",
+    "⚠️ Erreur IA.",
+)
+
+TIMEOUT_ETAPE = 300
+
+# Seule version dont les internes remplacés plus bas ont été vérifiés
+VERSION_STREAMLIT = "1.65.0"
+
+
+def _widget(liste, label):
+    return next(w for w in liste if w.label == label)
+
+
+def _dernier_message(at):
+    messages = at.session_state["messages"] if "messages" in at.session_state else []
+    return messages[-1]["content"] if messages else ""
+
+
+def _verifier(at, texte=None):
+    if at.exception or at.error:
+        return False
+    texte = _dernier_message(at) if texte is None else texte
+    return bool(texte) and not any(m in texte for m in MESSAGES_ECHEC)
+
+
+def _mesurer(resultats, etape, action, verification):
+    t0 = time.perf_counter()
+    try:
+        at = action()
+        ok = verification(at)
+    except Exception:
+        ok = False
+    resultats.append((etape, time.perf_counter() - t0, ok))
+
+
+def _repondre(at, resultats, etape, texte, identifier):
+    _mesurer(resultats, etape, lambda: at.chat_input[0].set_value(texte).run(), _verifier)
+    _rafraichir(at, identifier)
+
+
+def _rafraichir(at, identifier):
+    # Le rappel du chat_input ne relance que le fragment du chat : AppTest ne
+    # voit plus le reste de la page (dont la saisie, épinglée hors du
+    # fragment) tant qu'on ne refait pas une exécution complète, hors mesure.
+    # Un navigateur renvoie la valeur de tous les widgets, AppTest seulement
+    # celle des widgets du dernier rendu : l'élève redonne son identifiant.
+    at.run()
+    identifier()
+    at.run()
+    if not at.chat_input:
+        # Le champ d'identité a son propre rappel, qui ne relance que des
+        # fragments : une dernière exécution complète rend toute la page
+        at.run()
+
+
+def scenario_1agora(at, numero, resultats, tours):
+    def identifier():
+        _widget(at.text_input, "Prénom de l'élève").set_value(f"Eleve{numero}")
+    identifier()
+    _mesurer(resultats, "mission", lambda: _widget(at.button, "LANCER LA MISSION").click().run(), _verifier)
+    for texte in REPONSES_ELEVE[:tours]:
+        _repondre(at, resultats, "tour", texte, identifier)
+
+    def rendre_fichier():
+        _widget(at.file_uploader, "Fichier élève (Word / Excel / CSV)").set_value(FICHIER_ELEVE).run()
+        return _widget(at.button, "Envoyer le travail").click().run()
+    _mesurer(resultats, "fichier", rendre_fichier, _verifier)
+    # L'envoi ne relance, lui aussi, que les fragments visés
+    _rafraichir(at, identifier)
+    _mesurer(resultats, "bilan", lambda: _widget(at.button, "📝 Générer Bilan CCF").click().run(),
+             lambda a: _verifier(a, a.session_state["bilan_ready"]))
+
+
+def scenario_app(at, numero, resultats, tours):
+    def identifier():
+        _widget(at.text_input, "Ton Prénom :").set_value(f"Eleve{numero}")
+    identifier()
+    for texte in REPONSES_ELEVE[:tours]:
+        _repondre(at, resultats, "tour", texte, identifier)
+
+    def rendre_fichier():
+        _widget(at.file_uploader, "Rapport/Brouillon").set_value(FICHIER_ELEVE).run()
+        _widget(at.button, "🚀 Envoyer à l'analyse").click().run()
+        return at.chat_input[0].set_value("Peux-tu analyser mon document ?").run()
+    _mesurer(resultats, "fichier", rendre_fichier, _verifier)
+    _rafraichir(at, identifier)
+    _mesurer(resultats, "bilan", lambda: _widget(at.button, "Générer le Bilan Pédagogique").click().run(),
+             lambda a: _verifier(a, a.session_state["final_feedback"]))
+
+
+def scenario_agence(at, numero, resultats, tours):
+    def identifier():
+        _widget(at.text_input, "Identifiant Opérateur :").set_value(f"OP{numero}")
+    identifier()
+    _repondre(at, resultats, "mission", "B", identifier)
+    for texte in REPONSES_ELEVE[:tours]:
+        _repondre(at, resultats, "tour", texte, identifier)
+    _repondre(at, resultats, "fichier", DOCUMENT_ELEVE, identifier)
+    _repondre(at, resultats, "bilan", "Génère le rapport final.", identifier)
+
+
+SCENARIOS = {
+    "1agora.py": scenario_1agora,
+    "app.py": scenario_app,
+    "agence.py": scenario_agence,
+}
+
+
+def verifier_streamlit():
+    import streamlit
+
+    if streamlit.__version__ != VERSION_STREAMLIT:
+        sys.exit(
+            f"Test de charge prévu pour Streamlit {VERSION_STREAMLIT}, "
+            f"version installée : {streamlit.__version__}.\n"
+            f"Installez-la (pip install streamlit=={VERSION_STREAMLIT}) ou vérifiez "
+            "partager_runtime, compiler_un_a_la_fois et partager_secrets "
+            "avant de mettre VERSION_STREAMLIT à jour."
+        )
+
+
+def partager_runtime():
+    # AppTest installe un Runtime factice pour chaque run puis le remet à
+    # None : avec plusieurs élèves en parallèle, le premier run terminé
+    # couperait les autres. On garde la dernière instance installée.
+    from streamlit.runtime import Runtime
+
+    derniere = {}
+
+    def instance(cls):
+        if cls._instance is not None:
+            derniere["runtime"] = cls._instance
+        return derniere["runtime"]
+
+    def exists(cls):
+        return cls._instance is not None or "runtime" in derniere
+
+    Runtime.instance = classmethod(instance)
+    Runtime.exists = classmethod(exists)
+
+
+def compiler_un_a_la_fois():
+    # AppTest recompile le script à chaque run et ast.parse n'est pas sûr
+    # entre threads (Python 3.11) : un seul élève compile à la fois.
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+
+    verrou = threading.Lock()
+    get_bytecode = ScriptCache.get_bytecode
+
+    def get_bytecode_verrouille(self, script_path):
+        with verrou:
+            return get_bytecode(self, script_path)
+
+    ScriptCache.get_bytecode = get_bytecode_verrouille
+
+
+def partager_secrets(secrets):
+    # Comme pour le Runtime : AppTest remplace st.secrets le temps d'un run
+    # puis remet l'ancien, ce qui vide les secrets des runs encore en cours.
+    # Tous les élèves ont les mêmes : on les installe une fois pour toutes.
+    import streamlit as st
+    from streamlit.runtime.secrets import Secrets
+
+    partages = Secrets()
+    partages._secrets = secrets
+    st.secrets = partages
+
+
+def eleve(app, numero, resultats, tours):
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(str(RACINE / app), default_timeout=TIMEOUT_ETAPE)
+    try:
+        at.run()
+        SCENARIOS[app](at, numero, resultats, tours)
+    except Exception:
+        resultats.append(("session", 0.0, False))
+
+
+def percentile(valeurs, q):
+    if not valeurs:
+        return float("nan")
+    valeurs = sorted(valeurs)
+    return valeurs[min(len(valeurs) - 1, int(q * len(valeurs)))]
+
+
+def palier(app, n_eleves, tours):
+    import streamlit as st
+
+    # Routeur, pool et file d'admission repartent de zéro à chaque palier
+    st.cache_resource.clear()
+    resultats = []
+    threads = [
+        threading.Thread(target=eleve, args=(app, i + 1, resultats, tours))
+        for i in range(n_eleves)
+    ]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    duree = time.perf_counter() - t0
+    return resultats, duree
+
+
+def afficher(app, n_eleves, resultats, duree):
+    reussis = [r for r in resultats if r[2]]
+    print(f"\n{app} – {n_eleves} élève(s) – {duree:.1f} s – "
+          f"débit {len(reussis) / duree:.2f} étape(s)/s – "
+          f"erreurs {len(resultats) - len(reussis)}/{len(resultats)}")
+    print(f"  {'étape':<8} {'n':>4} {'p50':>7} {'p95':>7} {'p99':>7} {'erreurs':>8}")
+    for etape in ("mission", "tour", "fichier", "bilan", "session"):
+        lignes = [r for r in resultats if r[0] == etape]
+        if not lignes:
+            continue
+        latences = [r[1] for r in lignes if r[2]]
+        erreurs = sum(1 for r in lignes if not r[2])
+        print(f"  {etape:<8} {len(lignes):>4} {percentile(latences, 0.50):>7.2f} "
+              f"{percentile(latences, 0.95):>7.2f} {percentile(latences, 0.99):>7.2f} "
+              f"{erreurs / len(lignes):>7.0%}")
+    if reussis:
+        print(f"  moyenne {statistics.mean(r[1] for r in reussis):.2f} s par étape réussie")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Test de charge des applications Pro'AGOrA")
+    parser.add_argument("--app", action="append", choices=sorted(SCENARIOS),
+                        help="Application à tester (répétable, défaut : les trois)")
+    parser.add_argument("--eleves", default="5,10,20,30", help="Paliers d'élèves simultanés")
+    parser.add_argument("--tours", type=int, default=3, help="Tours de chat par élève")
+    parser.add_argument("--cles", type=int, default=3, help="Nombre de clés Groq factices")
+    parser.add_argument("--url", default=None, help="URL Groq existante (sinon serveur simulé local)")
+    parser.add_argument("--relance", action="store_true", help="Active la relance parallèle")
+    ajouter_arguments(parser)
+    args = parser.parse_args()
+    verifier_streamlit()
+
+    if args.url:
+        url = args.url
+    else:
+        _, url = demarrer_serveur(config_depuis_arguments(args), port=0)
+    # Lu par le SDK Groq à la création de chaque client
+    os.environ["GROQ_BASE_URL"] = url
+    os.chdir(RACINE)
+    partager_runtime()
+    compiler_un_a_la_fois()
+
+    partager_secrets({
+        "groq_keys": [f"gsk_mock_{i:02d}" for i in range(args.cles)],
+        "relance_parallele": args.relance,
+    })
+    print(f"Groq : {url} – {args.cles} clé(s)")
+    for app in args.app or list(SCENARIOS):
+        for n in (int(x) for x in args.eleves.split(",")):
+            resultats, duree = palier(app, n, args.tours)
+            afficher(app, n, resultats, duree)
+
+
+if __name__ == "__main__":
+    main()
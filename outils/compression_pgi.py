@@ -0,0 +1,33 @@
+# --- COMPRESSION DU PGI DANS LES PROMPTS ---
+# Jetons envoyés au modèle pour le PGI de chaque dossier : to_string()
+# (ancien format) contre la mise en texte compacte de pgi.serialiser_pgi.
+#
+# Utilisation :
+#   python outils/compression_pgi.py --tirages 20
+
+import argparse
+import statistics
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from pgi import generate_fake_pgi_data, rapport_compression  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Jetons du PGI : to_string() contre format compact")
+    parser.add_argument("--tirages", type=int, default=20, help="Jeux de données tirés par dossier")
+    args = parser.parse_args()
+
+    print(f"{'dossier':<12} {'to_string':>10} {'compact':>8} {'gain':>6}")
+    for numero in range(1, 11):
+        rapports = [rapport_compression(generate_fake_pgi_data(f"Dossier {numero} –"))
+                    for _ in range(args.tirages)]
+        avant = statistics.mean(r["tokens_to_string"] for r in rapports)
+        apres = statistics.mean(r["tokens_compact"] for r in rapports)
+        print(f"Dossier {numero:<4} {avant:>10.0f} {apres:>8.0f} {1 - apres / avant:>6.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+# --- SERVEUR GROQ SIMULÉ ---
+# Doublure locale de l'API chat-completions de Groq pour les tests de charge.
+# Latence du premier jeton tirée d'une loi log-normale, débit de jetons,
+# injection d'erreurs 429 / 500 et quotas par clé, réponses complètes ou
+# en flux SSE (stream=True) comme le vrai service.
+#
+# Utilisation :
+#   python outils/mock_groq.py --port 8765 --ttft-median 0.8 --taux-429 0.05
+#   GROQ_BASE_URL=http://127.0.0.1:8765 streamlit run 1agora.py
+
+import argparse
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CHEMIN_COMPLETIONS = "/openai/v1/chat/completions"
+
+MOTS = (
+    "Très bien , tu as repéré les données utiles du PGI . Maintenant , "
+    "construis un tableau de synthèse avec les colonnes essentielles et "
+    "justifie chaque choix en une phrase courte . Pense au destinataire "
+    "et au ton professionnel attendu ."
+).split()
+
+
+class ConfigMock:
+    def __init__(self, ttft_median=0.8, ttft_sigma=0.5, tokens_par_seconde=250.0,
+                 tokens_reponse=180, taux_429=0.0, taux_500=0.0, rpm_par_cle=0,
+                 retry_after=2.0, seed=None):
+        self.ttft_median = ttft_median
+        self.ttft_sigma = ttft_sigma
+        self.tokens_par_seconde = tokens_par_seconde
+        self.tokens_reponse = tokens_reponse
+        self.taux_429 = taux_429
+        self.taux_500 = taux_500
+        self.rpm_par_cle = rpm_par_cle    # 0 = pas de quota
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+
+    def tirer_ttft(self):
+        return self.random.lognormvariate(math.log(self.ttft_median), self.ttft_sigma)
+
+
+class EtatMock:
+    def __init__(self, config):
+        self.config = config
+        self.lock = threading.Lock()
+        self.appels_par_cle = defaultdict(deque)
+        self.compteurs = defaultdict(int)
+
+    def admettre(self, key):
+        """Renvoie None si l'appel passe, sinon le code d'erreur à renvoyer."""
+        cfg = self.config
+        now = time.monotonic()
+        with self.lock:
+            self.compteurs["requetes"] += 1
+            tirage = cfg.random.random()
+            if tirage < cfg.taux_429:
+                self.compteurs["429_injectees"] += 1
+                return 429
+            if tirage < cfg.taux_429 + cfg.taux_500:
+                self.compteurs["500_injectees"] += 1
+                return 500
+            if cfg.rpm_par_cle:
+                appels = self.appels_par_cle[key]
+                while appels and now - appels[0] > 60:
+                    appels.popleft()
+                if len(appels) >= cfg.rpm_par_cle:
+                    self.compteurs["429_quota"] += 1
+                    return 429
+                appels.append(now)
+            return None
+
+
+def _usage(messages, n_tokens):
+    prompt = sum(len(m.get("content") or "") for m in messages) // 4
+    return {"prompt_tokens": prompt, "completion_tokens": n_tokens, "total_tokens": prompt + n_tokens}
+
+
+class GestionnaireGroq(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, comme l'API réelle
+    etat = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for nom, valeur in (headers or {}).items():
+            self.send_header(nom, valeur)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _erreur(self, status):
+        cfg = self.etat.config
+        if status == 429:
+            self._json(429, {"error": {"message": "Rate limit reached (mock).", "type": "requests",
+                                       "code": "rate_limit_exceeded"}},
+                       headers={"retry-after": str(cfg.retry_after)})
+        else:
+            self._json(500, {"error": {"message": "Internal server error (mock).", "type": "internal_server_error"}})
+
+    def _chunk(self, data):
+        # Transfer-Encoding: chunked pour garder la connexion ouverte
+        self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_POST(self):
+        if self.path.rstrip("/") != CHEMIN_COMPLETIONS:
+            self._json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+        longueur = int(self.headers.get("Content-Length", 0))
+        requete = json.loads(self.rfile.read(longueur) or b"{}")
+        key = self.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+        if not key:
+            self._json(401, {"error": {"message": "Invalid API Key", "code": "invalid_api_key"}})
+            return
+
+        status = self.etat.admettre(key)
+        cfg = self.etat.config
+        ttft = cfg.tirer_ttft()
+        if status is not None:
+            time.sleep(min(ttft, 0.2))
+            self._erreur(status)
+            return
+
+        model = requete.get("model", "mock")
+        max_tokens = requete.get("max_tokens") or cfg.tokens_reponse
+        n_tokens = min(cfg.tokens_reponse, max_tokens)
+        mots = [MOTS[i % len(MOTS)] + " " for i in range(n_tokens)]
+        ident = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        usage = _usage(requete.get("messages", []), n_tokens)
+        time.sleep(ttft)
+
+        if not requete.get("stream"):
+            time.sleep(n_tokens / cfg.tokens_par_seconde)
+            self._json(200, {
+                "id": ident, "object": "chat.completion", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": "".join(mots)}}],
+                "usage": usage,
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        base = {"id": ident, "object": "chat.completion.chunk", "created": int(time.time()), "model": model}
+        try:
+            for i, mot in enumerate(mots):
+                delta = {"content": mot}
+                if i == 0:
+                    delta["role"] = "assistant"
+                chunk = dict(base, choices=[{"index": 0, "delta": delta, "finish_reason": None}])
+                self._chunk(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                time.sleep(1 / cfg.tokens_par_seconde)
+            fin = dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                       x_groq={"id": ident, "usage": usage})
+            self._chunk(f"data: {json.dumps(fin)}\n\n".encode("utf-8"))
+            self._chunk(b"data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # Client parti (relance parallèle annulée, par exemple)
+            pass
+
+
+def demarrer_serveur(config, host="127.0.0.1", port=8765):
+    """Démarre le serveur dans un thread et renvoie (serveur, url_de_base)."""
+    gestionnaire = type("Gestionnaire", (GestionnaireGroq,), {"etat": EtatMock(config)})
+    serveur = ThreadingHTTPServer((host, port), gestionnaire)
+    serveur.daemon_threads = True
+    threading.Thread(target=serveur.serve_forever, daemon=True).start()
+    host, port = serveur.server_address[:2]
+    return serveur, f"http://{host}:{port}"
+
+
+def ajouter_arguments(parser):
+    parser.add_argument("--ttft-median", type=float, default=0.8, help="Médiane du délai avant premier jeton (s)")
+    parser.add_argument("--ttft-sigma", type=float, default=0.5, help="Dispersion log-normale du délai")
+    parser.add_argument("--tokens-par-seconde", type=float, default=250.0)
+    parser.add_argument("--tokens-reponse", type=int, default=180)
+    parser.add_argument("--taux-429", type=float, default=0.0, help="Part des requêtes rejetées en 429")
+    parser.add_argument("--taux-500", type=float, default=0.0, help="Part des requêtes rejetées en 500")
+    parser.add_argument("--rpm-par-cle", type=int, default=0, help="Quota de requêtes / minute par clé (0 = aucun)")
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def config_depuis_arguments(args):
+    return ConfigMock(
+        ttft_median=args.ttft_median, ttft_sigma=args.ttft_sigma,
+        tokens_par_seconde=args.tokens_par_seconde, tokens_reponse=args.tokens_reponse,
+        taux_429=args.taux_429, taux_500=args.taux_500, rpm_par_cle=args.rpm_par_cle,
+        seed=args.seed,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serveur Groq simulé (chat-completions)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    ajouter_arguments(parser)
+    args = parser.parse_args()
+    serveur, url = demarrer_serveur(config_depuis_arguments(args), args.host, args.port)
+    print(f"Groq simulé sur {url} (GROQ_BASE_URL={url})")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        serveur.shutdown()
@@ -0,0 +1,513 @@
+# --- PGI FICTIF ---
+# Données métier fictives affichées à l'élève et envoyées au modèle :
+# génération par dossier, empreinte du jeu de données et mise en texte
+# compacte pour les prompts.
+
+import hashlib
+import re
+import secrets
+import string
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+from contexte_ia import compter_tokens
+
+try:
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Alignment, Font, PatternFill
+    from openpyxl.utils import get_column_letter
+    HAS_OPENPYXL = True
+except ImportError:
+    HAS_OPENPYXL = False
+
+NOMS = [
+    "Martin", "Bernard", "Thomas", "Lopez", "Nguyen",
+    "Diallo", "Moreau", "Khan", "Rodriguez", "Schneider",
+    "Diop", "Rossi", "Dubois", "Garcia", "Haddad",
+    "Kouyaté", "Kim", "Fernandes", "Popov", "Oumar"
+]
+
+PRENOMS = [
+    "Emma", "Gabriel", "Lina", "Yanis", "Aïcha",
+    "Noah", "Sara", "Hugo", "Maya", "Ethan",
+    "Inès", "Amir", "Chloé", "Diego", "Léa",
+    "Naomi", "Omar", "Sofia", "Jules", "Fatou"
+]
+
+
+# --- GÉNÉRATION PAR DOSSIER ---
+# Chaque dossier est décrit par ses colonnes (nom, nature, paramètres) et
+# son nombre de lignes par défaut. Les colonnes sont tirées d'un bloc avec
+# NumPy, déjà typées : catégories, entiers, dates. Un `taille` explicite
+# donne un PGI « grandeur nature » (10 000 lignes et plus) pour les
+# exercices de filtre et de tableau croisé.
+#
+# Natures :
+#   libelles  valeurs parcourues dans l'ordre (une ligne par libellé)
+#   choix     valeur tirée au hasard
+#   entier    entier tiré dans [min, max], unité éventuelle dans l'en-tête
+#   date      jour tiré dans un mois (année, mois)
+#   personne  « Prénom Nom » tiré dans PRENOMS et NOMS
+#   numero    libellé suivi du numéro de ligne (« Réunion 3 »)
+#   constante même valeur partout
+
+DOSSIERS_PGI = {
+    # --- PARTIE 1 ---
+    1: (5, [
+        ("Zone", "libelles", ["Accueil", "Comptabilité", "Direction", "Open space", "Salle de réunion"]),
+        ("Nombre de postes", "entier", (1, 6)),
+        ("État", "choix", ["Adapté", "Saturé", "Sous-utilisé"]),
+        ("Problème signalé", "choix", ["Bruit", "Manque de rangements", "Éclairage insuffisant", "Aucun"]),
+        ("Priorité", "choix", ["Haute", "Moyenne", "Basse"]),
+    ]),
+    2: (5, [
+        ("Outil", "libelles", ["Suite bureautique", "PGI comptable", "Messagerie", "Drive partagé", "Outil de visio"]),
+        ("Service concerné", "choix", ["Comptabilité", "Accueil", "Direction"]),
+        ("Nb utilisateurs", "entier", (2, 15)),
+        ("Problème", "choix", ["Aucun", "Droits insuffisants", "Connexion lente", "Formation à prévoir"]),
+        ("Priorité", "choix", ["Urgent", "À planifier", "Information"]),
+    ]),
+    3: (5, [
+        ("Ressource", "libelles", ["Salle réunion A", "Salle réunion B", "Véhicule 1", "Véhicule 2", "Vidéoprojecteur"]),
+        ("Type", "choix", ["Salle", "Véhicule", "Matériel"]),
+        ("Taux d'utilisation (%)", "entier", (40, 100)),
+        ("Conflits réserv.", "entier", (0, 5)),
+        ("Remarque", "choix", ["Souvent réservé", "Peu utilisé", "Réservation à structurer"]),
+    ]),
+    4: (4, [
+        ("Information", "libelles", ["Consignes sécurité", "Planning mensuel", "Notes de service", "Procédure d’accueil"]),
+        ("Support actuel", "choix", ["Mail", "Affichage", "Intranet", "Oral uniquement"]),
+        ("Public cible", "choix", ["Tous les salariés", "Service compta", "Direction"]),
+        ("Fréquence", "choix", ["Ponctuelle", "Hebdomadaire", "Mensuelle"]),
+        ("Problème", "choix", ["Non à jour", "Non lu", "Trop dispersé", "Aucun"]),
+    ]),
+    # --- PARTIE 2 ---
+    5: (4, [
+        ("Action", "libelles", ["Teasing réseaux sociaux", "Animation point de vente", "Newsletter clients fidèles", "Formation vendeurs"]),
+        ("Responsable", "choix", PRENOMS),
+        ("Échéance", "date", (2025, 9)),
+        ("Statut", "choix", ["À faire", "En cours", "Terminé"]),
+        ("Budget estimé (€)", "entier", (200, 2000)),
+    ]),
+    6: (4, [
+        ("Réunion", "numero", "Réunion"),
+        ("Objet", "choix", ["Préparation lancement", "Point qualité", "Réunion RH", "Sécurité"]),
+        ("Date", "date", (2025, 10)),
+        ("Participants prévus", "entier", (3, 12)),
+        ("Compte rendu", "choix", ["Non rédigé", "En cours", "Diffusé"]),
+    ]),
+    7: (5, [
+        ("Salarié", "personne", None),
+        ("Destination", "choix", ["Pegalajar", "Séville", "Madrid", "Barcelone"]),
+        ("Motif", "choix", ["Visite oliveraie", "Visite usine", "Rencontre fournisseur", "Découverte culturelle"]),
+        ("Transport", "choix", ["Voiture entreprise", "Train", "Avion"]),
+        ("Hébergement", "choix", ["Hôtel", "Maison d’hôtes", "Appartement loué"]),
+        ("Coût estimé (€)", "entier", (180, 650)),
+    ]),
+    # --- PARTIE 3 ---
+    8: (8, [
+        ("Candidat", "personne", None),
+        ("Poste visé", "choix", ["Commercial sédentaire", "Assistant commercial", "Chargé de clientèle"]),
+        ("Diplôme principal", "choix", ["Bac Pro AGOrA", "Bac STMG", "BTS NDRC", "BTS MCO"]),
+        ("Expérience (ans)", "entier", (0, 5)),
+        ("Motivation /5", "entier", (1, 5)),
+        ("Statut dossier", "choix", ["À étudier", "Retenu entretien", "Refusé"]),
+    ]),
+    9: (5, [
+        ("Étape d’intégration", "libelles", ["Préparation poste", "Création comptes informatiques", "Remise badge", "Présentation équipe", "Formation sécurité"]),
+        ("Responsable", "choix", ["RH", "Manager", "Accueil"]),
+        ("Moment", "choix", ["Avant arrivée", "Jour J", "Semaine 1"]),
+        ("Statut", "choix", ["À faire", "En cours", "Terminé"]),
+        ("Commentaire", "choix", ["Prioritaire", "Peut être délégué", "À vérifier"]),
+    ]),
+    10: (6, [
+        ("Salarié", "personne", None),
+        ("Type modif.", "choix", ["Adresse", "Contrat", "Fonction"]),
+        ("Document reçu", "choix", ["Oui", "Non"]),
+        ("Dossier à jour", "choix", ["Oui", "Non"]),
+        ("Action à mener", "choix", ["Relancer salarié", "Archiver", "Mettre à jour PGI"]),
+    ]),
+}
+
+DOSSIER_PAR_DEFAUT = (5, [("Info", "constante", "Données fictives à définir pour ce dossier.")])
+PERSONNES = [f"{p} {n}" for p in PRENOMS for n in NOMS]
+RE_NUMERO_DOSSIER = re.compile(r"Dossier\s+(\d+)\b")
+
+
+def numero_dossier(dossier_name: str):
+    # « Dossier 1 – … » et « Dossier 10 – … » ne se confondent pas
+    trouve = RE_NUMERO_DOSSIER.search(dossier_name or "")
+    return int(trouve.group(1)) if trouve else None
+
+
+def _colonne(nature, parametres, n, rng):
+    if nature == "libelles":
+        return pd.Categorical.from_codes(np.arange(n) % len(parametres), categories=parametres)
+    if nature == "choix":
+        return pd.Categorical.from_codes(rng.integers(0, len(parametres), n), categories=list(dict.fromkeys(parametres)))
+    if nature == "entier":
+        bas, haut = parametres
+        return rng.integers(bas, haut + 1, n)
+    if nature == "date":
+        annee, mois = parametres
+        return pd.to_datetime(np.datetime64(f"{annee}-{mois:02d}-01") + rng.integers(0, 28, n).astype("timedelta64[D]"))
+    if nature == "personne":
+        return pd.Categorical.from_codes(rng.integers(0, len(PERSONNES), n), categories=PERSONNES)
+    if nature == "numero":
+        return np.char.add(f"{parametres} ", np.arange(1, n + 1).astype(str)).astype(object)
+    if nature == "constante":
+        return pd.Categorical.from_codes(np.zeros(n, dtype=int), categories=[parametres])
+    raise ValueError(f"Nature de colonne inconnue : {nature}")
+
+
+def generate_fake_pgi_data(dossier_name: str, taille=None, rng=None) -> pd.DataFrame:
+    """PGI fictif du dossier. `taille` : nombre de lignes (par défaut celui
+    du dossier) ; `rng` : générateur NumPy (tirage libre par défaut)."""
+    lignes, colonnes = DOSSIERS_PGI.get(numero_dossier(dossier_name), DOSSIER_PAR_DEFAUT)
+    n = taille or lignes
+    rng = rng if rng is not None else np.random.default_rng()
+    return pd.DataFrame({nom: _colonne(nature, parametres, n, rng) for nom, nature, parametres in colonnes})
+
+
+# --- JEUX DE DONNÉES REPRODUCTIBLES ---
+# Un PGI est identifié par (dossier, graine, taille) : même clé, même table,
+# sur n'importe quel poste et à n'importe quel moment. Seule la clé est
+# enregistrée avec la séance ; l'enseignant retrouve la table exacte que
+# l'élève avait sous les yeux. Les tables sont gardées dans un cache borné
+# partagé entre les sessions (une classe sur la même graine n'en a qu'une
+# copie en mémoire) : elles ne doivent pas être modifiées en place.
+
+GRAINE_MAX = 999_999
+TAILLE_CACHE_PGI = 32
+
+_cache_pgi = OrderedDict()
+_verrou_pgi = threading.Lock()
+
+
+def nouvelle_graine() -> int:
+    return secrets.randbelow(GRAINE_MAX) + 1
+
+
+def cle_pgi(dossier_name: str, graine: int, taille=None) -> str:
+    return f"{numero_dossier(dossier_name) or dossier_name}:{graine}:{taille or 'std'}"
+
+
+def pgi_reproductible(dossier_name: str, graine: int, taille=None) -> pd.DataFrame:
+    cle = cle_pgi(dossier_name, graine, taille)
+    with _verrou_pgi:
+        df = _cache_pgi.get(cle)
+        if df is not None:
+            _cache_pgi.move_to_end(cle)
+            return df
+    df = generate_fake_pgi_data(dossier_name, taille, np.random.default_rng(graine))
+    with _verrou_pgi:
+        # Deux sessions qui tirent la même clé en même temps gardent la même table
+        df = _cache_pgi.setdefault(cle, df)
+        _cache_pgi.move_to_end(cle)
+        while len(_cache_pgi) > TAILLE_CACHE_PGI:
+            _cache_pgi.popitem(last=False)
+    return df
+
+
+# --- EMPREINTE ---
+
+def hash_pgi(df) -> str:
+    if df is None:
+        return "aucun"
+    h = hashlib.sha1("|".join(map(str, df.columns)).encode("utf-8"))
+    h.update(pd.util.hash_pandas_object(df, index=True).values.tobytes())
+    return h.hexdigest()
+
+
+# --- MISE EN TEXTE COMPACTE ---
+# to_string() aligne les colonnes avec des espaces : autant de jetons
+# perdus à chaque tour. Ici : tableau à barres sans remplissage, unités
+# sorties des cellules vers l'en-tête ("450 €" -> 450, colonne "(€)"),
+# colonnes répétitives codées par lettres avec une légende, colonnes
+# constantes résumées en une ligne.
+
+RE_UNITE = re.compile(r"^\s*(-?\d+(?:[.,]\d+)?)\s*(€|%|an\(s\))\s*$")
+LIBELLES_UNITES = {"€": "€", "%": "%", "an(s)": "ans"}
+GAIN_MIN_CODAGE = 0.8   # on ne code une colonne que si elle rétrécit d'au moins 20 %
+TAILLE_CACHE_SERIALISATION = 128
+
+_cache_serialisation = OrderedDict()
+_verrou_cache = threading.Lock()
+
+
+def _cellule(valeur) -> str:
+    if isinstance(valeur, pd.Timestamp):
+        return valeur.strftime("%d/%m/%Y")
+    return str(valeur).replace("|", "/").replace("\n", " ")
+
+
+def normaliser_unites(df) -> pd.DataFrame:
+    """Colonnes texte du type "450 €" / "73 %" / "3 an(s)" -> nombres, unité dans l'en-tête."""
+    renommage = {}
+    colonnes = {}
+    for col in df.columns:
+        if pd.api.types.is_numeric_dtype(df[col]):
+            continue
+        extrait = df[col].astype(str).str.extract(RE_UNITE)
+        unites = extrait[1].unique()
+        if extrait[0].notna().all() and len(unites) == 1:
+            colonnes[col] = pd.to_numeric(extrait[0].str.replace(",", ".", regex=False))
+            renommage[col] = f"{col} ({LIBELLES_UNITES[unites[0]]})"
+    if not colonnes:
+        return df
+    return df.assign(**colonnes).rename(columns=renommage)
+
+
+def _codes(n):
+    lettres = string.ascii_uppercase
+    if n <= len(lettres):
+        return list(lettres[:n])
+    return [f"{lettres[i // len(lettres)]}{lettres[i % len(lettres)]}" for i in range(n)]
+
+
+def _serialiser(df) -> str:
+    df = normaliser_unites(df)
+    legende = []
+    colonnes = []
+    for col in df.columns:
+        valeurs = df[col].map(_cellule)
+        if len(df) > 1 and valeurs.nunique() == 1:
+            legende.append(f"{col} = {valeurs.iloc[0]} (toutes les lignes)")
+            continue
+        if not pd.api.types.is_numeric_dtype(df[col]):
+            categories = list(dict.fromkeys(valeurs))
+            codes = _codes(len(categories))
+            table = dict(zip(categories, codes))
+            ligne_legende = f"{col} : " + ", ".join(f"{c}={v}" for v, c in table.items())
+            codees = valeurs.map(table)
+            cout_code = codees.str.len().sum() + len(ligne_legende)
+            if cout_code < GAIN_MIN_CODAGE * valeurs.str.len().sum():
+                legende.append(ligne_legende)
+                colonnes.append((col, codees))
+                continue
+        colonnes.append((col, valeurs))
+
+    lignes = []
+    if legende:
+        lignes.append("Codes :")
+        lignes += legende
+    if colonnes:
+        lignes.append("|".join(_cellule(c) for c, _ in colonnes))
+        corps = pd.concat([v.rename(i) for i, (_, v) in enumerate(colonnes)], axis=1)
+        lignes += corps.apply("|".join, axis=1).tolist()
+    return "\n".join(lignes)
+
+
+def _memoriser(cle, calcul) -> str:
+    with _verrou_cache:
+        texte = _cache_serialisation.get(cle)
+        if texte is not None:
+            _cache_serialisation.move_to_end(cle)
+            return texte
+    texte = calcul()
+    with _verrou_cache:
+        _cache_serialisation[cle] = texte
+        while len(_cache_serialisation) > TAILLE_CACHE_SERIALISATION:
+            _cache_serialisation.popitem(last=False)
+    return texte
+
+
+def serialiser_pgi(df, pgi_hash=None) -> str:
+    """Texte compact du PGI, mémorisé par empreinte du jeu de données."""
+    if df is None:
+        return ""
+    return _memoriser(pgi_hash or hash_pgi(df), lambda: _serialiser(df))
+
+
+def rapport_compression(df, pgi_hash=None) -> dict:
+    avant = compter_tokens(df.to_string())
+    apres = compter_tokens(serialiser_pgi(df, pgi_hash))
+    return {
+        "tokens_to_string": avant,
+        "tokens_compact": apres,
+        "gain": 1 - apres / avant if avant else 0.0,
+    }
+
+
+# --- GRANDS PGI DANS LE PROMPT ---
+# Au-delà de LIGNES_PGI_PROMPT lignes, le modèle ne reçoit plus la table
+# mais un résumé du jeu complet (effectifs par catégorie, min / max /
+# moyenne / total des colonnes chiffrées, période couverte) et un
+# échantillon stratifié : la taille du prompt ne dépend plus de celle du
+# jeu. L'échantillon change à chaque étape de la mission (d'autres lignes à
+# exploiter) et reste le même pendant une étape, ce qui garde le préfixe
+# du prompt identique d'un tour à l'autre.
+
+LIGNES_PGI_PROMPT = 40
+LIGNES_ECHANTILLON = 25
+MODALITES_RESUME = 12
+
+
+def colonne_strate(df):
+    """Colonne catégorielle qui répartit le mieux l'échantillon : le plus
+    de valeurs possible, sans dépasser MODALITES_RESUME."""
+    candidates = [
+        (len(df[c].cat.categories), c) for c in df.columns
+        if isinstance(df[c].dtype, pd.CategoricalDtype) and 2 <= len(df[c].cat.categories) <= MODALITES_RESUME
+    ]
+    return max(candidates)[1] if candidates else None
+
+
+def echantillon_stratifie(df, n, graine, strate=None):
+    """`n` lignes environ, chaque valeur de `strate` représentée au prorata
+    de son effectif (au moins une ligne), dans l'ordre de la table."""
+    rng = np.random.default_rng(graine)
+    if strate is None:
+        positions = rng.choice(len(df), min(n, len(df)), replace=False)
+    else:
+        codes = df[strate].cat.codes.to_numpy()
+        tirages = []
+        for code in np.unique(codes):
+            lignes = np.flatnonzero(codes == code)
+            quota = min(len(lignes), max(1, round(n * len(lignes) / len(df))))
+            tirages.append(rng.choice(lignes, quota, replace=False))
+        positions = np.concatenate(tirages)
+    return df.iloc[np.sort(positions)]
+
+
+def resume_pgi(df) -> str:
+    lignes = [f"{len(df)} lignes."]
+    for col in df.columns:
+        serie = df[col]
+        if isinstance(serie.dtype, pd.CategoricalDtype) and len(serie.cat.categories) <= MODALITES_RESUME:
+            effectifs = serie.value_counts(sort=False)
+            lignes.append(f"{col} : " + ", ".join(f"{v} {n}" for v, n in effectifs.items()))
+        elif pd.api.types.is_numeric_dtype(serie):
+            lignes.append(f"{col} : min {serie.min()}, max {serie.max()}, "
+                          f"moyenne {serie.mean():.1f}, total {serie.sum()}")
+        elif pd.api.types.is_datetime64_any_dtype(serie):
+            lignes.append(f"{col} : du {serie.min():%d/%m/%Y} au {serie.max():%d/%m/%Y}")
+        else:
+            lignes.append(f"{col} : {serie.nunique()} valeurs différentes")
+    return "\n".join(lignes)
+
+
+def texte_pgi_prompt(df, pgi_hash=None, etape=0) -> str:
+    """PGI tel qu'il est envoyé au modèle : la table entière si elle est
+    petite, sinon résumé + échantillon de l'étape."""
+    if df is None:
+        return ""
+    pgi_hash = pgi_hash or hash_pgi(df)
+    if len(df) <= LIGNES_PGI_PROMPT:
+        return serialiser_pgi(df, pgi_hash)
+
+    def calcul():
+        graine = int(hashlib.sha1(f"{pgi_hash}:{etape}".encode("utf-8")).hexdigest()[:8], 16)
+        strate = colonne_strate(df)
+        echantillon = echantillon_stratifie(df, LIGNES_ECHANTILLON, graine, strate)
+        repartition = f", répartis selon « {strate} »" if strate else ""
+        return (f"RÉSUMÉ DU PGI COMPLET :\n{resume_pgi(df)}\n\n"
+                f"ÉCHANTILLON ({len(echantillon)} lignes sur {len(df)}{repartition}) :\n"
+                f"{_serialiser(echantillon)}")
+
+    return _memoriser(f"{pgi_hash}#etape{etape}", calcul)
+
+
+# --- EXPORT EXCEL ---
+# Le PGI en .xlsx, pour construire les tableaux de synthèse dans Excel.
+# openpyxl en écriture seule : les lignes sont écrites par paquets, au fil
+# de l'eau, sans garder de cellules en mémoire ; nombres et dates restent
+# typés (filtres et formules utilisables dans Excel). Le fichier est gardé
+# par clé de jeu de données : toute la classe télécharge le même numéro de
+# jeu pour une seule construction, même si tout le monde clique en même
+# temps.
+
+LIGNES_PAQUET_XLSX = 5000
+TAILLE_CACHE_XLSX = 8
+MIME_XLSX = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+_cache_xlsx = OrderedDict()
+_constructions_xlsx = {}  # clé -> verrou de la construction en cours
+_verrou_xlsx = threading.Lock()
+stats_xlsx = {"constructions": 0, "telechargements": 0}
+
+
+def _largeur_colonne(serie) -> int:
+    # D'après l'en-tête et un échantillon de valeurs, bornée
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return max(len(str(serie.name)), 10) + 2
+    exemples = serie.head(200).astype(str)
+    return min(max([len(str(serie.name))] + exemples.str.len().tolist()) + 2, 40)
+
+
+def ecrire_xlsx_pgi(df, titre="PGI") -> bytes:
+    classeur = Workbook(write_only=True)
+    ws = classeur.create_sheet(titre[:31])
+    colonnes = list(df.columns)
+    dates = [pd.api.types.is_datetime64_any_dtype(df[c]) for c in colonnes]
+    for i, col in enumerate(colonnes, start=1):
+        ws.column_dimensions[get_column_letter(i)].width = _largeur_colonne(df[col])
+    ws.freeze_panes = "A2"
+    if len(df):
+        ws.auto_filter.ref = f"A1:{get_column_letter(len(colonnes))}{len(df) + 1}"
+
+    gras, fond = Font(bold=True, color="FFFFFF"), PatternFill("solid", fgColor="1F4E78")
+    entete = []
+    for col in colonnes:
+        cellule = WriteOnlyCell(ws, value=str(col))
+        cellule.font, cellule.fill = gras, fond
+        cellule.alignment = Alignment(horizontal="center")
+        entete.append(cellule)
+    ws.append(entete)
+
+    for debut in range(0, len(df), LIGNES_PAQUET_XLSX):
+        paquet = df.iloc[debut:debut + LIGNES_PAQUET_XLSX]
+        # Colonnes converties d'un bloc en valeurs Python (int, str, datetime)
+        valeurs = []
+        for col, est_date in zip(colonnes, dates):
+            serie = paquet[col]
+            if est_date:
+                valeurs.append([None if pd.isna(v) else v.to_pydatetime() for v in serie])
+            elif isinstance(serie.dtype, pd.CategoricalDtype):
+                valeurs.append(serie.astype(object).tolist())
+            else:
+                valeurs.append(serie.tolist())
+        for rangee in zip(*valeurs):
+            cellules = []
+            for valeur, est_date in zip(rangee, dates):
+                if est_date and valeur is not None:
+                    cellule = WriteOnlyCell(ws, value=valeur)
+                    cellule.number_format = "DD/MM/YYYY"
+                    cellules.append(cellule)
+                else:
+                    cellules.append(valeur)
+            ws.append(cellules)
+
+    sortie = BytesIO()
+    classeur.save(sortie)
+    return sortie.getvalue()
+
+
+def export_xlsx_pgi(cle: str, df, titre="PGI") -> bytes:
+    """Fichier .xlsx du jeu de données `cle`, construit une seule fois."""
+    with _verrou_xlsx:
+        stats_xlsx["telechargements"] += 1
+        donnees = _cache_xlsx.get(cle)
+        if donnees is not None:
+            _cache_xlsx.move_to_end(cle)
+            return donnees
+        verrou = _constructions_xlsx.setdefault(cle, threading.Lock())
+    # Une construction par clé : les demandes simultanées attendent la
+    # première au lieu de refaire le même fichier
+    with verrou:
+        with _verrou_xlsx:
+            donnees = _cache_xlsx.get(cle)
+        if donnees is None:
+            donnees = ecrire_xlsx_pgi(df, titre)
+            with _verrou_xlsx:
+                stats_xlsx["constructions"] += 1
+                _cache_xlsx[cle] = donnees
+                while len(_cache_xlsx) > TAILLE_CACHE_XLSX:
+                    _cache_xlsx.popitem(last=False)
+                _constructions_xlsx.pop(cle, None)
+    return donnees
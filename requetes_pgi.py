@@ -0,0 +1,204 @@
+# --- REQUÊTES SUR LE PGI ---
+# Filtrer, trier, regrouper le PGI comme dans un vrai progiciel, y compris
+# sur les jeux « grandeur nature » de plusieurs dizaines de milliers de
+# lignes. Chaque colonne est indexée une fois pour toutes par un tri
+# stable de ses valeurs :
+#   - catégories (Statut, Priorité…) : lignes de chaque valeur, contiguës
+#     dans l'ordre de tri -> un filtre est une suite de tranches ;
+#   - nombres et dates : valeurs triées -> un intervalle est une recherche
+#     dichotomique. Une colonne de texte qui ne contient que des nombres
+#     ("10", "12,5") ou des dates ("03/02/2024") est convertie d'abord :
+#     triée comme du texte, "10" passerait avant "9" ;
+#   - le même ordre sert au tri : trier un résultat filtré ne retrie rien.
+# Les index sont gardés par clé de jeu de données (cache partagé, comme
+# les tables elles-mêmes) et chaque requête rend ses temps d'exécution.
+
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+TAILLE_CACHE_INDEX = 32
+AGREGATS = {
+    "Nombre de lignes": "size",
+    "Somme": "sum",
+    "Moyenne": "mean",
+    "Minimum": "min",
+    "Maximum": "max",
+}
+
+_cache_index = OrderedDict()
+_verrou_index = threading.Lock()
+
+FORMATS_DATE = ("%d/%m/%Y", "%Y-%m-%d")
+
+
+def _valeurs_ordonnables(serie: pd.Series):
+    """Valeurs comparables d'une colonne de texte qui ne contient que des
+    nombres ou que des dates ; None sinon."""
+    if serie.empty or serie.hasnans:
+        return None
+    texte = serie.astype(str).str.strip()
+    nombres = pd.to_numeric(texte.str.replace(",", ".", regex=False), errors="coerce")
+    if nombres.notna().all():
+        return nombres.to_numpy()
+    for format_date in FORMATS_DATE:
+        dates = pd.to_datetime(texte, format=format_date, errors="coerce")
+        if dates.notna().all():
+            return dates.to_numpy()
+    return None
+
+
+class IndexPGI:
+    def __init__(self, df: pd.DataFrame):
+        debut = time.perf_counter()
+        self.df = df
+        self.n = len(df)
+        self.colonnes = {}  # colonne -> (nature, ordre, bornes ou valeurs triées)
+        for col in df.columns:
+            serie = df[col]
+            if isinstance(serie.dtype, pd.CategoricalDtype) and not serie.hasnans:
+                codes = serie.cat.codes.to_numpy()
+                ordre = np.argsort(codes, kind="stable")
+                effectifs = np.bincount(codes, minlength=len(serie.cat.categories))
+                self.colonnes[col] = ("categorie", ordre, np.concatenate([[0], np.cumsum(effectifs)]))
+            elif pd.api.types.is_numeric_dtype(serie) or pd.api.types.is_datetime64_any_dtype(serie):
+                valeurs = serie.to_numpy()
+                ordre = np.argsort(valeurs, kind="stable")
+                self.colonnes[col] = ("intervalle", ordre, valeurs[ordre])
+            elif (valeurs := _valeurs_ordonnables(serie)) is not None:
+                ordre = np.argsort(valeurs, kind="stable")
+                self.colonnes[col] = ("intervalle", ordre, valeurs[ordre])
+            else:
+                ordre = np.argsort(serie.astype(str).to_numpy(), kind="stable")
+                self.colonnes[col] = ("texte", ordre, None)
+        self.duree_index = time.perf_counter() - debut
+
+    def nature(self, col):
+        return self.colonnes[col][0]
+
+    def _masque(self, filtres):
+        masque = None
+        for col, critere in filtres.items():
+            nature, ordre, aux = self.colonnes[col]
+            if nature == "categorie" and not critere:
+                continue  # colonne choisie, aucune valeur cochée : pas de filtre
+            if nature == "categorie":
+                categories = self.df[col].cat.categories
+                tranches = [ordre[aux[k]:aux[k + 1]] for k in (categories.get_loc(v) for v in critere)]
+                positions = np.concatenate(tranches) if tranches else np.empty(0, dtype=np.intp)
+            elif nature == "intervalle":
+                bas, haut = critere
+                if np.issubdtype(aux.dtype, np.datetime64):
+                    bas, haut = np.datetime64(bas, "D"), np.datetime64(haut, "D") + np.timedelta64(1, "D")
+                    positions = ordre[np.searchsorted(aux, bas, "left"):np.searchsorted(aux, haut, "left")]
+                else:
+                    positions = ordre[np.searchsorted(aux, bas, "left"):np.searchsorted(aux, haut, "right")]
+            else:
+                raise ValueError(f"« {col} » est une colonne de texte : pas de filtre par intervalle.")
+            filtre = np.zeros(self.n, dtype=bool)
+            filtre[positions] = True
+            masque = filtre if masque is None else masque & filtre
+        return masque
+
+    def executer(self, filtres=None, tri=None, decroissant=False, groupe=None,
+                 agregat="Nombre de lignes", valeur=None):
+        """Résultat de la requête et temps de chaque étape (ms)."""
+        temps = {}
+        debut = time.perf_counter()
+        masque = self._masque(filtres or {})
+        temps["filtre"] = time.perf_counter() - debut
+
+        debut = time.perf_counter()
+        if tri and not groupe:
+            ordre = self.colonnes[tri][1]
+            if decroissant:
+                ordre = ordre[::-1]
+            positions = ordre if masque is None else ordre[masque[ordre]]
+        else:
+            positions = np.arange(self.n) if masque is None else np.flatnonzero(masque)
+        temps["tri"] = time.perf_counter() - debut
+
+        debut = time.perf_counter()
+        resultat = self.df.iloc[positions]
+        if groupe:
+            groupes = resultat.groupby(groupe, observed=True, sort=True)
+            if AGREGATS[agregat] == "size" or valeur is None:
+                resultat = groupes.size().rename("Nombre de lignes").reset_index()
+            else:
+                resultat = groupes[valeur].agg(AGREGATS[agregat]).rename(f"{agregat} de {valeur}").reset_index()
+            if tri in resultat.columns:
+                resultat = resultat.sort_values(tri, ascending=not decroissant, kind="stable")
+            temps["regroupement"] = time.perf_counter() - debut
+        temps = {etape: duree * 1000 for etape, duree in temps.items()}
+        return resultat, temps
+
+
+def index_pgi(cle: str, df: pd.DataFrame) -> IndexPGI:
+    """Index du jeu de données `cle`, construit au premier appel."""
+    with _verrou_index:
+        index = _cache_index.get(cle)
+        if index is not None and index.df is df:
+            _cache_index.move_to_end(cle)
+            return index
+    index = IndexPGI(df)
+    with _verrou_index:
+        _cache_index[cle] = index
+        _cache_index.move_to_end(cle)
+        while len(_cache_index) > TAILLE_CACHE_INDEX:
+            _cache_index.popitem(last=False)
+    return index
+
+
+# --- FORMULAIRE ---
+
+def formulaire_requete(index: IndexPGI, cle: str) -> dict:
+    """Widgets de la requête (filtres, tri, regroupement). Les clés des
+    widgets dépendent du jeu de données : changer de dossier repart d'une
+    requête vide."""
+    df = index.df
+    filtrables = [c for c in df.columns if index.nature(c) != "texte"]
+    numeriques = [c for c in df.columns if pd.api.types.is_numeric_dtype(df[c])]
+    categories = [c for c in df.columns if index.nature(c) == "categorie"]
+
+    filtres = {}
+    for col in st.multiselect("Filtrer sur", filtrables, key=f"pgi_filtres_{cle}"):
+        if index.nature(col) == "categorie":
+            valeurs = st.multiselect(col, list(df[col].cat.categories), key=f"pgi_f_{cle}_{col}")
+            if valeurs:
+                filtres[col] = valeurs
+        else:
+            valeurs_triees = index.colonnes[col][2]
+            bas, haut = valeurs_triees[0], valeurs_triees[-1]
+            if np.issubdtype(valeurs_triees.dtype, np.datetime64):
+                bas, haut = pd.Timestamp(bas).date(), pd.Timestamp(haut).date()
+            else:
+                bas, haut = bas.item(), haut.item()
+            if bas < haut:
+                filtres[col] = st.slider(col, bas, haut, (bas, haut), key=f"pgi_f_{cle}_{col}")
+
+    c1, c2 = st.columns(2)
+    groupe = c1.selectbox("Regrouper par", ["—"] + categories, key=f"pgi_groupe_{cle}")
+    groupe = None if groupe == "—" else groupe
+    agregat, valeur = "Nombre de lignes", None
+    if groupe:
+        agregat = c2.selectbox("Calcul", list(AGREGATS), key=f"pgi_agregat_{cle}")
+        if AGREGATS[agregat] != "size" and numeriques:
+            valeur = c2.selectbox("Sur la colonne", numeriques, key=f"pgi_valeur_{cle}")
+
+    c3, c4 = st.columns(2)
+    triables = list(df.columns) if not groupe else [groupe] + ([f"{agregat} de {valeur}"] if valeur else ["Nombre de lignes"])
+    tri = c3.selectbox("Trier par", ["—"] + triables, key=f"pgi_tri_{cle}_{groupe}")
+    decroissant = c4.toggle("Ordre décroissant", key=f"pgi_ordre_{cle}")
+
+    return {
+        "filtres": filtres,
+        "tri": None if tri == "—" else tri,
+        "decroissant": decroissant,
+        "groupe": groupe,
+        "agregat": agregat,
+        "valeur": valeur,
+    }
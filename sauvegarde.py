@@ -0,0 +1,169 @@
+# --- SAUVEGARDES DE SÉANCE ---
+# Relecture des CSV de sauvegarde des applications. Chaque fichier est
+# identifié par l'empreinte de son contenu : une sauvegarde restée dans
+# l'uploader n'est lue et appliquée qu'une fois, et l'historique est
+# reconstruit colonne par colonne (pas de boucle ligne à ligne), ce qui
+# rend instantanée la reprise d'une séance de plusieurs heures.
+#
+# Format de séance commun aux trois applications (fichier .agora) : JSON
+# Lines compressé, zstd si le module zstandard est installé, gzip sinon.
+# Ligne 1 : en-tête versionné (application, XP, profil, dossier, PGI,
+# bilans…), puis un message par ligne. La lecture décompresse au fil de
+# l'eau et rend les messages un par un ; les chemins de reprise CSV
+# reconnaissent ce format à ses premiers octets.
+
+import gzip
+import hashlib
+import json
+from datetime import datetime
+from io import BytesIO, StringIO, TextIOWrapper
+
+import numpy as np
+import pandas as pd
+
+try:
+    import zstandard
+    HAS_ZSTD = True
+except ImportError:
+    HAS_ZSTD = False
+
+FORMAT_SEANCE = "agora-seance"
+VERSION_SEANCE = 1
+EXTENSION_SEANCE = "agora"
+MAGIE_GZIP = b"\x1f\x8b"
+MAGIE_ZSTD = b"\x28\xb5\x2f\xfd"
+
+
+def empreinte(contenu: bytes) -> str:
+    return hashlib.sha1(contenu).hexdigest()
+
+
+def lire_csv(contenu: bytes, sep=",") -> pd.DataFrame:
+    # Tout en texte : pas d'inférence de types ni de NaN dans les messages
+    return pd.read_csv(BytesIO(contenu), sep=sep, dtype=str, keep_default_na=False)
+
+
+def messages_depuis_csv(df: pd.DataFrame) -> list:
+    """Sauvegarde de 1agora.py (colonnes role, content)."""
+    return df[["role", "content"]].to_dict(orient="records")
+
+
+def historique_agence(df: pd.DataFrame, accueil: str, eleve_defaut: str):
+    """Sauvegarde de agence.py (Heure;Eleve;Role;Message) -> (messages du chat,
+    lignes du journal). Le message d'accueil est remis en tête et retiré du
+    fichier s'il y figure."""
+    df = df[df["Message"] != accueil]
+    messages = [{"role": "assistant", "content": accueil}]
+    messages += pd.DataFrame({
+        "role": np.where(df["Role"] == "Eleve", "user", "assistant"),
+        "content": df["Message"].to_numpy(),
+    }).to_dict(orient="records")
+
+    journal = pd.DataFrame({
+        "Heure": df["Heure"] if "Heure" in df else datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "Eleve": df["Eleve"] if "Eleve" in df else eleve_defaut,
+        "Role": df["Role"],
+        "Message": df["Message"],
+    }, index=df.index)
+    return messages, journal
+
+
+# --- ÉTAT SÉRIALISÉ (JSON) ---
+
+def _valeur_json(obj):
+    # Valeurs paresseuses (fonctions) évaluées au moment d'écrire, pour ne
+    # pas sérialiser sur le chemin du chat
+    if callable(obj):
+        return obj()
+    if isinstance(obj, bytes):
+        return obj.decode("utf-8")
+    if isinstance(obj, pd.DataFrame):
+        # orient "table" : types gardés (catégories, dates, entiers)
+        return {"__dataframe__": obj.to_json(orient="table", index=False), "orient": "table"}
+    raise TypeError(f"Type non enregistrable : {type(obj).__name__}")
+
+
+def _objet_json(d):
+    if "__dataframe__" in d:
+        # Anciennes sauvegardes : orient "split"
+        return pd.read_json(StringIO(d["__dataframe__"]), orient=d.get("orient", "split"))
+    return d
+
+
+def encoder_etat(etat: dict) -> str:
+    return json.dumps(etat, ensure_ascii=False, default=_valeur_json)
+
+
+def decoder_etat(texte: str) -> dict:
+    return json.loads(texte, object_hook=_objet_json)
+
+
+# --- FICHIER DE SÉANCE COMPACT ---
+
+def est_seance(contenu: bytes) -> bool:
+    return contenu[:2] == MAGIE_GZIP or contenu[:4] == MAGIE_ZSTD
+
+
+def ecrire_seance(app: str, messages, etat=None, compression=None) -> bytes:
+    """Fichier .agora : en-tête (`etat`) puis un message par ligne."""
+    compression = compression or ("zstd" if HAS_ZSTD else "gzip")
+    entete = {
+        "format": FORMAT_SEANCE,
+        "version": VERSION_SEANCE,
+        "app": app,
+        "cree": datetime.now().isoformat(timespec="seconds"),
+        **(etat or {}),
+    }
+    tampon = StringIO()
+    tampon.write(encoder_etat(entete) + "\n")
+    for m in messages:
+        tampon.write(json.dumps(m, ensure_ascii=False) + "\n")
+    brut = tampon.getvalue().encode("utf-8")
+    if compression == "zstd":
+        return zstandard.ZstdCompressor(level=10).compress(brut)
+    return gzip.compress(brut, compresslevel=9, mtime=0)
+
+
+def lire_seance(flux):
+    """Flux binaire -> (en-tête, itérateur des messages). Les messages sont
+    décompressés et décodés au fur et à mesure qu'on les consomme."""
+    debut = flux.read(4)
+    flux.seek(0)
+    if debut == MAGIE_ZSTD:
+        if not HAS_ZSTD:
+            raise ValueError("Fichier compressé en zstd : le module 'zstandard' manque.")
+        brut = zstandard.ZstdDecompressor().stream_reader(flux)
+    elif debut[:2] == MAGIE_GZIP:
+        brut = gzip.GzipFile(fileobj=flux)
+    else:
+        raise ValueError("Ce fichier n'est pas une séance Pro'AGOrA.")
+    texte = TextIOWrapper(brut, encoding="utf-8")
+    entete = decoder_etat(texte.readline())
+    if entete.get("format") != FORMAT_SEANCE:
+        raise ValueError("Ce fichier n'est pas une séance Pro'AGOrA.")
+    if entete.get("version", 0) > VERSION_SEANCE:
+        raise ValueError(f"Version de séance {entete['version']} non prise en charge.")
+    messages = (json.loads(ligne) for ligne in texte if ligne.strip())
+    return entete, messages
+
+
+def seance_depuis_journal(df: pd.DataFrame) -> list:
+    """Journal de agence.py -> messages du fichier .agora (heure et
+    identifiant gardés sur chaque ligne)."""
+    return pd.DataFrame({
+        "role": np.where(df["Role"] == "Eleve", "user", "assistant"),
+        "content": df["Message"],
+        "heure": df["Heure"],
+        "eleve": df["Eleve"],
+    }).to_dict(orient="records")
+
+
+def journal_depuis_seance(messages) -> pd.DataFrame:
+    """Messages d'un fichier .agora au format du journal de agence.py."""
+    df = pd.DataFrame(list(messages), columns=["role", "content", "heure", "eleve"])
+    return pd.DataFrame({
+        "Heure": df["heure"].fillna(""),
+        "Eleve": df["eleve"].fillna(""),
+        "Role": np.where(df["role"] == "user", "Eleve", "Superviseur"),
+        "Message": df["content"].fillna(""),
+    })
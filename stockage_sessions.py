@@ -0,0 +1,218 @@
+# --- STOCKAGE DES SÉANCES (SQLITE) ---
+# Chaque séance est enregistrée côté serveur, par application et par
+# identifiant d'élève : un onglet fermé ou un crash ne fait plus perdre le
+# travail, et la reprise se fait par simple lecture de l'identifiant.
+#
+# Écriture différée : enregistrer() dépose un instantané dans une table
+# d'attente en mémoire (le plus récent remplace le précédent pour un même
+# élève) et rend la main tout de suite. Un thread d'écriture unique vide
+# cette table par lots, en une transaction, toutes les DELAI_ECRITURE
+# secondes. Un seul écrivain et le mode WAL : une classe entière qui écrit
+# en même temps ne se dispute pas le verrou de la base, et les lectures de
+# reprise ne sont jamais bloquées par les écritures.
+
+import atexit
+import re
+import secrets
+import sqlite3
+import threading
+import time
+
+import streamlit as st
+
+from sauvegarde import decoder_etat, encoder_etat
+
+CHEMIN_DEFAUT = "sessions_agora.sqlite3"
+DELAI_ECRITURE = 2.0  # secondes entre deux lots
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    app TEXT NOT NULL,
+    identifiant TEXT NOT NULL,
+    maj REAL NOT NULL,
+    donnees TEXT NOT NULL,
+    PRIMARY KEY (app, identifiant)
+)
+"""
+
+
+class MagasinSessions:
+    def __init__(self, chemin=CHEMIN_DEFAUT, delai=DELAI_ECRITURE):
+        self.chemin = chemin
+        self.delai = delai
+        self._cond = threading.Condition()
+        self._en_attente = {}  # (app, identifiant) -> (maj, etat)
+        self._en_cours = {}    # lot en train d'être écrit
+        self._local = threading.local()
+        self._fin = False
+        self.ecritures = 0
+        self.lots = 0
+        self.fusionnees = 0
+        self.erreurs = 0
+        self._connexion().execute(SCHEMA)
+        self._thread = threading.Thread(target=self._boucle, name="ecriture-sessions", daemon=True)
+        self._thread.start()
+        atexit.register(self.fermer)
+
+    def _connexion(self):
+        # Une connexion par thread (lecteurs de session, écrivain)
+        connexion = getattr(self._local, "connexion", None)
+        if connexion is None:
+            connexion = sqlite3.connect(self.chemin, timeout=30, check_same_thread=False)
+            connexion.execute("PRAGMA journal_mode=WAL")
+            connexion.execute("PRAGMA synchronous=NORMAL")
+            self._local.connexion = connexion
+        return connexion
+
+    def enregistrer(self, app: str, identifiant: str, etat: dict):
+        """Ne touche pas au disque : l'instantané part au prochain lot."""
+        with self._cond:
+            if (app, identifiant) in self._en_attente:
+                self.fusionnees += 1
+            self._en_attente[(app, identifiant)] = (time.time(), etat)
+
+    def reprendre(self, app: str, identifiant: str):
+        """Dernier état connu de l'élève, ou None."""
+        with self._cond:
+            attente = self._en_attente.get((app, identifiant)) or self._en_cours.get((app, identifiant))
+        if attente is not None:
+            return decoder_etat(encoder_etat(attente[1]))
+        ligne = self._connexion().execute(
+            "SELECT donnees FROM sessions WHERE app = ? AND identifiant = ?", (app, identifiant)
+        ).fetchone()
+        return decoder_etat(ligne[0]) if ligne else None
+
+    def _boucle(self):
+        while True:
+            with self._cond:
+                if not self._fin:
+                    self._cond.wait(self.delai)
+                fin = self._fin
+                self._en_cours, self._en_attente = self._en_attente, {}
+            if self._en_cours:
+                self._ecrire(self._en_cours)
+                with self._cond:
+                    self._en_cours = {}
+            if fin:
+                return
+
+    def _ecrire(self, lot):
+        lignes = []
+        for (app, identifiant), (maj, etat) in lot.items():
+            try:
+                lignes.append((app, identifiant, maj, encoder_etat(etat)))
+            except Exception:
+                self.erreurs += 1
+        try:
+            connexion = self._connexion()
+            with connexion:
+                connexion.executemany(
+                    "INSERT INTO sessions (app, identifiant, maj, donnees) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (app, identifiant) DO UPDATE SET maj = excluded.maj, donnees = excluded.donnees",
+                    lignes,
+                )
+            self.ecritures += len(lignes)
+            self.lots += 1
+        except sqlite3.Error:
+            self.erreurs += 1
+
+    def fermer(self):
+        # Arrêt du serveur : le dernier lot est écrit avant de sortir
+        with self._cond:
+            self._fin = True
+            self._cond.notify_all()
+        self._thread.join(timeout=10)
+
+    def stats(self):
+        with self._cond:
+            en_attente = len(self._en_attente) + len(self._en_cours)
+        return {
+            "en_attente": en_attente,
+            "ecritures": self.ecritures,
+            "lots": self.lots,
+            "fusionnees": self.fusionnees,
+            "erreurs": self.erreurs,
+        }
+
+
+@st.cache_resource
+def get_magasin():
+    return MagasinSessions(st.secrets.get("base_sessions", CHEMIN_DEFAUT))
+
+
+# --- IDENTIFIANT DE SÉANCE ---
+# Un prénom ne suffit pas : deux élèves de la classe peuvent avoir le même.
+# Chaque navigateur reçoit un code de reprise aléatoire, gardé dans l'URL
+# (paramètre `code`, il survit au rechargement de la page) et affiché à
+# l'élève. La séance est enregistrée sous prénom + code : deux homonymes ne
+# s'écrasent plus, et reprendre sur un autre poste demande de saisir son
+# code en plus de son prénom.
+
+PARAM_CODE = "code"
+ALPHABET_CODE = "ABCDEFGHJKMNPQRSTUVWXYZ23456789"  # sans 0/O ni 1/I/L
+LONGUEUR_CODE = 6
+RE_CODE = re.compile(f"[{ALPHABET_CODE}]{{{LONGUEUR_CODE}}}")
+
+
+def nouveau_code() -> str:
+    return "".join(secrets.choice(ALPHABET_CODE) for _ in range(LONGUEUR_CODE))
+
+
+def _normaliser_code(code) -> str:
+    code = (code or "").strip().upper()
+    return code if RE_CODE.fullmatch(code) else ""
+
+
+def champ_code_reprise():
+    """Champ « Code de reprise » : pré-rempli avec le code du navigateur,
+    modifiable pour reprendre une séance commencée ailleurs."""
+    if "code_reprise" not in st.session_state:
+        st.session_state.code_reprise = _normaliser_code(st.query_params.get(PARAM_CODE)) or nouveau_code()
+    st.text_input(
+        "Code de reprise", key="code_reprise", max_chars=LONGUEUR_CODE,
+        help="Note-le : avec ton prénom, il permet de reprendre ta séance sur un autre poste.",
+    )
+    code = _normaliser_code(st.session_state.code_reprise)
+    if code:
+        st.query_params[PARAM_CODE] = code
+    else:
+        st.caption(f"⚠️ Code invalide ({LONGUEUR_CODE} caractères) : séance non enregistrée.")
+
+
+def identifiant_seance(nom: str) -> str:
+    """Clé de la séance dans le magasin (prénom + code de reprise), vide
+    tant que l'un des deux manque."""
+    nom = " ".join((nom or "").split()).casefold()
+    code = _normaliser_code(st.session_state.get("code_reprise"))
+    return f"{nom}#{code}" if nom and code else ""
+
+
+# --- AIDES POUR LES APPLICATIONS ---
+
+def autosauvegarder(app: str, identifiant: str, version, etat):
+    """Envoie `etat()` au magasin si `version` a changé depuis le dernier envoi
+    de cette session. `etat` n'est appelé que dans ce cas."""
+    if not identifiant:
+        return
+    cle = (app, identifiant, version)
+    if st.session_state.get("autosauvegarde_version") == cle:
+        return
+    get_magasin().enregistrer(app, identifiant, etat())
+    st.session_state.autosauvegarde_version = cle
+
+
+def seance_enregistree(app: str, identifiant: str, vide=True):
+    """Séance enregistrée pour cet identifiant, proposée à la reprise tant
+    que la séance en cours est `vide` : une seule lecture par identifiant
+    saisi, gardée en session. Une fois la séance commencée, plus aucune
+    lecture (ni décodage) sur le chemin du chat."""
+    if not vide:
+        # Relue au prochain retour à une séance vide (reset), à jour
+        st.session_state.reprise_cle = None
+        st.session_state.reprise_etat = None
+        return None
+    cle = (app, identifiant)
+    if st.session_state.get("reprise_cle") != cle:
+        st.session_state.reprise_cle = cle
+        st.session_state.reprise_etat = get_magasin().reprendre(app, identifiant) if identifiant else None
+    return st.session_state.reprise_etat
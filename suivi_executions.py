@@ -0,0 +1,29 @@
+# --- SUIVI DES EXÉCUTIONS ---
+# Compte, pour chaque tour de chat, combien de fois Streamlit a relancé le
+# script complet et combien de fois un fragment seul. Sert à vérifier que
+# les fragments évitent bien les relances complètes (sidebar, en-tête, PGI,
+# historique) : avant eux, un tour coûtait deux exécutions complètes.
+
+import streamlit as st
+
+
+def _compteur():
+    if "executions" not in st.session_state:
+        st.session_state.executions = {"script": 0, "fragment": 0}
+    return st.session_state.executions
+
+
+def compter_execution(nature="script"):
+    # "script" en tête de page, "fragment" en tête de chaque fragment
+    # (un fragment tourne aussi lors d'une exécution complète)
+    _compteur()[nature] += 1
+
+
+def clore_tour():
+    """Fige le compte du tour qui vient de se terminer et repart de zéro."""
+    st.session_state.executions_tour = dict(_compteur())
+    st.session_state.executions = {"script": 0, "fragment": 0}
+
+
+def executions_dernier_tour():
+    return st.session_state.get("executions_tour")
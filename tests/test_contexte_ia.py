@@ -0,0 +1,103 @@
+import threading
+
+from contexte_ia import (
+    LONGUEUR_MAX_RESUME, construire_contexte, nouvel_etat_resume, resume_extractif,
+    tokens_messages,
+)
+
+RESUME_IA = "RÉSUMÉ IA : mission devis, fournisseur Martin, 3 erreurs relevées."
+
+
+def echanges(n, taille=400):
+    messages = [{"role": "assistant", "content": "Mission : préparer un devis. " * 10}]
+    for i in range(n):
+        messages.append({"role": "user", "content": f"réponse {i} " + "u" * taille})
+        messages.append({"role": "assistant", "content": f"consigne {i} " + "a" * taille})
+    return messages
+
+
+def attendre_resume(etat):
+    if etat["travail"] is not None:
+        etat["travail"]["futur"].result(timeout=5)
+
+
+def test_contexte_tient_dans_le_budget_et_garde_les_messages_epingles():
+    etat = nouvel_etat_resume()
+    messages = echanges(0) + [{"role": "user", "content": "Choix du dossier : B"}]
+    messages.append({"role": "assistant", "content": "Brief de mission : relancer trois clients."})
+    for i in range(60):
+        messages += echanges(1)[1:]
+        contexte = construire_contexte("Consignes.", messages, etat, budget=1500, n_epingles=3)
+        assert tokens_messages(contexte) <= 1500
+        assert contexte[0] == {"role": "system", "content": "Consignes."}
+        assert contexte[1:4] == messages[:3]
+        # La réponse la plus récente est toujours envoyée telle quelle
+        assert contexte[-1] == messages[-1]
+    # Les échanges sortis de la fenêtre sont résumés juste après les épinglés
+    assert contexte[4]["role"] == "system"
+    assert contexte[4]["content"].startswith("RÉSUMÉ DES ÉCHANGES PRÉCÉDENTS :")
+
+
+def test_resume_ia_integre_au_contexte_une_fois_rendu():
+    def resumer(resume, messages):
+        return RESUME_IA
+
+    etat = nouvel_etat_resume()
+    messages = echanges(0)
+    for i in range(15):
+        messages += echanges(1)[1:]
+        contexte = construire_contexte("Consignes.", messages, etat, resumer=resumer, budget=1500)
+    # Résumé de suivi éventuel compris : plus rien en cours
+    while etat["travail"] is not None:
+        attendre_resume(etat)
+        contexte = construire_contexte("Consignes.", messages, etat, resumer=resumer, budget=1500)
+    resumes = [m for m in contexte if m["content"].startswith("RÉSUMÉ DES ÉCHANGES PRÉCÉDENTS :")]
+    assert resumes == [{"role": "system", "content": f"RÉSUMÉ DES ÉCHANGES PRÉCÉDENTS :\n{RESUME_IA}"}]
+    assert tokens_messages(contexte) <= 1500
+
+
+def test_resume_extractif_garde_le_resume_et_coupe_les_plus_anciennes_lignes():
+    messages = [{"role": "user", "content": f"message {i} " + "u" * 300} for i in range(50)]
+    texte = resume_extractif(RESUME_IA, messages)
+    assert texte.startswith(RESUME_IA + "\n")
+    assert len(texte) <= LONGUEUR_MAX_RESUME
+    lignes = texte.split("\n")[1:]
+    # Lignes entières, les plus récentes gardées
+    assert all(ligne.startswith("- user : message ") for ligne in lignes)
+    assert lignes[-1].startswith("- user : message 49 ")
+
+
+def test_resume_ia_survit_a_une_longue_suite_de_messages_sortis():
+    # Premier résumé rendu tout de suite, le suivant reste bloqué pendant
+    # que les échanges continuent de sortir de la fenêtre
+    libere = threading.Event()
+    appels = []
+
+    def resumer(resume, messages):
+        appels.append(len(messages))
+        if len(appels) > 1:
+            libere.wait(5)
+        return f"{RESUME_IA} (appel {len(appels)})"
+
+    etat = nouvel_etat_resume()
+    messages = echanges(0)
+    premier_rendu = False
+    for i in range(40):
+        messages += echanges(1)[1:]
+        construire_contexte("Consignes.", messages, etat, resumer=resumer, budget=1500)
+        if etat["travail"] is not None and not premier_rendu:
+            attendre_resume(etat)
+            premier_rendu = True
+    assert etat["texte"].startswith(f"{RESUME_IA} (appel 1)\n")
+    assert len(etat["texte"]) <= LONGUEUR_MAX_RESUME
+
+    # Le résumé bloqué arrive : il devient la base, et un résumé de suivi
+    # couvre ce qui est sorti pendant son calcul
+    libere.set()
+    attendre_resume(etat)
+    construire_contexte("Consignes.", messages, etat, resumer=resumer, budget=1500)
+    assert etat["texte"].startswith(f"{RESUME_IA} (appel 2)")
+    attendre_resume(etat)
+    construire_contexte("Consignes.", messages, etat, resumer=resumer, budget=1500)
+    assert etat["texte"] == f"{RESUME_IA} (appel 3)"
+    assert etat["base_jusqua"] == etat["jusqua"]
@@ -0,0 +1,104 @@
+from types import SimpleNamespace
+
+import pytest
+
+import ia_routeur
+from ia_routeur import (
+    COOLDOWN_CLE_INVALIDE, COOLDOWN_MAX, COOLDOWN_RATE_LIMIT, COOLDOWN_SERVEUR, SEUIL_ECHECS_SERVEUR,
+    RouteurGroq,
+)
+
+CLES = ["gsk_a", "gsk_b"]
+MODELES = ["modele-1", "modele-2"]
+
+
+class ErreurGroq(Exception):
+    def __init__(self, status_code, retry_after=None):
+        super().__init__(status_code)
+        self.status_code = status_code
+        headers = {} if retry_after is None else {"retry-after": str(retry_after)}
+        self.response = SimpleNamespace(headers=headers)
+
+
+@pytest.fixture
+def horloge(monkeypatch):
+    temps = SimpleNamespace(maintenant=1000.0)
+    monkeypatch.setattr(ia_routeur, "time", SimpleNamespace(monotonic=lambda: temps.maintenant))
+    return temps
+
+
+def echouer(routeur, exc, key="gsk_a", model="modele-1"):
+    routeur.debut(key, model)
+    routeur.echec(key, model, exc)
+
+
+def test_429_refroidit_la_paire_avec_un_delai_croissant(horloge):
+    routeur = RouteurGroq()
+    echouer(routeur, ErreurGroq(429))
+    assert routeur.ouvert("gsk_a", "modele-1")
+    assert not routeur.ouvert("gsk_b", "modele-1")
+    # La paire refroidie n'est plus essayée qu'en dernier
+    assert routeur.ordre(CLES, MODELES)[-1] == ("gsk_a", "modele-1")
+
+    horloge.maintenant += COOLDOWN_RATE_LIMIT + 1
+    assert not routeur.ouvert("gsk_a", "modele-1")
+
+    # Deuxième 429 d'affilée : refroidissement doublé
+    echouer(routeur, ErreurGroq(429))
+    horloge.maintenant += COOLDOWN_RATE_LIMIT + 1
+    assert routeur.ouvert("gsk_a", "modele-1")
+    horloge.maintenant += COOLDOWN_RATE_LIMIT
+    assert not routeur.ouvert("gsk_a", "modele-1")
+
+
+def test_429_respecte_retry_after(horloge):
+    routeur = RouteurGroq()
+    echouer(routeur, ErreurGroq(429, retry_after=5))
+    horloge.maintenant += 4
+    assert routeur.ouvert("gsk_a", "modele-1")
+    horloge.maintenant += 2
+    assert not routeur.ouvert("gsk_a", "modele-1")
+
+
+def test_disjoncteur_5xx_s_ouvre_au_seuil_puis_se_referme_sur_un_succes(horloge):
+    routeur = RouteurGroq()
+    for _ in range(SEUIL_ECHECS_SERVEUR - 1):
+        echouer(routeur, ErreurGroq(500))
+    assert not routeur.ouvert("gsk_a", "modele-1")
+
+    echouer(routeur, ErreurGroq(500))
+    assert routeur.ouvert("gsk_a", "modele-1")
+    horloge.maintenant += COOLDOWN_SERVEUR + 1
+    assert not routeur.ouvert("gsk_a", "modele-1")
+
+    # Demi-ouverture : un nouvel échec rouvre pour deux fois plus longtemps
+    echouer(routeur, ErreurGroq(500))
+    horloge.maintenant += COOLDOWN_SERVEUR + 1
+    assert routeur.ouvert("gsk_a", "modele-1")
+    horloge.maintenant += COOLDOWN_SERVEUR
+
+    # Un succès referme et remet le compte d'échecs à zéro
+    routeur.debut("gsk_a", "modele-1")
+    routeur.succes("gsk_a", "modele-1", 0.5)
+    echouer(routeur, ErreurGroq(500))
+    assert not routeur.ouvert("gsk_a", "modele-1")
+
+
+def test_refroidissement_plafonne(horloge):
+    routeur = RouteurGroq()
+    for _ in range(20):
+        echouer(routeur, ErreurGroq(429))
+    horloge.maintenant += COOLDOWN_MAX - 1
+    assert routeur.ouvert("gsk_a", "modele-1")
+    horloge.maintenant += 2
+    assert not routeur.ouvert("gsk_a", "modele-1")
+
+
+def test_cle_invalide_coupe_la_cle_pour_tous_les_modeles(horloge):
+    routeur = RouteurGroq()
+    echouer(routeur, ErreurGroq(401))
+    assert routeur.ouvert("gsk_a", "modele-1")
+    assert routeur.ouvert("gsk_a", "modele-2")
+    assert routeur.ordre(CLES, MODELES)[:2] == [("gsk_b", "modele-1"), ("gsk_b", "modele-2")]
+    horloge.maintenant += COOLDOWN_CLE_INVALIDE + 1
+    assert not routeur.ouvert("gsk_a", "modele-2")
@@ -0,0 +1,34 @@
+from datetime import date
+
+import pandas as pd
+import pytest
+
+from requetes_pgi import IndexPGI
+
+PGI_TEXTE = pd.DataFrame({
+    "Quantité": ["9", "10", "2", "100"],
+    "Échéance": ["03/02/2024", "15/01/2024", "01/12/2023", "20/02/2024"],
+    "Client": ["Martin", "Durand", "Leroy", "Petit"],
+})
+
+
+def test_nombres_en_texte_tries_et_filtres_comme_des_nombres():
+    index = IndexPGI(PGI_TEXTE)
+    assert index.nature("Quantité") == "intervalle"
+    resultat, _ = index.executer({"Quantité": (5, 50)}, tri="Quantité")
+    # En texte, "10" passerait avant "9" et "100" entrerait dans l'intervalle
+    assert resultat["Quantité"].tolist() == ["9", "10"]
+
+
+def test_dates_en_texte_tries_et_filtrees_comme_des_dates():
+    index = IndexPGI(PGI_TEXTE)
+    assert index.nature("Échéance") == "intervalle"
+    resultat, _ = index.executer({"Échéance": (date(2024, 1, 1), date(2024, 2, 3))}, tri="Échéance")
+    assert resultat["Échéance"].tolist() == ["15/01/2024", "03/02/2024"]
+
+
+def test_intervalle_refuse_sur_une_colonne_de_texte():
+    index = IndexPGI(PGI_TEXTE)
+    assert index.nature("Client") == "texte"
+    with pytest.raises(ValueError):
+        index.executer({"Client": ("Durand", "Martin")})